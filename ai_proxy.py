@@ -0,0 +1,194 @@
+"""Server-side proxy for the AI help backend (ai-backend-template's /ask).
+
+Browsers used to post their questions straight to the backend that
+/ai-url names, each over its own cold connection. AiProxy posts them from
+here instead:
+
+- over kept-alive connections (ConnectionPool, stdlib http.client), a
+  few per backend host, reopened once if the backend closed an idle one;
+- answers are cached (caching.AnalysisCache with a time to live)
+  under the normalised question and the game fields the backend puts in
+  its prompt, so "Hvad er trumf?" and "hvad er trumf" share one answer;
+- identical questions already on their way to the backend wait for that
+  answer instead of asking again.
+
+Only the configured backend is ever contacted; the browser cannot pick
+the URL. The caller decides who may reach the backend how often (app.py
+limits per room).
+"""
+from __future__ import annotations
+
+import http.client
+import json
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+from urllib.parse import urlsplit
+
+from caching import AnalysisCache
+
+MAX_QUESTION_CHARS = 500  # as the backend checks
+# game fields the backend's prompt uses; answers differ only by these
+PROMPT_FIELDS = ("phase", "myTurn", "leadSuit", "players")
+
+LIMITED_BODY = json.dumps({"error": "For mange spørgsmål – prøv igen om lidt"}).encode("utf-8")
+
+_SPACE = re.compile(r"\s+")
+
+
+class BackendError(Exception):
+    pass
+
+
+def normalise_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question).casefold()
+    return _SPACE.sub(" ", text).strip(" ?!.,;:")
+
+
+class ConnectionPool:
+    """Idle keep-alive connections per (scheme, host, port)."""
+
+    def __init__(self, per_host: int = 8, timeout: float = 60.0):
+        self.per_host = per_host
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self, key: Tuple[str, str, int]) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        with self._lock:
+            self.opened += 1
+        return cls(host, port, timeout=self.timeout)
+
+    def post(self, url: str, body: bytes) -> Tuple[int, bytes]:
+        """POST JSON body to url; (status, response body)."""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise BackendError(f"bad backend url {url!r}")
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+            if conn is not None:
+                self.reused += 1
+        for attempt in range(2):
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect(key)
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                conn = None
+                if reused and attempt == 0:
+                    continue  # the backend closed it while idle
+                raise BackendError(str(e) or type(e).__name__) from e
+            if resp.will_close:
+                conn.close()
+            else:
+                with self._lock:
+                    idle = self._idle.setdefault(key, [])
+                    if len(idle) < self.per_host:
+                        idle.append(conn)
+                        conn = None
+                if conn is not None:
+                    conn.close()
+            return resp.status, data
+        raise BackendError("unreachable")
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class AiProxy:
+    def __init__(self, backend_url: Callable[[], str], pool: ConnectionPool, cache: AnalysisCache):
+        self.backend_url = backend_url
+        self.pool = pool
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._counts = {"asked": 0, "coalesced": 0, "limited": 0, "backend": 0, "errors": 0, "backendMs": 0.0}
+
+    @staticmethod
+    def key(base: str, question: str, game: Dict[str, Any]) -> Tuple:
+        return (base, normalise_question(question), *(json.dumps(game.get(f)) for f in PROMPT_FIELDS))
+
+    def ask(self, question: str, game: Dict[str, Any],
+            admit: Callable[[], bool] = lambda: True) -> Tuple[int, bytes, str]:
+        """(status, JSON body, "hit" | "miss" | "coalesced" | "limited") for a
+        question the caller has validated. admit() is asked before the
+        question goes to the backend itself (a rate limit); when it says no
+        the answer is a 429. Raises BackendError when no answer came."""
+        base = self.backend_url()
+        if not base:
+            raise BackendError("no AI url configured")
+        key = self.key(base, question, game)
+        with self._lock:
+            self._counts["asked"] += 1
+        cached = self.cache.get(key)
+        if cached is not None:
+            return 200, cached, "hit"
+        with self._lock:
+            waiting = key in self._inflight
+        if not waiting and not admit():
+            with self._lock:
+                self._counts["limited"] += 1
+            return 429, LIMITED_BODY, "limited"
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+            else:
+                self._counts["coalesced"] += 1
+        if not leader:
+            status, body = fut.result(timeout=self.pool.timeout * 2)
+            return status, body, "coalesced"
+        try:
+            payload = json.dumps({"question": question, "game": game}).encode("utf-8")
+            t0 = time.perf_counter()
+            try:
+                status, body = self.pool.post(base.rstrip("/") + "/ask", payload)
+            finally:
+                with self._lock:
+                    self._counts["backend"] += 1
+                    self._counts["backendMs"] += (time.perf_counter() - t0) * 1000
+            if status == 200:
+                self.cache.put(key, body)
+            fut.set_result((status, body))
+            return status, body, "miss"
+        except BaseException as e:
+            with self._lock:
+                self._counts["errors"] += 1
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counts)
+            inflight = len(self._inflight)
+        backend_ms = c.pop("backendMs")
+        return dict(
+            c,
+            inflight=inflight,
+            backendMsAvg=round(backend_ms / c["backend"], 1) if c["backend"] else None,
+            cache=self.cache.stats(),
+            connections={"opened": self.pool.opened, "reused": self.pool.reused},
+        )
@@ -1,66 +1,330 @@
 from __future__ import annotations
 
+import gc
+import json
 import os
-import random
+import platform
 import time
 import re
-from typing import Any, Dict, List, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
-from flask import Flask, send_from_directory, request, abort, jsonify
+from flask import Flask, Response, send_from_directory, request, abort, jsonify
 from flask_socketio import SocketIO, join_room, leave_room, emit
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from ai_proxy import MAX_QUESTION_CHARS, AiProxy, BackendError, ConnectionPool
+from caching import AnalysisCache, RateLimiter
+from config_store import ConfigStore
+from help_search import HelpIndex
+from online_bots import BOT_LEVELS, BotBatcher, BotPool, bot_view, hint
+from online_cards import card_from_key, card_to_wire, is_legal
+import online_engine
+from online_solver import analyse_round
+from online_timers import TimerScheduler
+from online_state import NO_BID, OnlineClient, OnlineGameState, OnlineRoom, public_delta
+from room_backend import BackendManager, make_backend
+from room_codes import RoomCodeAllocator
+from room_lifecycle import RoomLifecycle
+from room_snapshots import SnapshotLog
+from static_assets import AssetCache
 
 # --- App setup ---
 app = Flask(__name__, static_folder=".", static_url_path="")
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "piratwhist-secret")
 ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Behind TRUSTED_PROXIES reverse proxies (Render has 1), request.remote_addr
+# is the client's address from X-Forwarded-For, not the proxy's, e.g. for
+# the per-address limit of /ai/ask. Left at 0 the header is ignored, since
+# clients could otherwise set it themselves.
+TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", "0"))
+if TRUSTED_PROXIES > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+# Static files are served from memory (see static_assets); ASSET_CACHE=0
+# sends them from disk on every request instead, e.g. while editing them.
+# ASSET_BUNDLES=0 keeps each page's scripts and stylesheets separate.
+ASSETS = (AssetCache(app.root_path, bundle=os.environ.get("ASSET_BUNDLES", "1") != "0")
+          if os.environ.get("ASSET_CACHE", "1") != "0" else None)
+if ASSETS is not None:
+    ASSETS.scan()
+
+def _send_asset(path: str):
+    resp = ASSETS.response(path) if ASSETS is not None else None
+    return resp if resp is not None else send_from_directory(".", path)
+
+# Flask's own static route (static_folder=".") matches every path before
+# static_files does; answer it from the asset cache too.
+def _static_asset(filename: str):
+    return _send_asset(filename)
+
+app.view_functions["static"] = _static_asset
 
 # --- Global AI URL (shared for all players) ---
 _AI_URL_FILE = os.path.join(os.path.dirname(__file__), "global_ai_url.json")
-
-def _load_global_ai_url() -> str:
-    try:
-        import json
-        with open(_AI_URL_FILE, "r", encoding="utf-8") as f:
-            j = json.load(f)
-        return str(j.get("aiUrl", "")).strip()
-    except Exception:
-        return ""
-
-def _save_global_ai_url(url: str) -> None:
-    try:
-        import json
-        with open(_AI_URL_FILE, "w", encoding="utf-8") as f:
-            json.dump({"aiUrl": url, "updatedAt": time.time()}, f)
-    except Exception:
-        pass
+# Read on every page load (global_ai.js): served from memory, reloaded when
+# the file changes (e.g. set by another worker).
+AI_URL_CONFIG = ConfigStore(_AI_URL_FILE, {"aiUrl": "", "updatedAt": 0})
+# POST /ai/ask asks that backend for the browser (see ai_proxy). Answers are
+# kept AI_CACHE_TTL_SECONDS; questions that miss the cache may reach the
+# backend 5 times at once per room (and per address), then once every
+# AI_ROOM_INTERVAL_SECONDS.
+AI_PROXY = AiProxy(
+    lambda: AI_URL_CONFIG.get()["aiUrl"],
+    ConnectionPool(timeout=float(os.environ.get("AI_TIMEOUT_SECONDS", "60"))),
+    AnalysisCache(max_entries=1000, ttl=float(os.environ.get("AI_CACHE_TTL_SECONDS", "3600"))),
+)
+AI_ASK_LIMIT = RateLimiter(float(os.environ.get("AI_ROOM_INTERVAL_SECONDS", "3")), burst=5)
+# Rules and UI help the AI backend answers from, searchable here too
+# (GET /help/search), also when no backend is reachable.
+HELP_INDEX = HelpIndex.from_file(
+    os.path.join(os.path.dirname(__file__), "ai-backend-template", "knowledge", "piratwhist_knowledge.json"))
 
 
 # IMPORTANT (Render + Python 3.13):
 # eventlet currently breaks on Python 3.13 (threading API change).
-# We run Socket.IO in "threading" mode (long-polling; works reliably).
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
-
-# --- In-memory room state (resets on redeploy) ---
+# We run Socket.IO in "threading" mode. With simple-websocket installed the
+# threading server upgrades connections to WebSocket (one thread per open
+# socket, hence the many gunicorn threads in the Procfile).
+# SOCKETIO_MODE=polling turns the upgrade off (long-polling only).
+SOCKETIO_MODE = os.environ.get("SOCKETIO_MODE", "websocket").strip().lower()
+_SOCKETIO_TRANSPORTS = ["polling"] if SOCKETIO_MODE == "polling" else ["polling", "websocket"]
+
+# Several workers (gunicorn -w N) split the rooms through a shared backend:
+# ROOM_BACKEND=memory (default, one worker), sqlite:///rooms.db (one host)
+# or redis://host:port/0. Emits reach sockets on other workers through
+# SOCKETIO_MESSAGE_QUEUE if set, else through the backend's own bus.
+ROOM_BACKEND = make_backend(os.environ.get("ROOM_BACKEND", "memory"))
+_socketio_queue: Dict[str, Any] = {}
+if os.environ.get("SOCKETIO_MESSAGE_QUEUE"):
+    _socketio_queue["message_queue"] = os.environ["SOCKETIO_MESSAGE_QUEUE"]
+elif ROOM_BACKEND.shared:
+    _socketio_queue["client_manager"] = BackendManager(ROOM_BACKEND)
+# Each long-polling request is a new HTTP request, which without sticky
+# sessions can land on a worker that does not hold the session. So a shared
+# backend accepts WebSocket only (the clients try it first), unless the load
+# balancer pins clients to a worker (STICKY_SESSIONS=1).
+if ROOM_BACKEND.shared and os.environ.get("STICKY_SESSIONS", "0") != "1":
+    if SOCKETIO_MODE == "polling":
+        raise ValueError("SOCKETIO_MODE=polling with a shared ROOM_BACKEND needs STICKY_SESSIONS=1")
+    _SOCKETIO_TRANSPORTS = ["websocket"]
+socketio = SocketIO(
+    app, cors_allowed_origins="*", async_mode="threading", transports=_SOCKETIO_TRANSPORTS, **_socketio_queue
+)
+
+# --- In-memory room state (resets on redeploy unless snapshotted) ---
 rooms: Dict[str, Dict[str, Any]] = {}
+# Warm restart: with SNAPSHOT_PATH set, rooms are logged to that file after
+# every change and restored (timers re-armed) at startup. One worker only:
+# with a shared ROOM_BACKEND each worker would need a log of its own.
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "")
+SNAPSHOTS = SnapshotLog(SNAPSHOT_PATH) if SNAPSHOT_PATH and not ROOM_BACKEND.shared else None
+ROOM_TTL_SECONDS = int(os.environ.get("ROOM_TTL_SECONDS", "21600"))  # scorecard rooms nobody is in
 
+# Expiry/eviction for both `rooms` and ONLINE_ROOMS (kinds "score" and "online").
+# MAX_ROOMS caps the two together; idle rooms are evicted LRU-first.
+ROOM_LIFECYCLE = RoomLifecycle(max_rooms=int(os.environ.get("MAX_ROOMS", "5000")))
 
+# Room codes: 6 characters for scorecard rooms, 4 digits for online rooms.
+# ONLINE_CODE_MAX_LENGTH > 4 lets online codes grow a digit when all are taken.
+SCORE_CODES = RoomCodeAllocator("ABCDEFGHJKLMNPQRSTUVWXYZ23456789", 6)  # avoid confusing chars
+ONLINE_CODES = RoomCodeAllocator("0123456789", 4, max_length=int(os.environ.get("ONLINE_CODE_MAX_LENGTH", "4")))
 
 
 # Online multiplayer rooms for /online.html
-ONLINE_ROOMS: Dict[str, Dict[str, Any]] = {}
+ONLINE_ROOMS: Dict[str, OnlineRoom] = {}
+# All online game timers (deal end, bot moves, auto-advance, takeovers).
+ONLINE_TIMERS = TimerScheduler()
+# Due timers only queue their room command (_online_post); these threads
+# run it, so a slow room or socket never holds up the other rooms' timers.
+ONLINE_TIMER_WORKERS = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ONLINE_TIMER_WORKERS", "8")), thread_name_prefix="room-timer")
+# Bot strength for new rooms (see online_bots.BOT_LEVELS); the host may pick
+# another one. Monte Carlo bots think in BOT_WORKERS processes; 0 keeps
+# every bot basic.
+ONLINE_BOT_LEVEL = os.environ.get("BOT_LEVEL", "normal")
+if ONLINE_BOT_LEVEL not in BOT_LEVELS:
+    ONLINE_BOT_LEVEL = "normal"
+BOT_POOL = BotPool(int(os.environ.get("BOT_WORKERS", str(min(2, os.cpu_count() or 1)))))
+# Moves of all rooms go to the pool in batches, flushed every tick.
+BOT_BATCHER = BotBatcher(BOT_POOL, lambda delay, fn: ONLINE_TIMERS.schedule(("*", "bot-batch"), delay, fn))
+# Hints and round analyses also run in BOT_POOL; answers are cached per
+# position, and a socket may ask 3 times at once, then once every
+# HINT_INTERVAL_SECONDS.
+ONLINE_HINT_BUDGET = 0.3
+ONLINE_ANALYSIS_CACHE = AnalysisCache()
+ONLINE_HINT_LIMIT = RateLimiter(float(os.environ.get("HINT_INTERVAL_SECONDS", "5")), burst=3)
 ONLINE_EMPTY_TTL_SECONDS = 120  # keep empty rooms briefly (redirects/reloads)
+# Where each socket currently sits: sid -> (room code, seat). A stable
+# client is found in its room's clients. Written by room commands of
+# different rooms, hence the lock.
+ONLINE_SIDS: Dict[str, Tuple[str, int]] = {}
+_ONLINE_INDEX_LOCK = threading.Lock()
 
 
-def _online_purge_old_rooms():
-    now = time.time()
-    for code, room in list(ONLINE_ROOMS.items()):
-        empty_since = room.get("emptySince")
-        if empty_since and (now - float(empty_since)) > ONLINE_EMPTY_TTL_SECONDS:
-            ONLINE_ROOMS.pop(code, None)
+def _score_room_idle(code: str) -> bool:
+    # Nobody is connected to the Socket.IO room.
+    return next(iter(socketio.server.manager.get_participants("/", code)), None) is None
+
+def _score_room_evict(code: str) -> None:
+    rooms.pop(code, None)
+    if SNAPSHOTS is not None:
+        SNAPSHOTS.put("score", code, None)
+    _room_release("score", code)
+    SCORE_CODES.release(code)
+
+def _online_room_idle(code: str) -> bool:
+    room = ONLINE_ROOMS.get(code)
+    return room is None or room.empty_since is not None
+
+def _online_room_evict(code: str) -> None:
+    # Called by the lifecycle outside the room's executor: a join may be
+    # queued right now, so the eviction is a room command that looks again.
+    room = ONLINE_ROOMS.get(code)
+    if room is None:
+        _online_room_remove(code)
+    else:
+        _online_submit(room, _online_evict_if_idle)
+
+def _online_evict_if_idle(room: OnlineRoom) -> None:
+    if ONLINE_ROOMS.get(room.code) is not room:
+        return
+    if room.empty_since is None:
+        ROOM_LIFECYCLE.touch("online", room.code)  # joined meanwhile: track it again
+        return
+    _online_room_remove(room.code)
+
+def _online_room_remove(code: str) -> None:
+    ONLINE_ROOMS.pop(code, None)
+    if SNAPSHOTS is not None:
+        SNAPSHOTS.put("online", code, None)
+    ONLINE_TIMERS.cancel_room(code)
+    _room_release("online", code)
+    ONLINE_CODES.release(code)
+
+ROOM_LIFECYCLE.register("score", ROOM_TTL_SECONDS, _score_room_idle, _score_room_evict)
+ROOM_LIFECYCLE.register("online", ONLINE_EMPTY_TTL_SECONDS, _online_room_idle, _online_room_evict)
+
+def _online_index(index: Dict[str, Tuple[str, int]], key: str, code: str, seat: int) -> Optional[Tuple[str, int]]:
+    """Point key at (code, seat); return the previous entry."""
+    with _ONLINE_INDEX_LOCK:
+        prev = index.get(key)
+        index[key] = (code, seat)
+    return prev
+
+def _online_unindex(index: Dict[str, Tuple[str, int]], key: str, code: str) -> None:
+    """Drop key, unless it has meanwhile moved to another room."""
+    with _ONLINE_INDEX_LOCK:
+        ref = index.get(key)
+        if ref is not None and ref[0] == code:
+            del index[key]
+
+# ---------- Room affinity (multi-worker) ----------
+# Each room is owned by the worker that created it: its state, executor and
+# timers only exist there. An event for a room owned by another worker is
+# forwarded to that worker's inbox channel and handled there as if the
+# socket had sent it directly; replies reach the socket via the message queue.
+_ROOM_EVENTS: Dict[str, Any] = {}  # event -> handler, for forwarded events
+_ROOM_REMOTE_SIDS: set = set()  # sids whose events reach us by forwarding
+_ROOM_FORWARDED: Dict[str, set] = {}  # local sid -> workers it was forwarded to
+_ROOM_FORWARD_LOCK = threading.Lock()
+_ROOM_WORKER = {"pid": 0, "id": ""}
+
+
+def _worker_id() -> str:
+    # Computed after gunicorn forks, so every worker gets its own.
+    if _ROOM_WORKER["pid"] != os.getpid():
+        _ROOM_WORKER["pid"] = os.getpid()
+        _ROOM_WORKER["id"] = f"{platform.node()}:{os.getpid()}"
+        if ROOM_BACKEND.shared:
+            socketio.start_background_task(_room_inbox)
+    return _ROOM_WORKER["id"]
+
+def _room_claim(kind: str, code: str) -> bool:
+    """Register this worker as owner of a new room; False if code is taken elsewhere."""
+    if not ROOM_BACKEND.shared:
+        return True
+    worker = _worker_id()
+    return ROOM_BACKEND.claim(f"{kind}:{code}", worker) == worker
+
+def _room_release(kind: str, code: str) -> None:
+    if ROOM_BACKEND.shared:
+        ROOM_BACKEND.release(f"{kind}:{code}", _worker_id())
+
+def _room_forward(kind: str, event: str, data) -> bool:
+    """Forward event to the worker owning its room; False if it is ours (or unknown)."""
+    code = (data.get("room") or "").strip() if isinstance(data, dict) else ""
+    if kind == "score":
+        code = code.upper()
+    if not code or code in (rooms if kind == "score" else ONLINE_ROOMS):
+        return False
+    owner = ROOM_BACKEND.owner(f"{kind}:{code}")
+    if owner is None or owner == _worker_id():
+        return False
+    with _ROOM_FORWARD_LOCK:
+        _ROOM_FORWARDED.setdefault(request.sid, set()).add(owner)
+    ROOM_BACKEND.publish("rooms:" + owner, json.dumps({"event": event, "sid": request.sid, "data": data}))
+    return True
 
-def _room_code() -> str:
-    alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # avoid confusing chars
-    return "".join(random.choice(alphabet) for _ in range(6))
+def _room_event(kind: str, event: str):
+    """socketio.on(event) for a room event (payload["room"] = code).
+
+    With a shared backend, events for rooms owned by another worker are
+    forwarded there instead of being handled here.
+    """
+    def decorator(fn):
+        _ROOM_EVENTS[event] = fn
+
+        def handler(data):
+            if ROOM_BACKEND.shared and _room_forward(kind, event, data):
+                return
+            return fn(data)
+
+        handler.__name__ = fn.__name__
+        socketio.on(event)(handler)
+        return fn
+    return decorator
+
+def _room_forget_sid(sid: str) -> None:
+    """A local socket disconnected: tell the workers owning its rooms."""
+    with _ROOM_FORWARD_LOCK:
+        owners = _ROOM_FORWARDED.pop(sid, ())
+    for owner in owners:
+        ROOM_BACKEND.publish("rooms:" + owner, json.dumps({"event": "disconnect", "sid": sid}))
+
+def _room_inbox() -> None:
+    """Handle events forwarded to this worker, for as long as it runs.
+
+    The backend reconnects its bus itself; should listening fail anyway the
+    error is logged and the inbox listens again, since a worker without an
+    inbox silently drops every forwarded event.
+    """
+    while True:
+        try:
+            for raw in ROOM_BACKEND.listen("rooms:" + _worker_id()):
+                _room_inbox_handle(raw)
+        except Exception:
+            app.logger.exception("room inbox failed; listening again")
+        time.sleep(1.0)
+
+def _room_inbox_handle(raw: str) -> None:
+    try:
+        msg = json.loads(raw)
+        sid = msg["sid"]
+        if msg["event"] == "disconnect":
+            _ROOM_REMOTE_SIDS.discard(sid)
+            _online_cleanup_sid(sid)
+            return
+        _ROOM_REMOTE_SIDS.add(sid)
+        # Same request context Flask-SocketIO gives a handler, so emit()
+        # and join_room() address the remote socket.
+        with app.test_request_context("/"):
+            request.sid = sid
+            request.namespace = "/"
+            _ROOM_EVENTS[msg["event"]](msg["data"])
+    except Exception:
+        app.logger.exception("forwarded room event failed")
 
 
 def _build_max_by_round(rounds: int) -> List[int]:
@@ -82,7 +346,16 @@ def _default_room_state() -> Dict[str, Any]:
         "data": data,    }
 
 
+def _score_room_persist(room: str) -> None:
+    if SNAPSHOTS is not None:
+        t0 = time.perf_counter_ns()
+        # Handlers mutate the state in place; the writer gets a copy.
+        SNAPSHOTS.put("score", room, json.loads(json.dumps(rooms[room])), t0)
+
+
 def _broadcast_state(room: str) -> None:
+    ROOM_LIFECYCLE.touch("score", room)
+    _score_room_persist(room)
     socketio.emit("state", rooms[room], to=room)
 
 
@@ -95,26 +368,26 @@ def _admin_allowed() -> bool:
 
 @app.get("/")
 def index():
-    return send_from_directory(".", "piratwhist.html")
+    return _send_asset("piratwhist.html")
 
 
 @app.get("/admin")
 def admin_page():
     if not _admin_allowed():
         abort(403)
-    return send_from_directory(".", "admin.html")
+    return _send_asset("admin.html")
 
 @app.get("/online.html")
 def online_page():
-    return send_from_directory(".", "online.html")
+    return _send_asset("online.html")
 
 @app.get("/online.js")
 def online_js():
-    return send_from_directory(".", "online.js")
+    return _send_asset("online.js")
 
 @app.get("/online.css")
 def online_css():
-    return send_from_directory(".", "online.css")
+    return _send_asset("online.css")
 
 
 # -----------------------------
@@ -124,8 +397,52 @@ def online_css():
 # -----------------------------
 @app.get("/ai-url")
 def get_ai_url():
-    url = _load_global_ai_url()
-    return jsonify({"aiUrl": url})
+    body, etag = AI_URL_CONFIG.body()
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+
+@app.post("/ai/ask")
+def ai_ask():
+    data = request.get_json(silent=True) or {}
+    question = data.get("question")
+    game = data.get("game") if isinstance(data.get("game"), dict) else {}
+    if not isinstance(question, str) or not question.strip() or len(question) > MAX_QUESTION_CHARS:
+        return jsonify({"error": "Ugyldigt spørgsmål"}), 400
+    if not AI_URL_CONFIG.get()["aiUrl"]:
+        return jsonify({"error": "AI URL mangler"}), 503
+
+    room = game.get("room")
+    keys = [("addr", request.remote_addr)]
+    if isinstance(room, str) and room.isalnum() and len(room) <= 8:
+        keys.append(("room", room))
+
+    def admit() -> bool:
+        return AI_ASK_LIMIT.allow_all(keys)
+
+    try:
+        status, body, source = AI_PROXY.ask(question, game, admit)
+    except (BackendError, TimeoutError):
+        return jsonify({"error": "AI svarer ikke", "help": HELP_INDEX.search(question, 3)}), 502
+    resp = Response(body, status=status, mimetype="application/json")
+    resp.headers["X-AI-Cache"] = source
+    return resp
+
+
+@app.get("/help/search")
+def search_help():
+    """Best rules/UI sections for ?q= (at most ?k=, default 5)."""
+    query = (request.args.get("q") or "").strip()[:MAX_QUESTION_CHARS]
+    try:
+        k = max(1, min(10, int(request.args.get("k", "5"))))
+    except ValueError:
+        k = 5
+    resp = jsonify({"query": query, "results": HELP_INDEX.search(query, k) if query else []})
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 300
+    return resp
 
 
 @app.post("/set-ai-url")
@@ -149,41 +466,82 @@ def set_ai_url():
     if url and not re.match(r"^https?://", url, flags=re.I):
         abort(400)
 
-    _save_global_ai_url(url)
+    config = AI_URL_CONFIG.update(aiUrl=url, updatedAt=time.time())
+    # Open pages pick it up at once (global_ai.js) instead of asking again.
+    socketio.emit("ai_url", {"aiUrl": url, "updatedAt": config["updatedAt"]})
     return jsonify({"ok": True, "aiUrl": url})
 
+@app.get("/admin/rooms/<code>/journal")
+def admin_room_journal(code):
+    """Seed and command journal of an online room, for online_replay."""
+    if not _admin_allowed():
+        abort(403)
+    room = ONLINE_ROOMS.get(code)
+    if room is None:
+        abort(404)
+    return jsonify({"code": room.code, "seed": room.seed, "startedAt": room.started_at, "journal": list(room.journal)})
+
+
+@app.get("/admin/rooms")
+def admin_rooms():
+    if not _admin_allowed():
+        abort(403)
+    stats = ROOM_LIFECYCLE.stats()
+    stats["codes"] = {"score": SCORE_CODES.stats(), "online": ONLINE_CODES.stats()}
+    stats["snapshots"] = SNAPSHOTS.stats() if SNAPSHOTS is not None else None
+    stats["bots"] = dict(BOT_POOL.stats(), moves=BOT_BATCHER.stats())
+    stats["assets"] = ASSETS.stats() if ASSETS is not None else None
+    stats["analysis"] = dict(ONLINE_ANALYSIS_CACHE.stats(), rateLimited=ONLINE_HINT_LIMIT.refused)
+    stats["aiUrl"] = AI_URL_CONFIG.stats()
+    stats["ai"] = dict(AI_PROXY.stats(), rateLimited=AI_ASK_LIMIT.refused)
+    stats["help"] = HELP_INDEX.stats()
+    return jsonify(stats)
+
+@app.get("/admin/assets")
+def admin_assets():
+    if not _admin_allowed():
+        abort(403)
+    return jsonify(ASSETS.manifest() if ASSETS is not None else None)
+
 @app.get("/<path:path>")
 def static_files(path: str):
     if path.startswith("admin") and not _admin_allowed():
         abort(403)
-    return send_from_directory(".", path)
+    return _send_asset(path)
 
 
 @socketio.on("create_room")
 def on_create_room():
-    room = _room_code()
-    while room in rooms:
-        room = _room_code()
+    ROOM_LIFECYCLE.sweep()
+    room = SCORE_CODES.allocate() if ROOM_LIFECYCLE.make_room() else None
+    while room is not None and not _room_claim("score", room):
+        room = SCORE_CODES.allocate()  # owned by another worker; stays reserved here
+    if room is None:
+        emit("join_error", {"error": "Serveren er fuld. Prøv igen senere."})
+        return
     rooms[room] = _default_room_state()
+    ROOM_LIFECYCLE.touch("score", room)
+    _score_room_persist(room)
 
     join_room(room)
     emit("room_created", {"room": room})
     emit("state", rooms[room])
 
 
-@socketio.on("join_room")
+@_room_event("score", "join_room")
 def on_join_room(payload: Dict[str, Any]):
     room = (payload.get("room") or "").strip().upper()
     if not room or room not in rooms:
         emit("join_error", {"error": "Rum findes ikke (tjek koden)."})
         return
 
+    ROOM_LIFECYCLE.touch("score", room)
     join_room(room)
     emit("join_ok", {"room": room})
     emit("state", rooms[room])
 
 
-@socketio.on("leave_room")
+@_room_event("score", "leave_room")
 def on_leave_room(payload: Dict[str, Any]):
     room = (payload.get("room") or "").strip().upper()
     if room:
@@ -191,7 +549,7 @@ def on_leave_room(payload: Dict[str, Any]):
     emit("left")
 
 
-@socketio.on("reset_room")
+@_room_event("score", "reset_room")
 def on_reset_room(payload: Dict[str, Any]):
     room = (payload.get("room") or "").strip().upper()
     if room not in rooms:
@@ -200,7 +558,7 @@ def on_reset_room(payload: Dict[str, Any]):
     _broadcast_state(room)
 
 
-@socketio.on("set_player_count")
+@_room_event("score", "set_player_count")
 def on_set_player_count(payload: Dict[str, Any]):
     room = (payload.get("room") or "").strip().upper()
     if room not in rooms:
@@ -236,7 +594,7 @@ def on_set_player_count(payload: Dict[str, Any]):
     _broadcast_state(room)
 
 
-@socketio.on("set_rounds")
+@_room_event("score", "set_rounds")
 def on_set_rounds(payload: Dict[str, Any]):
     room = (payload.get("room") or "").strip().upper()
     if room not in rooms:
@@ -262,7 +620,7 @@ def on_set_rounds(payload: Dict[str, Any]):
     _broadcast_state(room)
 
 
-@socketio.on("set_name")
+@_room_event("score", "set_name")
 def on_set_name(payload: Dict[str, Any]):
     room = (payload.get("room") or "").strip().upper()
     if room not in rooms:
@@ -278,7 +636,7 @@ def on_set_name(payload: Dict[str, Any]):
     _broadcast_state(room)
 
 
-@socketio.on("start_game")
+@_room_event("score", "start_game")
 def on_start_game(payload: Dict[str, Any]):
     room = (payload.get("room") or "").strip().upper()
     if room not in rooms:
@@ -288,7 +646,7 @@ def on_start_game(payload: Dict[str, Any]):
     _broadcast_state(room)
 
 
-@socketio.on("set_cell")
+@_room_event("score", "set_cell")
 def on_set_cell(payload: Dict[str, Any]):
     room = (payload.get("room") or "").strip().upper()
     if room not in rooms:
@@ -324,564 +682,379 @@ def on_set_cell(payload: Dict[str, Any]):
 
 
 # ---------- Online game helpers ----------
-ONLINE_SUITS = ["♠", "♥", "♦", "♣"]  # spar is trump
-ONLINE_RANKS = ["2","3","4","5","6","7","8","9","10","J","Q","K","A"]
-ONLINE_RANK_VALUE = {r: i+2 for i, r in enumerate(ONLINE_RANKS)}
-ONLINE_ROUND_CARDS = [7,6,5,4,3,2,1,1,2,3,4,5,6,7]
-
-def _online_room_code() -> str:
-    # 4 digits to keep it simple
-    return f"{random.randint(0, 9999):04d}"
-
-def _online_make_deck():
-    return [{"suit": s, "rank": r} for s in ONLINE_SUITS for r in ONLINE_RANKS]
-
-def _online_card_key(c):
-    return f"{c['rank']}{c['suit']}"
-
-def _online_compare_cards(a, b, lead_suit):
-    # returns 1 if a beats b, -1 if b beats a, 0 if equal
-    a_trump = a["suit"] == "♠"
-    b_trump = b["suit"] == "♠"
-    if a_trump and not b_trump:
-        return 1
-    if not a_trump and b_trump:
-        return -1
-
-    if a["suit"] == b["suit"]:
-        av = ONLINE_RANK_VALUE[a["rank"]]
-        bv = ONLINE_RANK_VALUE[b["rank"]]
-        return (av > bv) - (av < bv)
-
-    a_lead = a["suit"] == lead_suit
-    b_lead = b["suit"] == lead_suit
-    if a_lead and not b_lead:
-        return 1
-    if not a_lead and b_lead:
-        return -1
-
-    # fallback
-    av = ONLINE_RANK_VALUE[a["rank"]]
-    bv = ONLINE_RANK_VALUE[b["rank"]]
-    return (av > bv) - (av < bv)
-
-def _online_deal(n_players, round_index):
-    """Return (hands, cards_per_effective).
-
-    Master rule (52-card deck):
-      cardsPer = min(requestedForRound, floor(52 / nPlayers)) (min 1)
-    """
-    requested = ONLINE_ROUND_CARDS[round_index]
-    cards_per = max(1, min(requested, 52 // max(1, n_players)))
-    needed = cards_per * n_players
-    deck = _online_make_deck()
-    random.shuffle(deck)
-    take = deck[:needed]
-    hands = [[] for _ in range(n_players)]
-    for i, c in enumerate(take):
-        hands[i % n_players].append(c)
-
-    suit_order = {s:i for i,s in enumerate(ONLINE_SUITS)}
-    for h in hands:
-        h.sort(key=lambda c: (suit_order[c["suit"]], ONLINE_RANK_VALUE[c["rank"]]))
-    return hands, cards_per
-
-def _online_points_for_round(bid: int, taken: int) -> int:
-    if bid == taken:
-        return 10 + bid
-    return -abs(taken - bid)
-
-def _online_public_state(room):
-    st = room["state"]
-    # do NOT expose other players' hands
-    return {
-        "n": st["n"],
-        "names": st["names"],
-        "roundIndex": st["roundIndex"],
-        "cardsPer": st.get("cardsPer"),
-        "leader": st["leader"],
-        "turn": st["turn"],
-        "leadSuit": st["leadSuit"],
-        "table": st["table"],
-        "winner": st["winner"],
-        "phase": st["phase"],
-        "bids": st["bids"],
-        "tricksRound": st["tricksRound"],
-        "tricksTotal": st["tricksTotal"],
-        "pointsTotal": st["pointsTotal"],
-        "history": st["history"],
-        "botSeats": sorted(list(st.get("botSeats", set()))),
-        # Deal animation metadata (cards themselves remain private).
-        "dealId": st.get("dealId"),
-        "dealSeq": st.get("dealSeq"),
-        "cardsPer": st.get("cardsPer"),
-    }
-
-
-def _online_start_deal_phase(code: str, room, round_index: int):
-    """Deal server-side immediately, but keep phase='dealing' briefly so
-    clients can play a visible deal animation without bots advancing.
+# The rules live in online_engine; the commands here wrap them with what
+# the server adds: validation of the caller, the journal, broadcasts and
+# timers.
 
-    This keeps the 'server authoritative state' rule intact.
-    """
-    st = room["state"]
-    n = st["n"]
+# online_replay runs commands on the journal's clock instead of the wall clock.
+_ONLINE_REPLAY_CLOCK = threading.local()
 
-    hands, cards_per = _online_deal(n, round_index)
-    st["hands"] = hands
-    st["cardsPer"] = cards_per
+def _online_now() -> float:
+    now = getattr(_ONLINE_REPLAY_CLOCK, "now", None)
+    return time.time() if now is None else now
 
-    # Deterministic seat sequence (card-by-card) for the animation.
-    st["dealId"] = int(st.get("dealId") or 0) + 1
-    st["dealSeq"] = [i % n for i in range(cards_per * n)]
+def _online_journal(room: OnlineRoom, kind: str, *args) -> None:
+    """Record an accepted command; call before it is broadcast (and snapshotted)."""
+    room.journal.append([round((_online_now() - room.started_at) * 1000), kind, *args])
 
-    # Reset round-specific state.
-    st["leader"] = (st["roundIndex"] % st["n"])
-    st["turn"] = st["leader"]
-    st["leadSuit"] = None
-    st["table"] = [None for _ in range(n)]
-    st["winner"] = None
-    st["bids"] = [None for _ in range(n)]
-    st["tricksRound"] = [0 for _ in range(n)]
+def _online_submit(room: OnlineRoom, fn, *args) -> None:
+    """Queue a mutation of room; see online_executor.RoomExecutor."""
+    room.executor.submit(fn, room, *args)
 
-    # Enter dealing phase and schedule a transition into bidding.
-    st["phase"] = "dealing"
 
-    st["lastActionAt"] = time.time()
+def _online_post(room: OnlineRoom, fn, *args) -> None:
+    """_online_submit for the timer thread: the command runs on ONLINE_TIMER_WORKERS."""
+    room.executor.post(ONLINE_TIMER_WORKERS.submit, fn, room, *args)
 
-    # Animation pacing (client mirrors this).
-    per_card_ms = 120
-    duration = max(0.8, min(8.0, (cards_per * n * per_card_ms) / 1000.0 + 0.6))
-    st["dealEndsAt"] = time.time() + duration
-    deal_id = st["dealId"]
-
-    _online_emit_full_state(code, room)
-
-    def _finish():
-        try:
-            socketio.sleep(duration)
-            room2 = ONLINE_ROOMS.get(code)
-            if not room2:
-                return
-            st2 = room2["state"]
-            # Only finish if we're still in the same deal.
-            if st2.get("phase") != "dealing":
-                return
-            if st2.get("dealId") != deal_id:
-                return
 
-            st2["phase"] = "bidding"
+def _online_set_timer(room: OnlineRoom, purpose: str, delay: float, fn, *args) -> None:
+    """Run command fn on room after delay, replacing its pending timer for purpose."""
+    if ONLINE_ROOMS.get(room.code) is not room:
+        return  # evicted while a command was still running
+    ONLINE_TIMERS.schedule((room.code, purpose), delay, _online_post, room, fn, *args)
 
-            st2["lastActionAt"] = time.time()
 
-            _online_bot_choose_bid(room2)
-            if all(b is not None for b in st2["bids"]):
-                st2["phase"] = "playing"
-                st2["turn"] = st2["leader"]
-                st2["lastActionAt"] = time.time()
+def _online_error(sid: str, message: str) -> None:
+    socketio.emit("error", {"message": message}, to=sid)
 
-            _online_emit_full_state(code, room2)
 
-            if st2.get("phase") == "playing" and st2.get("turn") in st2.get("botSeats", set()):
-                _online_schedule_bot_turn(code)
-        except Exception:
-            return
+def _online_start_deal_phase(room: OnlineRoom, round_index: int):
+    """Deal server-side immediately, but keep phase='dealing' briefly so
+    clients can play a visible deal animation without bots advancing.
 
-    socketio.start_background_task(_finish)
-
-
-def _online_bot_choose_bid(room) -> None:
-    st = room["state"]
-    max_bid = int(st.get("cardsPer") or ONLINE_ROUND_CARDS[st["roundIndex"]])
-    for seat in st.get("botSeats", set()):
-        if st["bids"][seat] is not None:
-            continue
-        hand = st["hands"][seat] or []
-        sp = sum(1 for c in hand if c["suit"] == "♠")
-        hi = sum(1 for c in hand if ONLINE_RANK_VALUE[c["rank"]] >= 11)
-        bid = max(0, min(max_bid, int(round((sp * 0.6) + (hi * 0.35)))))
-        st["bids"][seat] = bid
-
-def _online_bot_choose_card(room, seat: int):
-    st = room["state"]
-    hand = st["hands"][seat]
-    if not hand:
-        return None
-    lead = st.get("leadSuit")
-    if lead:
-        same = [c for c in hand if c["suit"] == lead]
-        if same:
-            same.sort(key=lambda c: ONLINE_RANK_VALUE[c["rank"]])
-            return same[0]
-    tr = [c for c in hand if c["suit"] == "♠"]
-    if tr:
-        tr.sort(key=lambda c: ONLINE_RANK_VALUE[c["rank"]])
-        return tr[0]
-    hand.sort(key=lambda c: (c["suit"], ONLINE_RANK_VALUE[c["rank"]]))
-    return hand[0]
-
-def _online_schedule_bot_turn(code: str):
-    def _task():
-        try:
-            socketio.sleep(0.6)
-            room = ONLINE_ROOMS.get(code)
-            if not room:
-                return
-            st = room["state"]
-            if st.get("phase") != "playing":
-                return
-            turn = st.get("turn")
-            if turn is None or turn not in st.get("botSeats", set()):
-                return
-            card = _online_bot_choose_card(room, turn)
-            if not card:
-                return
-            _online_internal_play_card(code, room, turn, _online_card_key(card))
-        except Exception:
-            return
-    room = ONLINE_ROOMS.get(code)
-    if room and room.get('state'):
-        st = room['state']
-        st['botScheduledAt'] = time.time()
-        st['botScheduledTurn'] = st.get('turn')
-    _online_ensure_bot_watchdog(code)
-    socketio.start_background_task(_task)
+    This keeps the 'server authoritative state' rule intact.
+    """
+    st = room.state
+    duration = online_engine.start_round(st, round_index, room.deal_rng(round_index), _online_now())
 
+    _online_broadcast_state(room)
 
+    _online_set_timer(room, "deal", duration, _online_finish_deal, st.deal_id)
 
-def _online_ensure_bot_watchdog(code: str):
-    """Fail-safe: ensures bots don't stall the game if a background task is missed.
 
-    Starts one lightweight watchdog loop per room. It periodically checks whether
-    it is a bot's turn in phase='playing' and no action has occurred recently.
-    If so, it re-schedules the bot turn.
-    """
-    room = ONLINE_ROOMS.get(code)
-    if not room:
+def _online_finish_deal(room: OnlineRoom, deal_id: int):
+    st = room.state
+    # Only finish if we're still in the same deal.
+    if st.phase != "dealing":
         return
-    st = room.get('state', {})
-    if st.get('botWatchdogStarted'):
+    if st.deal_id != deal_id:
         return
-    st['botWatchdogStarted'] = True
+    _online_journal(room, "deal", deal_id)
 
-    def _loop():
-        try:
-            while True:
-                socketio.sleep(1.0)
-                room2 = ONLINE_ROOMS.get(code)
-                if not room2:
-                    return
-                st2 = room2.get('state', {})
-
-                # Stop if game ended.
-                if st2.get('phase') in ('game_finished',):
-                    return
-
-                if st2.get('phase') != 'playing':
-                    continue
-
-                turn = st2.get('turn')
-                bots = st2.get('botSeats', set()) or set()
-                if turn is None or turn not in bots:
-                    continue
-
-                now = time.time()
-                last_action = st2.get('lastActionAt') or now
-                # If nothing has happened for a bit, re-schedule.
-                if now - last_action < 2.5:
-                    continue
-
-                # Avoid scheduling too aggressively.
-                last_sched = st2.get('botScheduledAt') or 0.0
-                if now - last_sched < 2.0 and st2.get('botScheduledTurn') == turn:
-                    continue
-
-                _online_schedule_bot_turn(code)
-        except Exception:
-            return
+    online_engine.finish_deal(st)
 
-    socketio.start_background_task(_loop)
-def _online_schedule_auto_next_trick(code: str, round_index: int):
-    def _task():
-        try:
-            # Wait for the client-side animations to finish before advancing.
-            # In the UI we animate:
-            #  - card flies in: 2s
-            #  - trick sweeps out to winner: 2s
-            # We gate server-side advancement using st["sweepUntil"].
-            socketio.sleep(0.2)
-            room = ONLINE_ROOMS.get(code)
-            if not room:
-                return
-            st = room["state"]
-            if st.get("phase") != "between_tricks":
-                return
-            if st.get("roundIndex") != round_index:
-                return
-            # If a sweep lock is present, do not advance early.
-            sweep_until = st.get("sweepUntil")
-            if sweep_until and time.time() < sweep_until:
-                socketio.sleep(max(0.0, sweep_until - time.time()))
-                # room/state may have changed while sleeping
-                room = ONLINE_ROOMS.get(code)
-                if not room:
-                    return
-                st = room["state"]
-                if st.get("phase") != "between_tricks" or st.get("roundIndex") != round_index:
-                    return
-            # auto-advance only if there are bots
-            if len(st.get("botSeats", set())) == 0:
-                return
+    _online_broadcast_state(room)
+    _online_maybe_schedule_bot_turn(room)
 
-            n = st["n"]
-            st["leader"] = st["winner"]
-            st["turn"] = st["leader"]
-            st["leadSuit"] = None
-            st["table"] = [None for _ in range(n)]
-            st["winner"] = None
-            st["sweepUntil"] = None
-            st["phase"] = "playing"
 
-            _online_emit_full_state(code, room)
+def _online_maybe_schedule_bot_turn(room: OnlineRoom):
+    st = room.state
+    if st.phase == "playing" and st.turn in st.bot_seats:
+        _online_schedule_bot_turn(room)
 
-            if st.get("turn") in st.get("botSeats", set()):
-                _online_schedule_bot_turn(code)
-        except Exception:
-            return
+def _online_schedule_bot_turn(room: OnlineRoom):
+    st = room.state
+    # The bot's hand identifies the move: once it has played, a stale
+    # timer for the same turn finds a different hand and backs off.
+    seat = st.turn
+    # Thinking time (and the wait for its batch) counts towards the bot's
+    # usual 0.6 s pause.
+    delay = max(0.1, 0.6 - BOT_LEVELS.get(room.bot_level, 0.0) - BOT_BATCHER.tick)
+    _online_set_timer(room, "bot", delay, _online_bot_play, seat, st.hands[seat])
 
-    socketio.start_background_task(_task)
-def _online_internal_play_card(code: str, room, seat: int, card_key: str):
-    st = room["state"]
-    if st.get("phase") != "playing":
+def _online_bot_to_move(st: OnlineGameState, seat: int, hand: int) -> bool:
+    return st.phase == "playing" and st.turn == seat and seat in st.bot_seats and st.hands[seat] == hand
+
+def _online_bot_play(room: OnlineRoom, seat: int, hand: int):
+    st = room.state
+    if not _online_bot_to_move(st, seat, hand):
         return
-    if st.get("turn") != seat:
+    budget = BOT_LEVELS.get(room.bot_level, 0.0)
+    if budget and BOT_BATCHER.add(
+        bot_view(st, seat), budget,
+        lambda card: _online_set_timer(room, "bot", 0, _online_bot_play_chosen, seat, hand, card),
+    ):
+        return  # queued for a worker; the pool is off or swamped otherwise
+    card = online_engine.bot_card(st, seat)
+    if card is None:
         return
+    _online_internal_play_card(room, seat, card, "bot")
 
-    hand = st["hands"][seat]
-    idx = next((i for i, c in enumerate(hand) if _online_card_key(c) == card_key), None)
-    if idx is None:
+def _online_bot_play_chosen(room: OnlineRoom, seat: int, hand: int, card: Optional[int]):
+    """Play the card a Monte Carlo worker picked (None: it failed)."""
+    st = room.state
+    if not _online_bot_to_move(st, seat, hand):
+        return
+    if card is None or not is_legal(hand, st.lead_suit, card):
+        card = online_engine.bot_card(st, seat)
+        if card is not None:
+            _online_internal_play_card(room, seat, card, "bot")
+        return
+    _online_internal_play_card(room, seat, card, "mc")
+
+def _online_schedule_auto_next_trick(room: OnlineRoom):
+    st = room.state
+    # Wait for the client-side animations to finish before advancing.
+    # In the UI we animate:
+    #  - card flies in: 2s
+    #  - trick sweeps out to winner: 2s
+    # We gate server-side advancement using st.sweep_until.
+    delay = max(0.2, (st.sweep_until or 0.0) - time.time())
+    _online_set_timer(room, "trick", delay, _online_auto_next_trick, st.round_index, st.trick_no())
+
+def _online_auto_next_trick(room: OnlineRoom, round_index: int, trick_no: int):
+    st = room.state
+    # room/state may have changed while the timer was pending
+    if st.phase != "between_tricks":
+        return
+    if st.round_index != round_index or st.trick_no() != trick_no:
         return
-    card = hand[idx]
+    # auto-advance only if there are bots
+    if len(st.bot_seats) == 0:
+        return
+    _online_journal(room, "trick", round_index, trick_no)
 
-    if st.get("leadSuit") is not None:
-        lead = st["leadSuit"]
-        has_lead = any(c["suit"] == lead for c in hand)
-        if has_lead and card["suit"] != lead:
-            return
+    online_engine.next_trick(st)
 
-    hand.pop(idx)
-    if st.get("leadSuit") is None:
-        st["leadSuit"] = card["suit"]
-    st["table"][seat] = card
-
-    # Track last action to support bot watchdog
-    st["lastActionAt"] = time.time()
-
-    n = st["n"]
-    nxt = (seat + 1) % n
-    for _ in range(n):
-        if st["table"][nxt] is None:
-            st["turn"] = nxt
-            break
-        nxt = (nxt + 1) % n
-
-    if all(c is not None for c in st["table"]):
-        winner = st["leader"]
-        best = st["table"][winner]
-        for i in range(n):
-            c = st["table"][i]
-            if _online_compare_cards(c, best, st["leadSuit"]) > 0:
-                best = c
-                winner = i
-
-        st["winner"] = winner
-        st["tricksRound"][winner] += 1
-        st["tricksTotal"][winner] += 1
-
-        # Prevent the next trick from starting until the UI has finished animating.
-        # UI timing:
-        #  - card flies in to the table: 2 seconds
-        #  - trick sweeps out to the winner: 2 seconds
-        # Total lock: 4 seconds.
-        st["sweepUntil"] = time.time() + 4.0
-
-        if all(len(h) == 0 for h in st["hands"]):
-            bids = [int(b or 0) for b in st["bids"]]
-            taken = list(st["tricksRound"])
-            points = [_online_points_for_round(bids[i], taken[i]) for i in range(n)]
-            for i in range(n):
-                st["pointsTotal"][i] += points[i]
-            st["history"].append({
-                "round": st["roundIndex"] + 1,
-                "cardsPer": int(st.get("cardsPer") or ONLINE_ROUND_CARDS[st["roundIndex"]]),
-                "bids": bids,
-                "taken": taken,
-                "points": points,
-            })
-            st["phase"] = "round_finished"
-            _online_schedule_auto_next_round(code, st["roundIndex"])
-        else:
-            st["phase"] = "between_tricks"
-            _online_schedule_auto_next_trick(code, st["roundIndex"])
-
-    _online_emit_full_state(code, room)
-
-    if st.get("phase") == "playing" and st.get("turn") in st.get("botSeats", set()):
-        _online_schedule_bot_turn(code)
-
-def _online_emit_full_state(code: str, room):
-    st = room["state"]
-    # broadcast public state
-    socketio.emit("online_state", {"room": code, "seat": None, "state": _online_public_state(room)}, room=code)
-    # send private hand to each member
-    for sid, seat in list(room["members"].items()):
-        hand = st["hands"][seat] if st["hands"][seat] else []
-        payload_state = dict(_online_public_state(room))
-        # Special rule: when cardsPer==1 in bidding/dealing, players see opponents' cards but not their own
-        cards_per = int(st.get("cardsPer") or 0)
-        phase = st.get("phase")
-        if cards_per == 1 and phase in ("dealing","bidding"):
-            payload_state["hands"] = [ (st["hands"][i] if i != seat else None) for i in range(st["n"]) ]
-        else:
-            payload_state["hands"] = [hand if i == seat else None for i in range(st["n"])]
-        socketio.emit("online_state", {"room": code, "seat": seat, "state": payload_state}, to=sid)
+    _online_broadcast_state(room)
+    _online_maybe_schedule_bot_turn(room)
 
-def _online_mark_seat_bot_takeover(code: str, room, seat: int):
-    st = room["state"]
-    if st.get("phase") == "lobby":
+def _online_internal_play_card(room: OnlineRoom, seat: int, card: int, kind: str = "play"):
+    """Play card for seat; kind is "bot" or "mc" when a bot picked it."""
+    st = room.state
+    if not online_engine.play_card(st, seat, card, _online_now()):
         return
-    bot_seats = set(st.get("botSeats", set()))
-    if seat not in bot_seats:
-        prev_name = st["names"][seat] or f"Spiller {seat+1}"
-        st["names"][seat] = f"Computer (overtog {prev_name})"
-        bot_seats.add(seat)
-        st["botSeats"] = bot_seats
-
-    if st.get("phase") == "bidding":
-        _online_bot_choose_bid(room)
-        if all(b is not None for b in st["bids"]):
-            st["phase"] = "playing"
-            st["turn"] = st["leader"]
-            st["lastActionAt"] = time.time()
-
-    _online_emit_full_state(code, room)
-
-    if st.get("phase") == "playing" and st.get("turn") in st.get("botSeats", set()):
-        _online_schedule_bot_turn(code)
-
-def _online_schedule_bot_takeover(code: str, seat: int, client_id: Optional[str]):
-    room = ONLINE_ROOMS.get(code)
-    if not room:
+    _online_journal(room, kind, seat, card)
+
+    if st.phase == "round_finished":
+        _online_schedule_auto_next_round(room)
+    elif st.phase == "between_tricks":
+        _online_schedule_auto_next_trick(room)
+
+    _online_broadcast_state(room)
+    _online_maybe_schedule_bot_turn(room)
+
+def _online_snapshot(room: OnlineRoom, seat: Optional[int]) -> Dict[str, Any]:
+    # last_public is the public state of the current version, built once
+    # per mutation; a snapshot only adds the caller's private hands.
+    if room.last_public is None:  # restored and not broadcast since
+        room.last_public = room.state.to_public()
+        room.last_public["version"] = room.version
+    payload_state = dict(room.last_public)
+    if seat is not None:
+        payload_state["hands"] = room.state.hands_view(seat)
+    return payload_state
+
+def _online_send_snapshot(room: OnlineRoom, sid: str):
+    """Full online_state for one socket (join, resync)."""
+    seat = room.members.get(sid)
+    if seat is not None:
+        room.hands_sent[sid] = room.state.hands_key(seat)
+    socketio.emit("online_state", {"room": room.code, "seat": seat, "state": _online_snapshot(room, seat)}, to=sid)
+
+def _online_broadcast_state(room: OnlineRoom, snapshot_sid: Optional[str] = None):
+    """Send what changed since the last broadcast.
+
+    The public part is built once and goes to the whole room as a single
+    online_delta, which the socket layer encodes once for all recipients.
+    Members whose private hands view changed first get a small
+    online_hands frame for the same version, which the client folds into
+    that delta. snapshot_sid (a socket that just joined) gets a full
+    online_state instead. Clients whose version does not match the
+    delta's "base" ask for online_resync.
+    """
+    code = room.code
+    if ONLINE_ROOMS.get(code) is not room:
+        return  # evicted, or being rebuilt by online_replay
+    st = room.state
+    public = st.to_public()
+    if room.last_public is None:
+        ops = [[key, value] for key, value in public.items()]
+    else:
+        ops = public_delta(room.last_public, public)
+    base = room.version
+    if ops:
+        room.version += 1
+    version = room.version
+    public["version"] = version
+    room.last_public = public
+
+    wire: Dict[int, Any] = {}
+    hands_sent = {}
+    for sid, seat in list(room.members.items()):
+        key = st.hands_key(seat)
+        hands_sent[sid] = key
+        if sid != snapshot_sid and room.hands_sent.get(sid) != key:
+            socketio.emit("online_hands", {"room": code, "seat": seat, "v": version, "hands": st.hands_view(seat, wire)}, to=sid)
+    room.hands_sent = hands_sent
+
+    if ops:
+        socketio.emit("online_delta", {"room": code, "seat": None, "base": base, "v": version, "ops": ops}, to=code, skip_sid=snapshot_sid)
+    if snapshot_sid is not None:
+        _online_send_snapshot(room, snapshot_sid)
+    if SNAPSHOTS is not None:
+        t0 = time.perf_counter_ns()
+        SNAPSHOTS.put("online", code, room.to_record(), t0)
+
+def _online_mark_seat_bot_takeover(room: OnlineRoom, seat: int):
+    if not online_engine.takeover(room.state, seat):
         return
-    pending = room.setdefault("pendingBotTakeover", {})
-    if seat in pending:
+    _online_journal(room, "takeover", seat)
+
+    _online_broadcast_state(room)
+    _online_maybe_schedule_bot_turn(room)
+
+def _online_schedule_bot_takeover(room: OnlineRoom, seat: int, client_id: Optional[str]):
+    key = (room.code, ("takeover", seat))
+    if ONLINE_TIMERS.is_pending(key):
         return
-    marker = time.time()
-    pending[seat] = marker
+    ONLINE_TIMERS.schedule(key, 30, _online_post, room, _online_bot_takeover_due, seat, client_id)
 
-    def _task():
-        try:
-            socketio.sleep(30)
-            room2 = ONLINE_ROOMS.get(code)
-            if not room2:
-                return
-            st2 = room2["state"]
-            pending2 = room2.get("pendingBotTakeover", {})
-            if pending2.get(seat) != marker:
-                return
-            pending2.pop(seat, None)
-            if st2.get("phase") == "lobby":
-                return
-            if seat in room2.get("members", {}).values():
-                return
-            if client_id and client_id in (room2.get("clients") or {}):
-                try:
-                    last_seen = float(room2["clients"][client_id].get("lastSeen", 0) or 0)
-                except Exception:
-                    last_seen = 0.0
-                if time.time() - last_seen < 30:
-                    return
-                room2["clients"].pop(client_id, None)
-            _online_mark_seat_bot_takeover(code, room2, seat)
-        except Exception:
+def _online_bot_takeover_due(room: OnlineRoom, seat: int, client_id: Optional[str]):
+    st = room.state
+    if st.phase == "lobby":
+        return
+    if seat in room.members.values():
+        return
+    client = room.clients.get(client_id) if client_id else None
+    if client is not None:
+        if time.time() - client.last_seen < 30:
             return
+        room.clients.pop(client_id, None)
+    _online_mark_seat_bot_takeover(room, seat)
 
-    socketio.start_background_task(_task)
-def _online_schedule_auto_next_round(code: str, round_index: int):
+def _online_schedule_auto_next_round(room: OnlineRoom):
     # Start next round automatically 2 seconds after the final card of a round is played.
-    def _task():
-        try:
-            socketio.sleep(2)
-            room = ONLINE_ROOMS.get(code)
-            if not room:
-                return
-            st = room["state"]
-            # Only advance if we are still on the same finished round
-            if st.get("phase") != "round_finished":
-                return
-            if st.get("roundIndex") != round_index:
-                return
-            # Prevent duplicate advancement
-            if st.get("autoNextDoneFor") == round_index:
-                return
-            st["autoNextDoneFor"] = round_index
+    _online_set_timer(room, "round", 2, _online_auto_next_round, room.state.round_index)
 
-            n = st["n"]
-            if st["roundIndex"] >= 13:
-                st["phase"] = "game_finished"
-            else:
-                st["roundIndex"] += 1
-                # Start next round with a short 'dealing' phase.
-                _online_start_deal_phase(code, room, st["roundIndex"])
-                return
+def _online_auto_next_round(room: OnlineRoom, round_index: int):
+    st = room.state
+    # Only advance if we are still on the same finished round
+    if st.phase != "round_finished":
+        return
+    if st.round_index != round_index:
+        return
+    _online_journal(room, "round", round_index)
 
-            _online_emit_full_state(code, room)
-            if st.get("phase") == "playing" and st.get("turn") in st.get("botSeats", set()):
-                _online_schedule_bot_turn(code)
-        except Exception:
-            # don't crash the server on background task errors
-            return
+    if online_engine.advance_round(st):
+        # Start next round with a short 'dealing' phase.
+        _online_start_deal_phase(room, st.round_index)
+        return
 
-    socketio.start_background_task(_task)
+    _online_broadcast_state(room)
+    _online_maybe_schedule_bot_turn(room)
 
 
 
+def _online_rearm_timers(room: OnlineRoom):
+    """After a restore: recreate the timers the room's phase is waiting on."""
+    st = room.state
+    if st.phase == "dealing":
+        _online_set_timer(room, "deal", max(0.0, (st.deal_ends_at or 0.0) - time.time()), _online_finish_deal, st.deal_id)
+    elif st.phase == "between_tricks":
+        _online_schedule_auto_next_trick(room)
+    elif st.phase == "round_finished":
+        _online_schedule_auto_next_round(room)
+    else:
+        _online_maybe_schedule_bot_turn(room)
+    if st.phase not in ("lobby", "game_finished"):
+        # Nobody is connected after a restart; seats not reclaimed in time go to bots.
+        seat_clients = {c.seat: cid for cid, c in room.clients.items()}
+        for seat in range(st.n):
+            if seat not in st.bot_seats:
+                _online_schedule_bot_takeover(room, seat, seat_clients.get(seat))
+
 def _online_cleanup_sid(sid):
-    for code, room in list(ONLINE_ROOMS.items()):
-        # Detach member; keep seat reservation for a short time so a browser
-        # navigation (redirect/reload) can re-attach to the same seat.
-        seat = room["members"].pop(sid, None)
-        client_id = None
-        try:
-            client_id = room.get("sidToClient", {}).pop(sid, None)
-        except Exception:
-            client_id = None
-        if seat is not None:
-            try:
-                leave_room(code)
-            except Exception:
-                pass
-            st = room["state"]
-            # If we know the client id, keep the name and refresh lastSeen.
-            if client_id and room.get("clients") and client_id in room["clients"]:
-                room["clients"][client_id]["lastSeen"] = time.time()
-            else:
-                if st.get("phase") == "lobby":
-                    st["names"][seat] = None
-            # if room empty, keep it briefly (redirects/reloads) then purge later
-            if not room["members"]:
-                room["emptySince"] = time.time()
-            else:
-                room["emptySince"] = None
-                _online_emit_full_state(code, room)
+    ref = ONLINE_SIDS.get(sid)
+    room = ONLINE_ROOMS.get(ref[0]) if ref else None
+    if room:
+        _online_submit(room, _online_detach_sid, sid)
+
+def _online_attach_sid(room: OnlineRoom, sid: str, seat: int, client_id: Optional[str]):
+    """Seat sid in room and index it; a socket sits in one room at a time."""
+    room.members[sid] = seat
+    prev = _online_index(ONLINE_SIDS, sid, room.code, seat)
+    if prev and prev[0] != room.code:
+        other = ONLINE_ROOMS.get(prev[0])
+        if other:
+            _online_submit(other, _online_detach_sid, sid)
+    if client_id:
+        room.clients[client_id] = OnlineClient(seat, time.time(), sid)
+        room.sid_to_client[sid] = client_id
+
+def _online_drop_sid(room: OnlineRoom, sid: str):
+    """Remove sid from room's members; return (seat, client_id)."""
+    seat = room.members.pop(sid, None)
+    client_id = room.sid_to_client.pop(sid, None)
+    _online_unindex(ONLINE_SIDS, sid, room.code)
+    client = room.clients.get(client_id) if client_id else None
+    if client is not None and client.sid == sid:
+        client.sid = None
+    return seat, client_id
+
+def _online_detach_sid(room: OnlineRoom, sid: str):
+    # Detach member; keep seat reservation for a short time so a browser
+    # navigation (redirect/reload) can re-attach to the same seat.
+    seat, client_id = _online_drop_sid(room, sid)
+    if seat is None:
+        return
+    st = room.state
+    # If we know the client id, keep the name and refresh lastSeen.
+    client = room.clients.get(client_id) if client_id else None
+    if client is not None:
+        client.last_seen = time.time()
+    else:
+        if st.phase == "lobby":
+            _online_set_name(room, seat, None)
+    # if room empty, keep it briefly (redirects/reloads) then purge later
+    if not room.members:
+        room.empty_since = time.time()
+        ROOM_LIFECYCLE.touch("online", room.code)
+    else:
+        room.empty_since = None
+        _online_broadcast_state(room)
 
-            if st.get("phase") != "lobby" and seat is not None:
-                _online_schedule_bot_takeover(code, seat, client_id)
+    if st.phase != "lobby":
+        _online_schedule_bot_takeover(room, seat, client_id)
+
+def _online_set_name(room: OnlineRoom, seat: int, name: Optional[str]):
+    _online_journal(room, "name", seat, name)
+    room.state.names[seat] = name
+
+def _online_new_game_state(n_players: int, host_name: str, bots: int) -> OnlineGameState:
+    names = [None for _ in range(n_players)]
+    names[0] = host_name
+
+    bot_seats = set(range(1, 1 + bots))
+    for i, seat in enumerate(sorted(bot_seats)):
+        names[seat] = f"Computer {i+1}"
+    return OnlineGameState(n_players, names, bot_seats)
+
+def _online_bot_level(value) -> str:
+    return value if isinstance(value, str) and value in BOT_LEVELS else ONLINE_BOT_LEVEL
+
+def _online_get_room(data) -> Optional[OnlineRoom]:
+    code = (data.get("room") or "").strip()
+    room = ONLINE_ROOMS.get(code)
+    if not room:
+        emit("error", {"message": "Rum ikke fundet."})
+    else:
+        ROOM_LIFECYCLE.touch("online", code)
+    return room
 
 # ---------- Online multiplayer socket events ----------
+# Handlers only parse the payload and enqueue a command on the room's
+# executor; commands address the caller by sid since they may run on
+# another thread, outside this request's context.
 @socketio.on("online_create_room")
 def online_create_room(data):
-    _online_purge_old_rooms()
+    ROOM_LIFECYCLE.sweep()
+    code = ONLINE_CODES.allocate() if ROOM_LIFECYCLE.make_room() else None
+    while code is not None and not _room_claim("online", code):
+        code = ONLINE_CODES.allocate()  # owned by another worker; stays reserved here
+    if code is None:
+        emit("error", {"message": "Serveren er fuld. Prøv igen senere."})
+        return
     client_id = (data.get("clientId") or data.get("client_id") or "").strip() or None
     name = (data.get("name") or "").strip() or "Spiller 1"
     n_players = int(data.get("players") or 4)
@@ -894,120 +1067,81 @@ def online_create_room(data):
     if bots > n_players - 1:
         bots = n_players - 1
 
-    code = _online_room_code()
-    while code in ONLINE_ROOMS:
-        code = _online_room_code()
-
-    names = [None for _ in range(n_players)]
-    names[0] = name
-
-    bot_seats = set(range(1, 1 + bots))
-    for i, seat in enumerate(sorted(list(bot_seats))):
-        names[seat] = f"Computer {i+1}"
-
-    room = {
-        "code": code,
-        "emptySince": None,
-        "members": {request.sid: 0},
-        # Stable client mapping (clientId -> seat) to survive redirects/reloads.
-        "clients": {},
-        "sidToClient": {},
-        "state": {
-            "n": n_players,
-            "names": names,
-            "botSeats": bot_seats,
-            "roundIndex": 0,
-            "leader": 0,
-            "turn": 0,
-            "leadSuit": None,
-            "table": [None for _ in range(n_players)],
-            "winner": None,
-            "phase": "lobby",
-            "hands": [None for _ in range(n_players)],
-            "bids": [None for _ in range(n_players)],
-            # Deal animation meta
-            "dealId": 0,
-            "dealSeq": None,
-            "cardsPer": None,
-            "dealEndsAt": None,
-            "tricksRound": [0 for _ in range(n_players)],
-            "tricksTotal": [0 for _ in range(n_players)],
-            "pointsTotal": [0 for _ in range(n_players)],
-            "history": [],
-            "autoNextDoneFor": None,
-        "lastActionAt": time.time(),
-        "botScheduledAt": 0.0,
-        "botScheduledTurn": None,
-        "botWatchdogStarted": False,
-        }
-    }
-    if client_id:
-        room["clients"][client_id] = {"seat": 0, "lastSeen": time.time()}
-        room["sidToClient"][request.sid] = client_id
+    # Nobody else knows the code yet, so the room can be set up here.
+    room = OnlineRoom(code, _online_new_game_state(n_players, name, bots))
+    room.bot_level = _online_bot_level(data.get("botLevel"))
+    _online_journal(room, "lobby", n_players, bots, name)
     ONLINE_ROOMS[code] = room
+    ROOM_LIFECYCLE.touch("online", code)
+    _online_attach_sid(room, request.sid, 0, client_id)
     join_room(code)
 
     # send state (seat 0)
-    st = dict(_online_public_state(room))
-    st["hands"] = [[]] + [None for _ in range(n_players-1)]
-    emit("online_state", {"room": code, "seat": 0, "state": st})
+    _online_broadcast_state(room, snapshot_sid=request.sid)
+
+@_room_event("online", "online_resync")
+def online_resync(data):
+    """A client missed a delta (or has none yet): send it a full snapshot."""
+    code = (data.get("room") or "").strip()
+    room = ONLINE_ROOMS.get(code)
+    if room:
+        _online_submit(room, _online_send_snapshot, request.sid)
 
-@socketio.on("online_join_room")
+@_room_event("online", "online_join_room")
 def online_join_room(data):
-    _online_purge_old_rooms()
+    ROOM_LIFECYCLE.sweep()
     code = (data.get("room") or "").strip()
     name = (data.get("name") or "").strip() or "Spiller"
     client_id = (data.get("clientId") or data.get("client_id") or "").strip() or None
-    if (not code.isdigit()) or len(code) != 4:
-        emit("error", {"message": "Rumkode skal være 4 tal."})
-        return
-    room = ONLINE_ROOMS.get(code)
-    if not room:
-        emit("error", {"message": "Rum ikke fundet."})
+    if not ONLINE_CODES.is_valid(code):
+        digits = "4" if ONLINE_CODES.max_length == 4 else f"4-{ONLINE_CODES.max_length}"
+        emit("error", {"message": f"Rumkode skal være {digits} tal."})
         return
+    room = _online_get_room(data)
+    if room:
+        _online_submit(room, _online_join, request.sid, name, client_id)
 
-    room["emptySince"] = None
-    st = room["state"]
-    n = st["n"]
+def _online_join(room: OnlineRoom, sid: str, name: str, client_id: Optional[str]):
+    # The socket may have disconnected while this command was queued.
+    if sid not in _ROOM_REMOTE_SIDS and not socketio.server.manager.is_connected(sid, "/"):
+        return
+    if ONLINE_ROOMS.get(room.code) is not room:
+        _online_error(sid, "Rum ikke fundet.")  # evicted while this was queued
+        return
+    room.empty_since = None
+    st = room.state
+    n = st.n
     # Seats currently occupied by live members
-    occupied = set(room["members"].values())
+    occupied = set(room.members.values())
     # Seats reserved for recently-seen clients (redirect/reload)
     now = time.time()
-    for cid, meta in (room.get("clients") or {}).items():
-        try:
-            if now - float(meta.get("lastSeen", 0)) < 30:
-                occupied.add(int(meta.get("seat")))
-        except Exception:
-            continue
-    bot_seats = set(st.get("botSeats", set()))
+    for client in room.clients.values():
+        if now - client.last_seen < 30:
+            occupied.add(client.seat)
+    bot_seats = st.bot_seats
     # If the client has joined before, re-attach to the same seat.
     seat = None
-    if client_id and room.get("clients") and client_id in room["clients"]:
-        seat = int(room["clients"][client_id]["seat"])
-        room["clients"][client_id]["lastSeen"] = now
+    client = room.clients.get(client_id) if client_id else None
+    if client is not None:
+        seat = client.seat
+        client.last_seen = now
     else:
         seat = next((i for i in range(n) if i not in occupied and i not in bot_seats), None)
     if seat is None:
-        emit("error", {"message": "Rummet er fuldt."})
+        _online_error(sid, "Rummet er fuldt.")
         return
 
     # If this client already had a different sid in the room, detach it.
-    if client_id:
-        for sid_existing, cid in list((room.get("sidToClient") or {}).items()):
-            if cid == client_id and sid_existing in room["members"]:
-                room["members"].pop(sid_existing, None)
-                room["sidToClient"].pop(sid_existing, None)
+    if client is not None and client.sid and client.sid != sid:
+        _online_drop_sid(room, client.sid)
 
-    room["members"][request.sid] = seat
-    if client_id:
-        room.setdefault("clients", {})[client_id] = {"seat": seat, "lastSeen": now}
-        room.setdefault("sidToClient", {})[request.sid] = client_id
-    st["names"][seat] = name
-    join_room(code)
+    _online_attach_sid(room, sid, seat, client_id)
+    _online_set_name(room, seat, name)
+    socketio.server.enter_room(sid, room.code, namespace="/")
 
-    _online_emit_full_state(code, room)
+    _online_broadcast_state(room, snapshot_sid=sid)
 
-@socketio.on("online_leave_room")
+@_room_event("online", "online_leave_room")
 def online_leave_room(data):
     code = (data.get("room") or "").strip()
     client_id = (data.get("clientId") or data.get("client_id") or "").strip() or None
@@ -1015,94 +1149,74 @@ def online_leave_room(data):
     if not room:
         emit("online_left")
         return
+    _online_submit(room, _online_leave, request.sid, client_id)
 
-    seat = room["members"].pop(request.sid, None)
+def _online_leave(room: OnlineRoom, sid: str, client_id: Optional[str]):
+    seat, _ = _online_drop_sid(room, sid)
     # also clear stable mapping for this client (explicit leave means really gone)
-    try:
-        room.get("sidToClient", {}).pop(request.sid, None)
-    except Exception:
-        pass
     if client_id:
-        try:
-            room.get("clients", {}).pop(client_id, None)
-        except Exception:
-            pass
-    leave_room(code)
+        room.clients.pop(client_id, None)
+    socketio.server.leave_room(sid, room.code, namespace="/")
 
     if seat is not None:
-        st = room["state"]
-        if st.get("phase") == "lobby":
-            st["names"][seat] = None
+        st = room.state
+        if st.phase == "lobby":
+            _online_set_name(room, seat, None)
         else:
-            _online_mark_seat_bot_takeover(code, room, seat)
-            if not room["members"]:
-                room["emptySince"] = time.time()
+            _online_mark_seat_bot_takeover(room, seat)
+            if not room.members:
+                room.empty_since = time.time()
+                ROOM_LIFECYCLE.touch("online", room.code)
             else:
-                room["emptySince"] = None
-            emit("online_left")
+                room.empty_since = None
+            socketio.emit("online_left", to=sid)
             return
         # IMPORTANT: Do NOT delete the room immediately when it becomes empty.
         # Redirects/navigation between phase pages can briefly leave the room
         # with 0 live members, and immediate deletion causes "Rum ikke fundet"
         # on the next page load. We keep the room for a short TTL.
-        if not room["members"]:
-            room["emptySince"] = time.time()
+        if not room.members:
+            room.empty_since = time.time()
+            ROOM_LIFECYCLE.touch("online", room.code)
         else:
-            room["emptySince"] = None
-            _online_emit_full_state(code, room)
+            room.empty_since = None
+            _online_broadcast_state(room)
 
-    emit("online_left")
+    socketio.emit("online_left", to=sid)
 
-@socketio.on("online_start_game")
+@_room_event("online", "online_start_game")
 def online_start_game(data):
-    code = (data.get("room") or "").strip()
-    room = ONLINE_ROOMS.get(code)
-    if not room:
-        emit("error", {"message": "Rum ikke fundet."})
-        return
+    room = _online_get_room(data)
+    if room:
+        _online_submit(room, _online_start_game, request.sid)
 
-    st = room["state"]
-    if st["phase"] != "lobby":
+def _online_start_game(room: OnlineRoom, sid: str):
+    st = room.state
+    if st.phase != "lobby":
         return
 
-    human_joined = len(room["members"])
+    human_joined = len(room.members)
     if human_joined < 1:
-        emit("error", {"message": "Der skal være mindst 1 menneske og mindst 2 spillere i alt (inkl. computere)."})
+        _online_error(sid, "Der skal være mindst 1 menneske og mindst 2 spillere i alt (inkl. computere).")
         return
 
-    # Auto-fill bots to match total players minus physical (human) players.
-    n_players = int(st.get("n") or 0)
+    n_players = int(st.n or 0)
     if n_players < 2:
-        emit("error", {"message": "Der skal være mindst 2 spillere i alt."})
+        _online_error(sid, "Der skal være mindst 2 spillere i alt.")
         return
 
-    human_seats = set(room.get("members", {}).values())
-    bot_seats = set(range(n_players)) - human_seats
-    names = list(st.get("names") or [])
-    if len(names) < n_players:
-        names.extend([None for _ in range(n_players - len(names))])
-    elif len(names) > n_players:
-        names = names[:n_players]
-
-    bot_index = 1
-    for seat in range(n_players):
-        if seat in bot_seats:
-            names[seat] = f"Computer {bot_index}"
-            bot_index += 1
-        else:
-            if not names[seat]:
-                names[seat] = f"Spiller {seat+1}"
+    _online_apply_start(room, sorted(set(room.members.values())))
 
-    st["names"] = names
-    st["botSeats"] = bot_seats
+def _online_apply_start(room: OnlineRoom, human_seats: List[int]):
+    _online_journal(room, "start", human_seats)
+    online_engine.start_game(room.state, human_seats)
 
     # Start round 1 with a short 'dealing' phase so clients can animate
     # the deal visibly before bots can advance the game.
-    st["roundIndex"] = 0
-    _online_start_deal_phase(code, room, 0)
+    _online_start_deal_phase(room, 0)
 
 
-@socketio.on("online_update_lobby")
+@_room_event("online", "online_update_lobby")
 def online_update_lobby(data):
     """Host-only lobby configuration.
 
@@ -1112,28 +1226,27 @@ def online_update_lobby(data):
       - Only allowed while only the host is connected (no other humans)
       - Only allowed in lobby phase
     """
-    _online_purge_old_rooms()
-    code = (data.get("room") or "").strip()
-    room = ONLINE_ROOMS.get(code)
-    if not room:
-        emit("error", {"message": "Rum ikke fundet."})
-        return
+    ROOM_LIFECYCLE.sweep()
+    room = _online_get_room(data)
+    if room:
+        _online_submit(room, _online_update_lobby, request.sid, data)
 
-    seat = room["members"].get(request.sid)
+def _online_update_lobby(room: OnlineRoom, sid: str, data):
+    seat = room.members.get(sid)
     if seat != 0:
-        emit("error", {"message": "Kun værten kan ændre opsætningen."})
+        _online_error(sid, "Kun værten kan ændre opsætningen.")
         return
 
-    st = room["state"]
-    if st.get("phase") != "lobby":
+    st = room.state
+    if st.phase != "lobby":
         return
 
     # If other humans are connected, don't allow reshaping seats.
-    if len(room["members"]) > 1:
-        emit("error", {"message": "Kan ikke ændre opsætning når andre spillere er i rummet."})
+    if len(room.members) > 1:
+        _online_error(sid, "Kan ikke ændre opsætning når andre spillere er i rummet.")
         return
 
-    n_players = int(data.get("players") or st.get("n") or 4)
+    n_players = int(data.get("players") or st.n or 4)
     if n_players < 2 or n_players > 8:
         n_players = 4
 
@@ -1156,170 +1269,276 @@ def online_update_lobby(data):
     if incoming_name:
         host_name = incoming_name
     else:
-        host_name = _normalize_name((st.get("names") or ["Spiller 1"])[0], "Spiller 1")
+        host_name = _normalize_name((st.names or ["Spiller 1"])[0], "Spiller 1")
 
-    names = [None for _ in range(n_players)]
-    names[0] = host_name
+    if "botLevel" in data:
+        room.bot_level = _online_bot_level(data.get("botLevel"))
+    _online_apply_lobby(room, n_players, bots, host_name)
 
-    bot_seats = set(range(1, 1 + bots))
-    for i, s in enumerate(sorted(list(bot_seats))):
-        names[s] = f"Computer {i+1}"
-
-    room["state"] = {
-        "n": n_players,
-        "names": names,
-        "botSeats": bot_seats,
-        "roundIndex": 0,
-        "leader": 0,
-        "turn": 0,
-        "leadSuit": None,
-        "table": [None for _ in range(n_players)],
-        "winner": None,
-        "phase": "lobby",
-        "hands": [None for _ in range(n_players)],
-        "bids": [None for _ in range(n_players)],
-        # Deal animation meta
-        "dealId": 0,
-        "dealSeq": None,
-        "cardsPer": None,
-        "dealEndsAt": None,
-        "tricksRound": [0 for _ in range(n_players)],
-        "tricksTotal": [0 for _ in range(n_players)],
-        "pointsTotal": [0 for _ in range(n_players)],
-        "history": [],
-        "autoNextDoneFor": None,
-        "lastActionAt": time.time(),
-        "botScheduledAt": 0.0,
-        "botScheduledTurn": None,
-        "botWatchdogStarted": False,
-    }
-
-    _online_emit_full_state(code, room)
-
-@socketio.on("online_set_bid")
+def _online_apply_lobby(room: OnlineRoom, n_players: int, bots: int, host_name: str):
+    # A new lobby state discards everything before it, so does the journal.
+    room.journal.clear()
+    _online_journal(room, "lobby", n_players, bots, host_name)
+    room.state = _online_new_game_state(n_players, host_name, bots)
+
+    _online_broadcast_state(room)
+
+@_room_event("online", "online_set_bid")
 def online_set_bid(data):
-    code = (data.get("room") or "").strip()
-    room = ONLINE_ROOMS.get(code)
-    if not room:
-        emit("error", {"message": "Rum ikke fundet."})
-        return
+    room = _online_get_room(data)
+    if room:
+        _online_submit(room, _online_set_bid, request.sid, data.get("bid"))
 
-    st = room["state"]
-    if st["phase"] != "bidding":
+def _online_set_bid(room: OnlineRoom, sid: str, raw_bid):
+    st = room.state
+    if st.phase != "bidding":
         return
 
-    seat = room["members"].get(request.sid, None)
+    seat = room.members.get(sid, None)
     if seat is None:
-        emit("error", {"message": "Du er ikke i rummet."})
+        _online_error(sid, "Du er ikke i rummet.")
         return
 
-    if st["bids"][seat] is not None:
-        emit("error", {"message": "Dit bud er allerede gemt."})
+    if st.bids[seat] != NO_BID:
+        _online_error(sid, "Dit bud er allerede gemt.")
         return
 
-    max_bid = int(st.get("cardsPer") or ONLINE_ROUND_CARDS[st["roundIndex"]])
+    max_bid = online_engine.max_bid(st)
     try:
-        bid = int(data.get("bid"))
+        bid = int(raw_bid)
     except Exception:
         bid = 0
     if bid < 0 or bid > max_bid:
-        emit("error", {"message": f"Bud skal være mellem 0 og {max_bid}."})
+        _online_error(sid, f"Bud skal være mellem 0 og {max_bid}.")
         return
+    _online_apply_bid(room, seat, bid)
 
-    st["bids"][seat] = bid
+def _online_apply_bid(room: OnlineRoom, seat: int, bid: int):
+    _online_journal(room, "bid", seat, bid)
+    online_engine.set_bid(room.state, seat, bid)
 
-    # when all bids submitted -> start playing
-    if all(b is not None for b in st["bids"]):
-        st["phase"] = "playing"
-        st["turn"] = st["leader"]
-        st["lastActionAt"] = time.time()
-
-    _online_emit_full_state(code, room)
+    _online_broadcast_state(room)
 
     # If the bidding phase just transitioned into playing and it is a bot's
     # turn (very common with 2 players when the leader rotates each round),
     # we must schedule the bot's opening lead immediately.
-    if st.get("phase") == "playing" and st.get("turn") in st.get("botSeats", set()):
-        _online_schedule_bot_turn(code)
+    _online_maybe_schedule_bot_turn(room)
 
-@socketio.on("online_play_card")
+@_room_event("online", "online_play_card")
 def online_play_card(data):
-    code = (data.get("room") or "").strip()
-    card_key = (data.get("card") or "").strip()
-    room = ONLINE_ROOMS.get(code)
-    if not room:
-        emit("error", {"message": "Rum ikke fundet."})
-        return
+    card = card_from_key((data.get("card") or "").strip())
+    room = _online_get_room(data)
+    if room:
+        _online_submit(room, _online_play_card, request.sid, card)
 
-    st = room["state"]
-    if st["phase"] != "playing":
+def _online_play_card(room: OnlineRoom, sid: str, card: Optional[int]):
+    st = room.state
+    if st.phase != "playing":
         return
 
-    seat = room["members"].get(request.sid, None)
+    seat = room.members.get(sid, None)
     if seat is None:
-        emit("error", {"message": "Du er ikke i rummet."})
+        _online_error(sid, "Du er ikke i rummet.")
         return
-    if st["turn"] != seat:
-        emit("error", {"message": "Det er ikke din tur."})
+    if st.turn != seat:
+        _online_error(sid, "Det er ikke din tur.")
         return
 
-    _online_internal_play_card(code, room, seat, card_key)
-    return
-
-@socketio.on("online_next")
-def online_next(data):
-    code = (data.get("room") or "").strip()
-    room = ONLINE_ROOMS.get(code)
-    if not room:
-        emit("error", {"message": "Rum ikke fundet."})
+    if card is None:
         return
+    _online_internal_play_card(room, seat, card)
 
-    st = room["state"]
-    n = st["n"]
+@_room_event("online", "online_next")
+def online_next(data):
+    room = _online_get_room(data)
+    if room:
+        _online_submit(room, _online_next)
 
-    if st["phase"] == "between_tricks":
-        sweep_until = st.get("sweepUntil")
+def _online_next(room: OnlineRoom):
+    st = room.state
+    if st.phase == "between_tricks":
+        sweep_until = st.sweep_until
         if sweep_until and time.time() < sweep_until:
             # Ignore early "next" clicks while the trick is still sweeping to the winner.
             return
-        st["leader"] = st["winner"]
-        st["turn"] = st["leader"]
-        st["leadSuit"] = None
-        st["table"] = [None for _ in range(n)]
-        st["winner"] = None
-        st["sweepUntil"] = None
-        st["phase"] = "playing"
-
-    elif st["phase"] == "round_finished":
-        if st["roundIndex"] >= 13:
-            st["phase"] = "game_finished"
-        else:
-            st["roundIndex"] += 1
-            hands, _ = _online_deal(n, st["roundIndex"])
-            st["hands"] = hands
-            st["leader"] = (st["roundIndex"] % st["n"])
-            st["turn"] = st["leader"]
-            st["leadSuit"] = None
-            st["table"] = [None for _ in range(n)]
-            st["winner"] = None
-            st["bids"] = [None for _ in range(n)]
-            st["tricksRound"] = [0 for _ in range(n)]
-            st["phase"] = "bidding"
-
-    _online_bot_choose_bid(room)
-    if all(b is not None for b in st["bids"]):
-        st["phase"] = "playing"
-        st["turn"] = st["leader"]
-        st["lastActionAt"] = time.time()
-
-    _online_emit_full_state(code, room)
-    if st.get("phase") == "playing" and st.get("turn") in st.get("botSeats", set()):
-        _online_schedule_bot_turn(code)
+    _online_apply_next(room)
+
+def _online_apply_next(room: OnlineRoom):
+    # "next" outside between_tricks / round_finished changes nothing: no
+    # journal entry, broadcast or snapshot for it.
+    if not online_engine.next_step(room.state, room.deal_rng):
+        return
+    _online_journal(room, "next")
+
+    _online_broadcast_state(room)
+    _online_maybe_schedule_bot_turn(room)
+
+# ---------- Hints and round analysis ----------
+_ONLINE_PLAY_KINDS = ("play", "bot", "mc")
+
+def _online_hint_allowed(sid: str) -> bool:
+    if ONLINE_HINT_LIMIT.allow(sid):
+        return True
+    _online_error(sid, "Vent lidt før du spørger igen.")
+    return False
+
+def _online_ask_workers(sid: str, key, fn, args, send) -> None:
+    """send(result) from the cache, or once a bot worker computed fn(*args)."""
+    cached = ONLINE_ANALYSIS_CACHE.get(key)
+    if cached is not None:
+        send(cached)
+        return
+
+    def done(result):
+        if result is None:
+            _online_error(sid, "Beregningen fejlede. Prøv igen.")
+            return
+        ONLINE_ANALYSIS_CACHE.put(key, result)
+        send(result)
+
+    if not BOT_POOL.run(fn, args, done):
+        _online_error(sid, "Computeren er optaget. Prøv igen om lidt.")
+
+@_room_event("online", "online_hint")
+def online_hint(data):
+    """How many points each card the caller may play is worth on average."""
+    room = _online_get_room(data)
+    if room and _online_hint_allowed(request.sid):
+        _online_submit(room, _online_hint, request.sid)
+
+def _online_hint(room: OnlineRoom, sid: str):
+    st = room.state
+    seat = room.members.get(sid)
+    if seat is None:
+        _online_error(sid, "Du er ikke i rummet.")
+        return
+    if st.phase != "playing" or st.turn != seat:
+        _online_error(sid, "Det er ikke din tur.")
+        return
+
+    def send(result):
+        socketio.emit("online_hint", {
+            "room": room.code,
+            "seat": seat,
+            "cards": [card_to_wire(c) for c in result["cards"]],
+            "points": result["points"],
+            "samples": result["samples"],
+            "exact": result["exact"],
+        }, to=sid)
+
+    key = ("hint", room.code, room.seed, st.round_index, seat, st.played, tuple(st.table))
+    view = bot_view(st, seat)
+    _online_ask_workers(sid, key, hint, (view, ONLINE_HINT_BUDGET, room.seed ^ st.played), send)
+
+@_room_event("online", "online_analysis")
+def online_analysis(data):
+    """Every play of the round just finished next to the best play."""
+    room = _online_get_room(data)
+    if room and _online_hint_allowed(request.sid):
+        _online_submit(room, _online_analysis, request.sid)
+
+def _online_analysis(room: OnlineRoom, sid: str):
+    st = room.state
+    if room.members.get(sid) is None:
+        _online_error(sid, "Du er ikke i rummet.")
+        return
+    if st.phase not in ("round_finished", "game_finished"):
+        _online_error(sid, "Analysen er klar når runden er slut.")
+        return
+    # The round's plays are the last journal entries of a play kind; its
+    # deal comes back from the room's seed.
+    count = st.n * online_engine.max_bid(st)
+    plays = [tuple(e[2:4]) for e in room.journal if e[1] in _ONLINE_PLAY_KINDS][-count:]
+    hands, _ = online_engine.deal(st.n, st.round_index, room.deal_rng(st.round_index))
+    round_no = st.round_index + 1
+
+    def send(result):
+        socketio.emit("online_analysis", {
+            "room": room.code,
+            "round": round_no,
+            "plays": [dict(p, card=card_to_wire(p["card"]), best=[card_to_wire(c) for c in p["best"]]) for p in result],
+        }, to=sid)
+
+    key = ("analysis", room.code, room.seed, st.round_index, tuple(plays))
+    _online_ask_workers(sid, key, analyse_round, (st.n, hands, list(st.bids), plays), send)
 
 @socketio.on("disconnect")
 def online_disconnect():
     _online_cleanup_sid(request.sid)
+    ONLINE_HINT_LIMIT.forget(request.sid)
+    if ROOM_BACKEND.shared:
+        _room_forget_sid(request.sid)
+
+
+# ---------- Replay ----------
+# Journal kind -> command that re-applies it to a replayed room.
+_ONLINE_REPLAY_COMMANDS = {
+    "lobby": _online_apply_lobby,
+    "name": _online_set_name,
+    "start": _online_apply_start,
+    "deal": _online_finish_deal,
+    "bid": _online_apply_bid,
+    "play": _online_internal_play_card,
+    "bot": lambda room, seat, card: _online_bot_play(room, seat, room.state.hands[seat]),
+    # Monte Carlo picks are random; replay the recorded card.
+    "mc": lambda room, seat, card: _online_internal_play_card(room, seat, card, "mc"),
+    "trick": _online_auto_next_trick,
+    "round": _online_auto_next_round,
+    "next": _online_apply_next,
+    "takeover": _online_mark_seat_bot_takeover,
+}
+
+def online_replay(record: Dict[str, Any]) -> OnlineRoom:
+    """Rebuild a game from its seed and journal (OnlineRoom.to_record, or
+    GET /admin/rooms/<code>/journal).
+
+    The rebuilt room is not registered, so nothing is broadcast, scheduled
+    or snapshotted. Each entry must re-record itself unchanged; otherwise
+    (e.g. the bot logic now picks another card) ValueError names the first
+    entry that diverged.
+    """
+    room = OnlineRoom(record["code"], None, record["seed"], record["startedAt"])
+    try:
+        for i, (t, kind, *args) in enumerate(record["journal"]):
+            _ONLINE_REPLAY_CLOCK.now = room.started_at + t / 1000
+            command = _ONLINE_REPLAY_COMMANDS.get(kind)
+            if command is None:
+                raise ValueError(f"journal entry {i}: unknown command {kind!r}")
+            command(room, *args)
+            if len(room.journal) != i + 1 or room.journal[i][1:] != [kind, *args]:
+                raise ValueError(f"journal entry {i} {[kind, *args]} replayed as {room.journal[i:i + 1]}")
+    finally:
+        _ONLINE_REPLAY_CLOCK.now = None
+    return room
+
+
+# ---------- Warm restart ----------
+def _rooms_restore() -> None:
+    now = time.time()
+    # Everything allocated here lives on; cyclic GC passes would only slow it down.
+    gc.disable()
+    try:
+        for (kind, code), record in SNAPSHOTS.load().items():
+            if kind == "score":
+                rooms[code] = record
+                SCORE_CODES.reserve(code)
+                ROOM_LIFECYCLE.touch("score", code)
+                continue
+            room = OnlineRoom.from_record(record)
+            room.empty_since = now  # nobody is connected yet
+            ONLINE_ROOMS[code] = room
+            ONLINE_CODES.reserve(code)
+            ROOM_LIFECYCLE.touch("online", code)
+            _online_submit(room, _online_rearm_timers)
+    finally:
+        gc.enable()
+    SNAPSHOTS.start()
+
+# Not in the debug reloader's parent process, which never serves.
+# Nor in bot worker processes, which import the main module as __mp_main__.
+if SNAPSHOTS is not None and __name__ != "__mp_main__" and (__name__ != "__main__" or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+    _rooms_restore()
 
 
 if __name__ == "__main__":
-    socketio.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "5000")), debug=True)
\ No newline at end of file
+    socketio.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "5000")), debug=True)
@@ -0,0 +1,109 @@
+"""Answer caching and rate limiting shared by the expensive requests.
+
+AnalysisCache keeps recent answers (least recently used, optionally with
+a time to live), so the same question is computed or fetched once however
+often it is asked: hints and round analysis from the bot workers, AI help
+answers (ai_proxy) and help searches (help_search). RateLimiter caps how
+often one key (a socket, an address, a room) may ask at all.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+
+class AnalysisCache:
+    """Least recently used cache of answers, with hit and miss counts;
+    entries older than ttl seconds (if given) count as missing."""
+
+    def __init__(self, max_entries: int = 2000, ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and self._clock() >= entry[1]:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        expires = self._clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            asked = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hitRate": round(self._hits / asked, 3) if asked else None,
+            }
+
+
+class RateLimiter:
+    """Token bucket per key: burst requests at once, then one per interval.
+
+    A bucket left alone for interval * burst seconds is full again, the
+    same as no bucket; those are dropped, least recently used first, so
+    keys that stop asking (addresses, room codes) do not pile up.
+    """
+
+    def __init__(self, interval: float, burst: int = 1, clock: Callable[[], float] = time.monotonic):
+        self.interval = interval
+        self.burst = burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (tokens, at), oldest first
+        self.refused = 0
+
+    def allow(self, key: Hashable) -> bool:
+        return self.allow_all((key,))
+
+    def allow_all(self, keys: Iterable[Hashable]) -> bool:
+        """Take a token from the bucket of every key, or, if one of them is
+        empty, from none."""
+        now = self._clock()
+        with self._lock:
+            tokens = {}
+            for key in keys:
+                left, at = self._buckets.pop(key, (self.burst, now))
+                tokens[key] = min(self.burst, left + (now - at) / self.interval)
+            full_at = now - self.interval * self.burst
+            while self._buckets:
+                oldest = next(iter(self._buckets))
+                if self._buckets[oldest][1] > full_at:
+                    break
+                del self._buckets[oldest]
+            allowed = all(left >= 1 for left in tokens.values())
+            for key, left in tokens.items():
+                self._buckets[key] = (left - 1 if allowed else left, now)
+            if not allowed:
+                self.refused += 1
+            return allowed
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
@@ -0,0 +1,123 @@
+"""A small JSON settings file kept in memory.
+
+ConfigStore answers reads from the parsed file and its serialised body,
+without opening the file per request. Writes go to a temporary file in
+the same directory, which is then renamed over the old one, so nobody
+ever reads half a file. At most once per check_interval seconds a read
+compares the file's mtime and size with what was loaded, and reloads it
+when another process (another worker, an editor) changed it.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class ConfigStore:
+    def __init__(self, path: str, defaults: Dict[str, Any], check_interval: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.path = path
+        self.defaults = dict(defaults)
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._values: Dict[str, Any] = dict(defaults)
+        self._body = b""
+        self._etag = ""
+        self._stamp: Optional[Tuple[int, int]] = None  # (mtime_ns, size) of what was loaded
+        self._checked_at = float("-inf")
+        self._counts = {"reads": 0, "reloads": 0, "writes": 0}
+        self._publish(self._values)
+        self._reload()
+
+    def _publish(self, values: Dict[str, Any]) -> None:
+        self._values = values
+        self._body = json.dumps(values, separators=(",", ":")).encode("utf-8")
+        self._etag = hashlib.sha256(self._body).hexdigest()[:16]
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _reload(self) -> None:
+        """Load the file if it changed since it was last loaded (lock held or
+        not yet shared)."""
+        self._checked_at = self._clock()
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+        except (OSError, ValueError):
+            log.exception("config %s unreadable; keeping the values in memory", self.path)
+            return
+        self._stamp = stamp
+        if not isinstance(loaded, dict):
+            return
+        self._publish(dict(self.defaults, **loaded))
+        self._counts["reloads"] += 1
+
+    def _fresh(self) -> None:
+        self._counts["reads"] += 1
+        if self._clock() - self._checked_at >= self.check_interval:
+            self._reload()
+
+    def get(self) -> Dict[str, Any]:
+        with self._lock:
+            self._fresh()
+            return dict(self._values)
+
+    def body(self) -> Tuple[bytes, str]:
+        """(the values as JSON, an ETag for them)."""
+        with self._lock:
+            self._fresh()
+            return self._body, self._etag
+
+    def update(self, **changes: Any) -> Dict[str, Any]:
+        """Set changes, in memory and on disk; returns the new values.
+
+        If the file cannot be written the new values still apply in this
+        process, and the error is logged.
+        """
+        with self._lock:
+            values = dict(self._values, **changes)
+            self._publish(values)
+            self._counts["writes"] += 1
+            directory = os.path.dirname(os.path.abspath(self.path))
+            tmp = None
+            try:
+                fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+                os.chmod(tmp, 0o644)  # mkstemp's 0600 would hide it from other users
+                with os.fdopen(fd, "wb") as f:
+                    f.write(self._body)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                tmp = None
+                self._stamp = self._file_stamp()
+                self._checked_at = self._clock()
+            except OSError:
+                log.exception("config %s not written", self.path)
+            finally:
+                if tmp is not None:
+                    try:
+                        os.unlink(tmp)
+                    except OSError:
+                        pass
+            return dict(values)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
@@ -1,6 +1,7 @@
 // global_ai.js
 // Henter global AI-URL fra serveren (samme domæne) så alle spillere får den automatisk.
 // Admin/LaBA kan sætte den via /set-ai-url (admin-siden).
+// Serveren sender "ai_url" på Socket.IO når den ændres (se PW_watchAiUrl).
 (() => {
   const CACHE_KEY = "pw_ai_url_global_cache";
   const CACHE_TTL_MS = 5 * 60 * 1000; // 5 min
@@ -30,20 +31,25 @@
     }catch(e){}
   }
 
-    async function refresh(){
+  function apply(url){
+    const u = norm(url || "");
+    if(u){
+      window.PW_GLOBAL_AI_URL = u;
+      writeCache(u);
+      // Back-compat: some UI still reads the local key
+      try{ localStorage.setItem("pw_ai_url", u); }catch(e){}
+      try{ window.dispatchEvent(new CustomEvent("pw-ai-url-updated", { detail:{ url:u } })); }catch(e){}
+    }
+    return u;
+  }
+
+  async function refresh(){
     try{
-      const r = await fetch(ENDPOINT + "?ts=" + Date.now(), { cache:"no-store" });
+      // no-cache: the browser revalidates with the ETag (usually a 304)
+      const r = await fetch(ENDPOINT, { cache:"no-cache" });
       if(!r.ok) return "";
       const j = await r.json();
-      const u = norm(j.aiUrl || "");
-      if(u){
-        window.PW_GLOBAL_AI_URL = u;
-        writeCache(u);
-        // Back-compat: some UI still reads the local key
-        try{ localStorage.setItem("pw_ai_url", u); }catch(e){}
-        try{ window.dispatchEvent(new CustomEvent("pw-ai-url-updated", { detail:{ url:u } })); }catch(e){}
-      }
-      return u;
+      return apply(j.aiUrl);
     }catch(e){
       return "";
     }
@@ -76,8 +82,13 @@
     return norm(u || window.PW_getAiBaseUrl());
   };
 
-  // Kick off refresh (do not block UI)
+  // Pages with a socket get changes pushed: PW_watchAiUrl(socket)
+  window.PW_watchAiUrl = function(socket){
+    try{ socket.on("ai_url", (d) => apply(d && d.aiUrl)); }catch(e){}
+  };
+
+  // Kick off refresh (do not block UI) unless the cached URL is recent
   const c = readCache();
   if(c.url) window.PW_GLOBAL_AI_URL = c.url;
-  refresh();
+  if(!c.url || (Date.now() - c.at) >= CACHE_TTL_MS) refresh();
 })();
@@ -0,0 +1,165 @@
+"""Search over the rules and UI help (piratwhist_knowledge.json).
+
+The knowledge file of ai-backend-template holds short sections of rules
+and UI help; the Node backend scans all of them per question. HelpIndex
+reads them once into a BM25 inverted index, so a search touches only the
+sections sharing a term with the question and needs no AI backend at all:
+the same sections serve as offline help and as context for the AI.
+
+Text is tokenised for Danish: casefolded words (æ, ø, å kept, "aa" read
+as "å"), common stopwords dropped, and words reduced to a stem with the
+Snowball Danish rules ("stikket", "stikkene" -> "stik"). A query word the
+index does not know is tried as a compound of two known words
+("trumfkort" -> "trumf" + "kort").
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from caching import AnalysisCache
+
+log = logging.getLogger(__name__)
+
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 2  # title words count as if they appeared this often
+
+_WORD = re.compile(r"[^\W_]+")
+_SPACE = re.compile(r"\s+")
+_URL = re.compile(r"https?://\S+")
+_VOWELS = set("aeiouyæøå")
+_S_ENDING = set("abcdfghjklmnoprtvyzå")
+# Snowball Danish, step 1, longest first.
+_SUFFIXES = sorted(
+    "hed ethed ered e erede ende erende ene erne ere en heden eren er heder erer heds es endes erendes enes "
+    "ernes eres ens hedens erens ers ets erets et eret".split(),
+    key=len, reverse=True,
+)
+_SUFFIXES_3 = ("elig", "løst", "lig", "els", "ig")
+# Snowball's Danish stopwords and the question words.
+STOPWORDS = frozenset("""
+ad af alle alt anden at blev blive bliver da de dem den denne der deres det dette dig din disse dog du
+efter eller en end er et for fra ham han hans har havde have hende hendes her hos hun hvad hvis hvor i
+ikke ind jeg jer jo kunne man mange med meget men mig min mine mit mod ned noget nogle nu når og også om
+op os over på sig sin sine sit skal skulle som sådan thi til ud under var vi vil ville vor være været
+hvem hvilke hvilken hvordan hvorfor hvornår kan
+""".split())
+
+
+def _r1(word: str) -> int:
+    for i in range(1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            return max(3, i + 1)
+    return len(word)
+
+
+def _undouble_ending(word: str, r1: int) -> str:
+    if len(word) - 2 >= r1 and word[-2:] in ("gd", "dt", "gt", "kt"):
+        return word[:-1]
+    return word
+
+
+def stem(word: str) -> str:
+    """Snowball Danish stem of a lowercase word."""
+    r1 = _r1(word)
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= r1:
+            word = word[: -len(suffix)]
+            break
+    else:
+        if word.endswith("s") and len(word) - 1 >= r1 and len(word) > 1 and word[-2] in _S_ENDING:
+            word = word[:-1]
+    word = _undouble_ending(word, r1)
+    if word.endswith("igst"):
+        word = word[:-2]
+    for suffix in _SUFFIXES_3:
+        if word.endswith(suffix) and len(word) - len(suffix) >= r1:
+            word = word[:-1] if suffix == "løst" else _undouble_ending(word[: -len(suffix)], r1)
+            break
+    if len(word) - 1 >= r1 and word[-1] == word[-2] and word[-1] not in _VOWELS:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKC", _URL.sub(" ", text)).casefold().replace("aa", "å")
+    return [stem(w) for w in _WORD.findall(text) if w not in STOPWORDS and (len(w) > 1 or w.isdigit())]
+
+
+class HelpIndex:
+    def __init__(self, sections: List[Dict[str, Any]], cache_entries: int = 1000):
+        """sections: dicts with id, kind ("rule" / "ui"), title and text."""
+        self.sections = sections
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for i, section in enumerate(sections):
+            terms = Counter(tokenize(section["text"]))
+            for term in tokenize(section["title"]):
+                terms[term] += TITLE_WEIGHT
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self._postings.setdefault(term, []).append((i, tf))
+        n = len(sections)
+        avg = sum(lengths) / n if n else 1.0
+        self._idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in self._postings.items()}
+        # K1 * length normalisation per section, as BM25 needs it per posting.
+        self._norm = [K1 * (1 - B + B * length / avg) for length in lengths]
+        self._cache = AnalysisCache(max_entries=cache_entries)
+
+    @classmethod
+    def from_file(cls, path: str) -> "HelpIndex":
+        """Index the rules and ui sections of a knowledge file; an empty
+        index if it cannot be read."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                knowledge = json.load(f)
+        except (OSError, ValueError):
+            log.exception("help knowledge %s unreadable", path)
+            knowledge = {}
+        sections = []
+        for key, kind in (("rules", "rule"), ("ui", "ui")):
+            for entry in knowledge.get(key) or []:
+                title = str(entry.get("title") or entry.get("id") or "")
+                text = _SPACE.sub(" ", str(entry.get("text") or "")).strip()
+                sections.append({"id": str(entry.get("id") or title), "kind": kind, "title": title, "text": text})
+        return cls(sections)
+
+    def _terms(self, query: str) -> List[str]:
+        terms = []
+        for term in tokenize(query):
+            if term in self._postings:
+                terms.append(term)
+                continue
+            # An unknown compound: the split whose halves are both indexed.
+            for i in range(3, len(term) - 2):
+                head, tail = stem(term[:i]), stem(term[i:])
+                if head in self._postings and tail in self._postings:
+                    terms.extend((head, tail))
+                    break
+        return terms
+
+    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Best k sections for query (BM25), each with its score."""
+        key = (" ".join(_WORD.findall(query.casefold())), k)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        scores: Dict[int, float] = {}
+        for term in self._terms(query):
+            idf = self._idf[term]
+            for i, tf in self._postings[term]:
+                scores[i] = scores.get(i, 0.0) + idf * tf * (K1 + 1) / (tf + self._norm[i])
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        result = [dict(self.sections[i], score=round(score, 3)) for i, score in best]
+        self._cache.put(key, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._cache.stats(), sections=len(self.sections), terms=len(self._postings))
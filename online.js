@@ -442,7 +442,7 @@ const PW_AI = (() => {
   async function ask(question, game){
     const url = baseUrl();
     if (!url) throw new Error("AI URL mangler");
-    const res = await fetch(url + "/ask", {
+    const res = await fetch(pwAiAskUrl(url), {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ question, game })
@@ -714,6 +714,27 @@ function getPwAiBaseUrl(){
   }
 }
 
+// Questions for the global AI URL go through the server (/ai/ask: kept-alive
+// connections, cached answers); a URL set only on this device is asked directly.
+function pwAiAskUrl(base){
+  const b = normalizePwAiBaseUrl(base);
+  const g = normalizePwAiBaseUrl(window.PW_GLOBAL_AI_URL || "");
+  if (b && g && b === g) return "/ai/ask";
+  return b + "/ask";
+}
+
+// Offline help: the rules/UI section matching the question best (or null).
+async function pwHelpSearch(question){
+  try{
+    const r = await fetch("/help/search?k=1&q=" + encodeURIComponent(question));
+    if (!r.ok) return null;
+    const j = await r.json();
+    return (j.results || [])[0] || null;
+  }catch(e){
+    return null;
+  }
+}
+
 function setPwAiBaseUrl(v){
   try{ localStorage.setItem(PW_AI_URL_KEY, normalizePwAiBaseUrl(v)); }catch(e){}
 }
@@ -939,7 +960,7 @@ function initPwAiHelp(){
       return;
     }
     if (urlInput) setPwAiBaseUrl(base);
-    const askUrl = base.replace(/\/$/, "") + "/ask";
+    const askUrl = pwAiAskUrl(base);
 
     if (status) status.textContent = "AI tænker…";
     if (answer) answer.textContent = "";
@@ -993,7 +1014,10 @@ function initPwAiHelp(){
         }
       }
     }catch(e){
-      if (answer) answer.textContent = "AI er ikke tilgængelig lige nu. (Tjek at cloudflared + node serveren kører.)";
+      const help = await pwHelpSearch(question);
+      if (answer) answer.textContent = help
+        ? "AI er ikke tilgængelig lige nu. Fra reglerne – " + help.title + ": " + help.text
+        : "AI er ikke tilgængelig lige nu. (Tjek at cloudflared + node serveren kører.)";
     }finally{
       if (status) status.textContent = "";
       ask.disabled = false;
@@ -2207,6 +2231,7 @@ const socket = GUIDE_MODE ? {
   connected:false,
   on(){}, off(){}, emit(){}, connect(){}, disconnect(){},
 } : io({ transports: ["websocket", "polling"] });
+if (typeof window.PW_watchAiUrl === "function") window.PW_watchAiUrl(socket);
 
 
 function emitWhenConnected(fn){
@@ -2453,8 +2478,13 @@ try{
 }catch(e){ /* ignore */ }
 }
 
+// Versioned state updates: see online_delta.js.
 if (!GUIDE_MODE){
-  socket.on("online_state", handleOnlineState);
+  window.PW_attachOnlineDelta(socket, {
+    state: () => state,
+    room: () => roomCode,
+    apply: handleOnlineState,
+  });
 }
 if (GUIDE_MODE){
   // Guide mode renders deterministic demo scenes without server/socket.
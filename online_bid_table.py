@@ -0,0 +1,94 @@
+"""Expected tricks per hand for bot bidding, from a precomputed table.
+
+scripts/gen_bid_table.py plays millions of random deals (vectorized with
+NumPy) and records how many tricks hands of each kind took. A hand's kind
+is its bucket: trumps held, trumps of rank J or higher, side-suit aces,
+side-suit kings, and whether the seat leads the first trick. The table
+holds the mean tricks per (players, cards per player, bucket) in 1/32
+trick units, 255 where too few deals had such a hand.
+
+The file ships next to this module and is read on first use; the server
+does not need NumPy.
+
+File layout: magic ``PWBT``, then u8 version, min players, max players,
+max cards, u16 buckets per (players, cards), then the u8 cells.
+"""
+from __future__ import annotations
+
+import os
+import struct
+from array import array
+from functools import lru_cache
+from typing import Optional
+
+from online_cards import HIGH_MASK, SUIT_MASKS, TRUMP
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "online_bid_table.bin")
+MAGIC = b"PWBT"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBH")
+MIN_PLAYERS, MAX_PLAYERS, MAX_CARDS = 2, 8, 7
+SCALE = 32  # cells are tricks * SCALE
+UNKNOWN = 255
+
+_TRUMPS = SUIT_MASKS[TRUMP]
+_SIDE = ~_TRUMPS & ((1 << 52) - 1)
+_ACES = sum(1 << (13 * s + 12) for s in range(4))
+_KINGS = sum(1 << (13 * s + 11) for s in range(4))
+
+# Feature ranges, in bucket order.
+TRUMP_COUNTS = MAX_CARDS + 1
+HIGH_TRUMP_COUNTS = 5
+SIDE_ACE_COUNTS = 4
+SIDE_KING_COUNTS = 4
+BUCKETS = TRUMP_COUNTS * HIGH_TRUMP_COUNTS * SIDE_ACE_COUNTS * SIDE_KING_COUNTS * 2
+
+
+def bucket(trumps: int, high_trumps: int, side_aces: int, side_kings: int, leads: bool) -> int:
+    return (((trumps * HIGH_TRUMP_COUNTS + high_trumps) * SIDE_ACE_COUNTS + side_aces) * SIDE_KING_COUNTS + side_kings) * 2 + leads
+
+
+def hand_bucket(hand: int, leads: bool) -> int:
+    return bucket(
+        bin(hand & _TRUMPS).count("1"),
+        bin(hand & _TRUMPS & HIGH_MASK).count("1"),
+        bin(hand & _SIDE & _ACES).count("1"),
+        bin(hand & _SIDE & _KINGS).count("1"),
+        leads,
+    )
+
+
+def cell_offset(n_players: int, cards: int) -> int:
+    return ((n_players - MIN_PLAYERS) * MAX_CARDS + cards - 1) * BUCKETS
+
+
+def write_table(path: str, cells: bytes) -> None:
+    expected = (MAX_PLAYERS - MIN_PLAYERS + 1) * MAX_CARDS * BUCKETS
+    if len(cells) != expected:
+        raise ValueError(f"bid table needs {expected} cells, got {len(cells)}")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, MIN_PLAYERS, MAX_PLAYERS, MAX_CARDS, BUCKETS))
+        f.write(cells)
+    os.replace(tmp, path)
+
+
+@lru_cache(maxsize=1)
+def _table() -> Optional[array]:
+    try:
+        with open(TABLE_PATH, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < HEADER.size or HEADER.unpack_from(data) != (MAGIC, VERSION, MIN_PLAYERS, MAX_PLAYERS, MAX_CARDS, BUCKETS):
+        return None  # stale layout: bots bid by the old rule until it is regenerated
+    return array("B", data[HEADER.size:])
+
+
+def expected_tricks(n_players: int, hand: int, cards: int, leads: bool) -> Optional[float]:
+    """Mean tricks a hand like this takes; None if the table has no answer."""
+    table = _table()
+    if table is None or not MIN_PLAYERS <= n_players <= MAX_PLAYERS or not 1 <= cards <= MAX_CARDS:
+        return None
+    cell = table[cell_offset(n_players, cards) + hand_bucket(hand, leads)]
+    return None if cell == UNKNOWN else cell / SCALE
@@ -0,0 +1,382 @@
+"""Monte Carlo card play for online bots, run in a bounded process pool.
+
+``choose_card`` determinizes: it deals the cards the bot has not seen to
+the other seats at random, consistently with play so far (each seat's
+card count, and no cards of a suit it has shown out of), plays the rest
+of the round out for every legal card with a quick bid-aware policy for
+all seats, and picks the card with the best average score for the bot.
+It keeps sampling until its time budget is spent. Once at most
+online_solver.ENDGAME_CARDS cards are left, each sampled deal is solved
+exactly instead of played out. ``hint`` gives a human the same scores.
+
+Bots of a room play at one of BOT_LEVELS; "basic" is the rule-of-thumb
+bot in online_engine, the others are seconds of sampling per card.
+BotPool runs choose_card (and hints and round analyses) in worker
+processes and refuses work beyond max_pending, so the caller falls back
+to the basic bot instead of queueing; nothing here ever blocks a request
+or timer thread. BotBatcher collects the moves of all rooms and hands
+them to the pool as one batch per worker and tick.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import online_solver
+from online_cards import FULL_DECK, TRUMP, TRICK_STRENGTH, hand_cards, legal_mask, resolve_trick
+from online_engine import points_for_round
+from online_state import OnlineGameState
+
+log = logging.getLogger(__name__)
+
+# Seconds of sampling per card played.
+BOT_LEVELS = {"basic": 0.0, "normal": 0.15, "strong": 0.5}
+MIN_SAMPLES = 8
+MAX_SAMPLES = 2000
+
+# Strength of a card when it is led: trump over everything, then rank.
+_LEAD_STRENGTH = [TRICK_STRENGTH[card // 13][card] for card in range(52)]
+
+
+def bot_view(st: OnlineGameState, seat: int) -> Dict[str, Any]:
+    """What seat can see, as plain data for choose_card (pickled to a worker)."""
+    done = st.trick_no()
+    return {
+        "n": st.n,
+        "seat": seat,
+        "hand": st.hands[seat],
+        "table": list(st.table),
+        "lead": st.lead_suit,
+        "played": st.played,
+        "voids": st.voids.tolist(),
+        "bids": [max(0, b) for b in st.bids],
+        "taken": st.tricks_round.tolist(),
+        # Everybody played one card per finished trick.
+        "counts": [st.cards_per - done - (st.table[s] is not None) for s in range(st.n)],
+    }
+
+
+def _policy(hand: int, table: List[Optional[int]], lead: Optional[int], wants: bool) -> int:
+    """Rollout move: win cheaply while short of the bid, otherwise duck."""
+    cards = hand_cards(legal_mask(hand, lead))
+    if lead is None:
+        if wants:
+            return max(cards, key=_LEAD_STRENGTH.__getitem__)
+        low = [c for c in cards if c // 13 != TRUMP] or cards
+        return min(low, key=lambda c: c % 13)
+    row = TRICK_STRENGTH[lead]
+    best = max(row[c] for c in table if c is not None)
+    winning = [c for c in cards if row[c] > best]
+    if wants:
+        if winning:
+            return min(winning, key=row.__getitem__)
+        return min(cards, key=lambda c: (c // 13 == TRUMP, c % 13))
+    losing = [c for c in cards if row[c] <= best]
+    if losing:
+        return max(losing, key=lambda c: (row[c], c // 13 != TRUMP, c % 13))
+    return min(winning, key=row.__getitem__)
+
+
+def _sample_hands(view: Dict[str, Any], rng: random.Random) -> List[int]:
+    """Deal the unseen cards to the other seats, respecting their voids."""
+    n, seat, counts, voids = view["n"], view["seat"], view["counts"], view["voids"]
+    cards = hand_cards(FULL_DECK & ~view["hand"] & ~view["played"])
+    # Seats with the most voids pick first; they are the hardest to fill.
+    order = sorted((s for s in range(n) if s != seat and counts[s] > 0), key=lambda s: -bin(voids[s]).count("1"))
+    for attempt in range(20):
+        rng.shuffle(cards)
+        hands = [0] * n
+        used = 0
+        for s in order:
+            need = counts[s]
+            # After 10 failed tries, stop honouring the voids.
+            void = voids[s] if attempt < 10 else 0
+            for c in cards:
+                if not need:
+                    break
+                if used >> c & 1 or void >> (c // 13) & 1:
+                    continue
+                hands[s] |= 1 << c
+                used |= 1 << c
+                need -= 1
+            if need:
+                break
+        else:
+            return hands
+    return hands
+
+
+def _play_out(view: Dict[str, Any], hands: List[int], first: int) -> int:
+    """Tricks the bot takes this round if it plays first now and everybody
+    follows the rollout policy afterwards."""
+    n, seat = view["n"], view["seat"]
+    bids = view["bids"]
+    taken = list(view["taken"])
+    table = list(view["table"])
+    lead = view["lead"]
+    hands = list(hands)
+    hands[seat] = view["hand"]
+    turn, card = seat, first
+    while True:
+        hands[turn] &= ~(1 << card)
+        if lead is None:
+            lead = card // 13
+        table[turn] = card
+        if None not in table:
+            turn = resolve_trick(table, lead)
+            taken[turn] += 1
+            if not hands[turn]:
+                return taken[seat]
+            table = [None] * n
+            lead = None
+        else:
+            turn = (turn + 1) % n
+            while table[turn] is not None:
+                turn = (turn + 1) % n
+        card = _policy(hands[turn], table, lead, taken[turn] < bids[turn])
+
+
+def card_scores(view: Dict[str, Any], budget: float, seed: Optional[int] = None) -> Tuple[List[int], List[float], int, bool]:
+    """(legal cards, mean points of each, samples taken, whether sampled
+    deals were solved exactly) for the seat in view."""
+    cards = hand_cards(legal_mask(view["hand"], view["lead"]))
+    n, seat = view["n"], view["seat"]
+    exact = sum(view["counts"]) + len(hand_cards(view["hand"])) <= online_solver.ENDGAME_CARDS
+    if len(cards) == 1:
+        return cards, [0.0], 0, exact
+    rng = random.Random(seed)
+    bid = view["bids"][seat]
+    totals = [0] * len(cards)
+    samples = 0
+    deadline = time.perf_counter() + budget
+    while samples < MIN_SAMPLES or (samples < MAX_SAMPLES and time.perf_counter() < deadline):
+        hands = _sample_hands(view, rng)
+        if exact:
+            hands[seat] = view["hand"]
+            values = online_solver.card_values(n, hands, view["table"], view["lead"], seat, bid, view["taken"][seat])
+            for i, card in enumerate(cards):
+                totals[i] += values[card]
+        else:
+            for i, card in enumerate(cards):
+                totals[i] += points_for_round(bid, _play_out(view, hands, card))
+        samples += 1
+    return cards, [t / samples for t in totals], samples, exact
+
+
+def choose_card(view: Dict[str, Any], budget: float, seed: Optional[int] = None) -> Tuple[int, int]:
+    """(card to play, samples taken) for the seat in view."""
+    cards, scores, samples, _ = card_scores(view, budget, seed)
+    best = max(range(len(cards)), key=lambda i: (scores[i], -i))
+    return cards[best], samples
+
+
+def choose_cards(views: List[Dict[str, Any]], budgets: List[float]) -> List[Tuple[int, int]]:
+    """choose_card for several positions in one call (one worker task)."""
+    return [choose_card(view, budget) for view, budget in zip(views, budgets)]
+
+
+def hint(view: Dict[str, Any], budget: float, seed: Optional[int] = None) -> Dict[str, Any]:
+    """Mean points of each legal card for a human seat, best first."""
+    cards, scores, samples, exact = card_scores(view, budget, seed)
+    ranked = sorted(zip(cards, scores), key=lambda cs: -cs[1])
+    return {"cards": [card for card, _ in ranked], "points": [round(s, 2) for _, s in ranked], "samples": samples, "exact": exact}
+
+
+_SOLVER_COUNTERS = ("solves", "nodes", "probes", "hits", "ns")
+
+
+def _measured(fn: Callable[..., Any], *args: Any) -> Tuple[Any, Dict[str, int]]:
+    """fn(*args) in a worker, with the solver counters it added."""
+    before = online_solver.stats()
+    result = fn(*args)
+    after = online_solver.stats()
+    return result, {k: after[k] - before[k] for k in _SOLVER_COUNTERS}
+
+
+class BotPool:
+    def __init__(self, workers: int, max_pending: Optional[int] = None):
+        self.workers = workers
+        self.max_pending = max_pending if max_pending is not None else 4 * workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._stats = {"tasks": 0, "refused": 0, "failed": 0}
+        self._solver = dict.fromkeys(_SOLVER_COUNTERS, 0)
+
+    def run(self, fn: Callable[..., Any], args: Tuple[Any, ...], done: Callable[[Optional[Any]], None]) -> bool:
+        """Call fn(*args) in a worker and done(result) from a pool thread
+        (None if the worker failed). False: the pool is off or saturated,
+        and done is never called."""
+        with self._lock:
+            if self.workers <= 0 or self._pending >= self.max_pending:
+                self._stats["refused"] += 1
+                return False
+            if self._executor is None:
+                # spawn: forking a process full of threads is not safe.
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._pending += 1
+            executor = self._executor
+
+        def finished(future: Future) -> None:
+            result = None
+            try:
+                result, solver = future.result()
+            except Exception:
+                log.exception("bot worker failed")
+            with self._lock:
+                self._pending -= 1
+                if result is None:
+                    self._stats["failed"] += 1
+                else:
+                    self._stats["tasks"] += 1
+                    for key, value in solver.items():
+                        self._solver[key] += value
+            done(result)
+
+        try:
+            executor.submit(_measured, fn, *args).add_done_callback(finished)
+        except Exception:  # broken pool (a worker died) or shutting down
+            log.exception("bot pool unavailable")
+            with self._lock:
+                self._pending -= 1
+                self._stats["refused"] += 1
+                self._executor = None
+            return False
+        return True
+
+    def busy(self) -> bool:
+        """Whether every worker has a task already."""
+        with self._lock:
+            return self._pending >= self.workers
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            solver = dict(self._solver)
+            pending = self._pending
+        solves = solver["solves"]
+        return {
+            "workers": self.workers,
+            "pending": pending,
+            "tasks": s["tasks"],
+            "refused": s["refused"],
+            "failed": s["failed"],
+            "solver": {
+                "solves": solves,
+                "msAvg": round(solver["ns"] / solves / 1e6, 2) if solves else None,
+                "nodesAvg": round(solver["nodes"] / solves, 1) if solves else None,
+                "ttHitRate": round(solver["hits"] / solver["probes"], 3) if solver["probes"] else None,
+            },
+        }
+
+
+class BotBatcher:
+    """Bot moves of every room, sent to a BotPool in batches.
+
+    add() queues a decision and the first one of a tick schedules a flush,
+    which splits the queue into one choose_cards task per worker. While
+    every worker is still busy, the flush waits for the next tick (up to
+    max_wait) and the batch keeps growing. A batch takes as long as its
+    slowest decision would alone: budgets shrink as batches grow, so under
+    load bots think less per move rather than fall back to basic. Past
+    max_batch decisions per worker (at least MIN_SAMPLES each) add()
+    refuses, and that bot plays basic.
+    """
+
+    def __init__(self, pool: BotPool, schedule: Callable[[float, Callable[[], None]], Any],
+                 tick: float = 0.02, max_wait: float = 1.0, max_batch: int = 32):
+        self.pool = pool
+        self.tick = tick
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._schedule = schedule  # schedule(delay, fn): run fn once after delay
+        self._lock = threading.Lock()
+        # (view, budget, done, queued at ns)
+        self._queue: List[Tuple[Dict[str, Any], float, Callable[[Optional[int]], None], int]] = []
+        self._scheduled = False
+        self._stats = {"batches": 0, "moves": 0, "refused": 0, "failed": 0, "samples": 0, "batchMax": 0, "waitNs": 0, "ns": 0}
+
+    def add(self, view: Dict[str, Any], budget: float, done: Callable[[Optional[int]], None]) -> bool:
+        """Queue a decision; done(card) is called from a pool thread (None:
+        it failed or the pool refused the batch). False: the pool is off or
+        the queue full, and done is never called."""
+        with self._lock:
+            if self.pool.workers <= 0 or len(self._queue) >= self.max_batch * self.pool.workers:
+                self._stats["refused"] += 1
+                return False
+            self._queue.append((view, budget, done, time.perf_counter_ns()))
+            if self._scheduled:
+                return True
+            self._scheduled = True
+        self._schedule(self.tick, self._flush)
+        return True
+
+    def _flush(self) -> None:
+        with self._lock:
+            queue = self._queue
+            waited = time.perf_counter_ns() - queue[0][3] if queue else 0
+            # Let the batch grow until a worker is free.
+            retry = bool(queue) and waited < self.max_wait * 1e9 and self.pool.busy()
+            if not retry:
+                self._queue = []
+                self._scheduled = False
+        if retry:
+            self._schedule(self.tick, self._flush)
+            return
+        if not queue:
+            return
+        workers = max(1, self.pool.workers)
+        for i in range(min(workers, len(queue))):
+            self._send(queue[i::workers])
+
+    def _send(self, batch: List[Tuple[Dict[str, Any], float, Callable[[Optional[int]], None], int]]) -> None:
+        budgets = [budget for _, budget, _, _ in batch]
+        scale = min(1.0, max(budgets) / (sum(budgets) or 1.0))
+        sent = time.perf_counter_ns()
+
+        def finished(results: Optional[List[Tuple[int, int]]]) -> None:
+            now = time.perf_counter_ns()
+            with self._lock:
+                s = self._stats
+                if results is None:
+                    s["failed"] += len(batch)
+                else:
+                    s["batches"] += 1
+                    s["moves"] += len(batch)
+                    s["samples"] += sum(samples for _, samples in results)
+                    s["batchMax"] = max(s["batchMax"], len(batch))
+                    for _, _, _, queued in batch:
+                        s["waitNs"] += sent - queued
+                        s["ns"] += now - queued
+            for i, (_, _, done, _) in enumerate(batch):
+                done(None if results is None else results[i][0])
+
+        args = ([view for view, _, _, _ in batch], [budget * scale for budget in budgets])
+        if not self.pool.run(choose_cards, args, finished):
+            with self._lock:
+                self._stats["refused"] += len(batch)
+            for _, _, done, _ in batch:
+                done(None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            queued = len(self._queue)
+        moves, batches = s["moves"], s["batches"]
+        return {
+            "queued": queued,
+            "moves": moves,
+            "refused": s["refused"],
+            "failed": s["failed"],
+            "batches": batches,
+            "batchAvg": round(moves / batches, 2) if batches else None,
+            "batchMax": s["batchMax"],
+            "samplesAvg": round(s["samples"] / moves, 1) if moves else None,
+            "waitMsAvg": round(s["waitNs"] / moves / 1e6, 1) if moves else None,
+            "msAvg": round(s["ns"] / moves / 1e6, 1) if moves else None,
+        }
@@ -0,0 +1,136 @@
+"""Compact card model for the online game engine.
+
+A card is an int 0-51 (``suit * 13 + rank``) and a hand is a 52-bit mask
+with bit ``card`` set for every card held. The suit order follows
+ONLINE_SUITS, so ascending card ints are also the order a sorted hand is
+shown in. The ``{"suit": ..., "rank": ...}`` dicts and ``"10♥"`` keys the
+clients use only exist at the wire boundary (see *_to_wire / card_from_key).
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+ONLINE_SUITS = ["♠", "♥", "♦", "♣"]  # spar is trump
+ONLINE_RANKS = ["2","3","4","5","6","7","8","9","10","J","Q","K","A"]
+
+TRUMP = 0  # index of "♠" in ONLINE_SUITS
+DECK_SIZE = 52
+FULL_DECK = (1 << DECK_SIZE) - 1
+SUIT_MASKS = [((1 << 13) - 1) << (13 * s) for s in range(4)]
+# J, Q, K, A of every suit (rank index 9..12).
+HIGH_MASK = sum(((1 << 4) - 1) << (13 * s + 9) for s in range(4))
+
+SUIT_INDEX: Dict[str, int] = {s: i for i, s in enumerate(ONLINE_SUITS)}
+
+# Shared wire forms; treat as read-only.
+CARD_WIRE = tuple({"suit": s, "rank": r} for s in ONLINE_SUITS for r in ONLINE_RANKS)
+CARD_KEYS = tuple(f"{r}{s}" for s in ONLINE_SUITS for r in ONLINE_RANKS)
+_KEY_TO_CARD: Dict[str, int] = {k: i for i, k in enumerate(CARD_KEYS)}
+
+
+def card_suit(card: int) -> int:
+    return card // 13
+
+
+def card_rank(card: int) -> int:
+    """Rank index: 0 = "2" ... 12 = "A"."""
+    return card % 13
+
+
+def hand_cards(mask: int) -> List[int]:
+    """Cards in a hand mask, lowest first (= sorted hand order)."""
+    out = []
+    while mask:
+        low = mask & -mask
+        out.append(low.bit_length() - 1)
+        mask ^= low
+    return out
+
+
+def lowest_card(mask: int) -> Optional[int]:
+    if not mask:
+        return None
+    return (mask & -mask).bit_length() - 1
+
+
+def hand_size(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+def legal_mask(hand: int, lead_suit: Optional[int]) -> int:
+    """Cards that may be played: the lead suit if held, otherwise anything."""
+    if lead_suit is None:
+        return hand
+    follow = hand & SUIT_MASKS[lead_suit]
+    return follow or hand
+
+
+def legal_cards(hand: int, lead_suit: Optional[int]) -> List[int]:
+    return hand_cards(legal_mask(hand, lead_suit))
+
+
+def is_legal(hand: int, lead_suit: Optional[int], card: int) -> bool:
+    return bool(legal_mask(hand, lead_suit) & (1 << card))
+
+
+# ---------- Trick resolution ----------
+def _build_trick_strength() -> List[bytes]:
+    """TRICK_STRENGTH[lead_suit][card] -> ordinal strength of card.
+
+    Trump (spades) outranks the lead suit, which outranks everything else;
+    off-suit discards are all 0 and can never win a trick.
+    """
+    rows = []
+    for lead in range(4):
+        row = bytearray(DECK_SIZE)
+        for card in range(DECK_SIZE):
+            suit = card // 13
+            if suit == TRUMP:
+                row[card] = 32 + card % 13
+            elif suit == lead:
+                row[card] = 16 + card % 13
+        rows.append(bytes(row))
+    return rows
+
+
+TRICK_STRENGTH = _build_trick_strength()
+
+
+def resolve_trick(table: List[Optional[int]], lead_suit: int) -> int:
+    """Seat index of the winning card on table (None = empty seat).
+
+    Shared by the live server, bots and simulators; one table lookup per
+    card and an argmax instead of pairwise comparisons.
+    """
+    row = TRICK_STRENGTH[lead_suit]
+    best = -1
+    winner = -1
+    for seat, card in enumerate(table):
+        if card is not None and row[card] > best:
+            best = row[card]
+            winner = seat
+    return winner
+
+
+# ---------- Wire boundary ----------
+def card_from_key(key: str) -> Optional[int]:
+    """Parse a client card key such as "10♥"; None if unknown."""
+    return _KEY_TO_CARD.get(key)
+
+
+def card_to_wire(card: Optional[int]):
+    if card is None:
+        return None
+    return CARD_WIRE[card]
+
+
+def hand_to_wire(mask: Optional[int]):
+    if mask is None:
+        return None
+    return [CARD_WIRE[c] for c in hand_cards(mask)]
+
+
+def suit_to_wire(suit: Optional[int]) -> Optional[str]:
+    if suit is None:
+        return None
+    return ONLINE_SUITS[suit]
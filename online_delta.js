@@ -0,0 +1,70 @@
+// online_delta.js
+// Versioned online state, shared by online.js and online_room.js.
+// "online_state" is a full snapshot; "online_delta" sends only what changed
+// since "base" (ops are [key, value] or [key, index, value]). If we are not
+// at "base" (missed a message, just loaded) we ask for a full snapshot instead.
+// Our private "hands" section ("online_hands") arrives just before the delta
+// it belongs to (same "v") so both render together; if the version already
+// matches there is no public change and it applies on its own.
+(() => {
+  function applyOnlineDelta(cur, ops){
+    const next = Object.assign({}, cur);
+    const fresh = {};
+    for (const op of (ops || [])){
+      const key = op[0];
+      if (op.length === 2){
+        next[key] = op[1];
+        fresh[key] = true;
+        continue;
+      }
+      if (!fresh[key]){
+        next[key] = Array.isArray(next[key]) ? next[key].slice() : [];
+        fresh[key] = true;
+      }
+      next[key][op[1]] = op[2];
+    }
+    return next;
+  }
+
+  // page.state() / page.room(): the page's current state and room code;
+  // page.apply({ room, seat, state }): render a new state (as for "online_state").
+  window.PW_attachOnlineDelta = function(socket, page){
+    let resyncPending = false;
+    let pendingHands = null;
+
+    socket.on("online_state", (payload) => {
+      resyncPending = false;
+      pendingHands = null;
+      page.apply(payload);
+    });
+
+    socket.on("online_delta", (payload) => {
+      const state = page.state();
+      if (!state || payload.room !== page.room() || state.version !== payload.base){
+        if (!resyncPending){
+          resyncPending = true;
+          socket.emit("online_resync", { room: payload.room });
+        }
+        return;
+      }
+      const next = applyOnlineDelta(state, payload.ops);
+      next.version = payload.v;
+      let seat = payload.seat;
+      if (pendingHands && pendingHands.room === payload.room && pendingHands.v === payload.v){
+        next.hands = pendingHands.hands;
+        seat = pendingHands.seat;
+      }
+      pendingHands = null;
+      page.apply({ room: payload.room, seat, state: next });
+    });
+
+    socket.on("online_hands", (payload) => {
+      const state = page.state();
+      if (state && payload.room === page.room() && state.version === payload.v){
+        page.apply({ room: payload.room, seat: payload.seat, state: Object.assign({}, state, { hands: payload.hands }) });
+        return;
+      }
+      pendingHands = payload;
+    });
+  };
+})();
@@ -0,0 +1,271 @@
+"""Piratwhist rules as plain synchronous functions over OnlineGameState.
+
+No sockets, timers or clocks: callers pass the RNG to deal with and the
+current time the animation deadlines (deal_ends_at, sweep_until) are
+measured from. app.py drives the online rooms with it and keeps the
+journal, broadcasts and timers to itself; scripts/simulate.py plays
+bot-only games with it directly.
+
+Functions that take a command return False (and change nothing) when the
+command does not apply to the current state.
+"""
+from __future__ import annotations
+
+from array import array
+from typing import Callable, List, Optional, Tuple
+
+from online_bid_table import expected_tricks
+from online_cards import HIGH_MASK, ONLINE_SUITS, SUIT_MASKS, TRUMP, card_suit, is_legal, lowest_card, resolve_trick
+from online_state import NO_BID, OnlineGameState
+
+ROUND_CARDS = [7, 6, 5, 4, 3, 2, 1, 1, 2, 3, 4, 5, 6, 7]
+LAST_ROUND = len(ROUND_CARDS) - 1
+# Client animation pacing: a dealt card, and a played trick flying in and
+# sweeping out to the winner (2 s + 2 s).
+DEAL_MS_PER_CARD = 120
+SWEEP_SECONDS = 4.0
+# Bots discard from the lowest suit symbol when void in lead and trump.
+BOT_DISCARD_ORDER = sorted(range(len(ONLINE_SUITS)), key=lambda s: ONLINE_SUITS[s])
+
+
+def points_for_round(bid: int, taken: int) -> int:
+    if bid == taken:
+        return 10 + bid
+    return -abs(taken - bid)
+
+
+def deal(n_players: int, round_index: int, rng) -> Tuple[List[int], int]:
+    """Return (hands, cards_per_effective); hands are card bitmasks.
+
+    Master rule (52-card deck):
+      cardsPer = min(requestedForRound, floor(52 / nPlayers)) (min 1)
+    """
+    requested = ROUND_CARDS[round_index]
+    cards_per = max(1, min(requested, 52 // max(1, n_players)))
+    deck = list(range(52))
+    rng.shuffle(deck)
+    hands = [0] * n_players
+    for i in range(cards_per * n_players):
+        hands[i % n_players] |= 1 << deck[i]
+    return hands, cards_per
+
+
+def max_bid(st: OnlineGameState) -> int:
+    return int(st.cards_per or ROUND_CARDS[st.round_index])
+
+
+def start_game(st: OnlineGameState, human_seats: List[int]) -> None:
+    """Leave the lobby: every seat without a human becomes a bot."""
+    # Auto-fill bots to match total players minus physical (human) players.
+    n_players = int(st.n or 0)
+    bot_seats = set(range(n_players)) - set(human_seats)
+    names = list(st.names or [])
+    if len(names) < n_players:
+        names.extend([None for _ in range(n_players - len(names))])
+    elif len(names) > n_players:
+        names = names[:n_players]
+
+    bot_index = 1
+    for seat in range(n_players):
+        if seat in bot_seats:
+            names[seat] = f"Computer {bot_index}"
+            bot_index += 1
+        else:
+            if not names[seat]:
+                names[seat] = f"Spiller {seat+1}"
+
+    st.names = names
+    st.bot_seats = bot_seats
+    st.round_index = 0
+
+
+def _deal_round(st: OnlineGameState, rng) -> None:
+    hands, cards_per = deal(st.n, st.round_index, rng)
+    st.hands = array("Q", hands)
+    st.cards_per = cards_per
+    st.reset_round()
+
+
+def start_round(st: OnlineGameState, round_index: int, rng, now: float) -> float:
+    """Deal round_index into the 'dealing' phase; return the animation's length.
+
+    The cards are dealt at once, but bidding only opens in finish_deal,
+    once clients had time to animate the deal.
+    """
+    st.round_index = round_index
+    _deal_round(st, rng)
+    # New deal id for the animation (dealSeq is derived from cardsPer).
+    st.deal_id += 1
+    st.phase = "dealing"
+    duration = max(0.8, min(8.0, (st.cards_per * st.n * DEAL_MS_PER_CARD) / 1000.0 + 0.6))
+    st.deal_ends_at = now + duration
+    return duration
+
+
+def _maybe_start_play(st: OnlineGameState) -> None:
+    # when all bids submitted -> start playing
+    if st.phase == "bidding" and st.all_bids_in():
+        st.phase = "playing"
+        st.turn = st.leader
+
+
+def bot_bids(st: OnlineGameState) -> None:
+    """Bid for every bot that has not bid yet: the tricks hands like its
+    own take on average (online_bid_table), or a rule of thumb."""
+    top = max_bid(st)
+    for seat in st.bot_seats:
+        if st.bids[seat] != NO_BID:
+            continue
+        hand = st.hands[seat]
+        expected = expected_tricks(st.n, hand, top, seat == st.leader)
+        if expected is None:
+            sp = bin(hand & SUIT_MASKS[TRUMP]).count("1")
+            hi = bin(hand & HIGH_MASK).count("1")
+            expected = (sp * 0.6) + (hi * 0.35)
+        st.bids[seat] = max(0, min(top, int(round(expected))))
+
+
+def finish_deal(st: OnlineGameState) -> None:
+    st.phase = "bidding"
+    bot_bids(st)
+    _maybe_start_play(st)
+
+
+def set_bid(st: OnlineGameState, seat: int, bid: int) -> bool:
+    if st.phase != "bidding" or st.bids[seat] != NO_BID or not 0 <= bid <= max_bid(st):
+        return False
+    st.bids[seat] = bid
+    _maybe_start_play(st)
+    return True
+
+
+def bot_card(st: OnlineGameState, seat: int) -> Optional[int]:
+    hand = st.hands[seat]
+    if not hand:
+        return None
+    lead = st.lead_suit
+    if lead is not None:
+        same = hand & SUIT_MASKS[lead]
+        if same:
+            return lowest_card(same)
+    tr = hand & SUIT_MASKS[TRUMP]
+    if tr:
+        return lowest_card(tr)
+    for suit in BOT_DISCARD_ORDER:
+        if hand & SUIT_MASKS[suit]:
+            return lowest_card(hand & SUIT_MASKS[suit])
+    return None
+
+
+def play_card(st: OnlineGameState, seat: int, card: int, now: float) -> bool:
+    """Play card for seat.
+
+    Completing a trick moves to 'between_tricks' (next_trick continues
+    after SWEEP_SECONDS), or, with the last trick, scores the round and
+    moves to 'round_finished'.
+    """
+    if st.phase != "playing" or st.turn != seat:
+        return False
+    hand = st.hands[seat]
+    if not is_legal(hand, st.lead_suit, card):
+        return False
+
+    st.hands[seat] = hand & ~(1 << card)
+    if st.lead_suit is None:
+        st.lead_suit = card_suit(card)
+    elif card_suit(card) != st.lead_suit:
+        st.voids[seat] |= 1 << st.lead_suit
+    st.played |= 1 << card
+    st.table[seat] = card
+
+    n = st.n
+    nxt = (seat + 1) % n
+    for _ in range(n):
+        if st.table[nxt] is None:
+            st.turn = nxt
+            break
+        nxt = (nxt + 1) % n
+
+    if all(c is not None for c in st.table):
+        winner = resolve_trick(st.table, st.lead_suit)
+        st.winner = winner
+        st.tricks_round[winner] += 1
+        st.tricks_total[winner] += 1
+        # Prevent the next trick from starting until the UI has finished animating.
+        st.sweep_until = now + SWEEP_SECONDS
+
+        if not any(st.hands):
+            _score_round(st)
+            st.phase = "round_finished"
+        else:
+            st.phase = "between_tricks"
+    return True
+
+
+def _score_round(st: OnlineGameState) -> None:
+    n = st.n
+    bids = [max(0, b) for b in st.bids]
+    taken = st.tricks_round.tolist()
+    points = [points_for_round(bids[i], taken[i]) for i in range(n)]
+    for i in range(n):
+        st.points_total[i] += points[i]
+    st.history.append({
+        "round": st.round_index + 1,
+        "cardsPer": max_bid(st),
+        "bids": bids,
+        "taken": taken,
+        "points": points,
+    })
+
+
+def next_trick(st: OnlineGameState) -> bool:
+    """The winner of the swept trick leads the next one."""
+    if st.phase != "between_tricks":
+        return False
+    st.clear_trick()
+    st.phase = "playing"
+    return True
+
+
+def advance_round(st: OnlineGameState) -> bool:
+    """Leave 'round_finished': finish the game after the last round, or
+    step round_index (the caller deals it). Returns whether a round follows."""
+    if st.phase != "round_finished":
+        return False
+    if st.round_index >= LAST_ROUND:
+        st.phase = "game_finished"
+        return False
+    st.round_index += 1
+    return True
+
+
+def next_step(st: OnlineGameState, deal_rng: Callable[[int], object]) -> bool:
+    """A player's "next": continue after a trick, or deal the next round
+    straight into bidding (no deal animation), or finish the game after
+    the last one. deal_rng(round) gives the RNG to shuffle a round with.
+    """
+    if st.phase == "between_tricks":
+        next_trick(st)
+    elif st.phase == "round_finished":
+        if advance_round(st):
+            _deal_round(st, deal_rng(st.round_index))
+            st.phase = "bidding"
+    else:
+        return False
+    bot_bids(st)
+    _maybe_start_play(st)
+    return True
+
+
+def takeover(st: OnlineGameState, seat: int) -> bool:
+    """A bot takes over seat for the rest of the game."""
+    if st.phase == "lobby":
+        return False
+    if seat not in st.bot_seats:
+        prev_name = st.names[seat] or f"Spiller {seat+1}"
+        st.names[seat] = f"Computer (overtog {prev_name})"
+        st.bot_seats = st.bot_seats | {seat}
+    if st.phase == "bidding":
+        bot_bids(st)
+        _maybe_start_play(st)
+    return True
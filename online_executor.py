@@ -0,0 +1,59 @@
+"""Per-room single-writer command queue for the online game.
+
+Every mutation of an online room is submitted as a command. Commands for
+one room run strictly one at a time, in submission order; commands for
+different rooms run in parallel. There is no dedicated thread per room:
+whichever thread finds the queue idle drains it, and submitters that find
+it busy return immediately and leave their command to the active writer.
+Threads that must not run commands themselves (the timer thread) post()
+instead: the command is queued in order, and an idle queue is drained by
+a thread handed out by spawn.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class RoomExecutor:
+    __slots__ = ("_lock", "_queue", "_running")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._queue: Deque[Tuple[Callable[..., Any], Tuple[Any, ...]]] = deque()
+        self._running = False
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> None:
+        with self._lock:
+            self._queue.append((fn, args))
+            if self._running:
+                return
+            self._running = True
+        self._drain()
+
+    def post(self, spawn: Callable[[Callable[[], None]], Any], fn: Callable[..., Any], *args: Any) -> None:
+        """Queue fn(*args) like submit, but never run it on this thread:
+        if the queue is idle, spawn(drain) runs it elsewhere."""
+        with self._lock:
+            self._queue.append((fn, args))
+            if self._running:
+                return
+            self._running = True
+        spawn(self._drain)
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._running = False
+                    return
+                fn, args = self._queue.popleft()
+            try:
+                fn(*args)
+            except Exception:
+                # A failing command must not wedge the room's queue.
+                log.exception("online room command %s failed", getattr(fn, "__name__", fn))
@@ -1,6 +1,7 @@
 // Piratwhist Online Lobby - 1.2.7
 (() => {
-  const socket = io();
+  const socket = io({ transports: ["websocket", "polling"] });
+  if (typeof window.PW_watchAiUrl === "function") window.PW_watchAiUrl(socket);
 
   const el = (id) => document.getElementById(id);
 
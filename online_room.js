@@ -141,6 +141,7 @@ function makeCardEl(card){
 function normalizeCode(s){ return (s || "").trim(); }
 
 const socket = io({ transports: ["websocket", "polling"] });
+if (typeof window.PW_watchAiUrl === "function") window.PW_watchAiUrl(socket);
 
 let roomCode = null;
 let autoJoinRequested = false;
@@ -157,7 +158,14 @@ socket.on("error", (data) => {
   showRoomWarn(data?.message || "Ukendt fejl");
 });
 
-socket.on("online_state", (payload) => {
+// Versioned state updates: see online_delta.js.
+window.PW_attachOnlineDelta(socket, {
+  state: () => state,
+  room: () => roomCode,
+  apply: handleOnlineState,
+});
+
+function handleOnlineState(payload){
   roomCode = payload.room;
   if (payload.seat !== null && payload.seat !== undefined) mySeat = payload.seat;
   prevState = state;
@@ -172,7 +180,7 @@ socket.on("online_state", (payload) => {
   updateAutoBotCountDisplay();
   maybeRunAnimations();
   render();
-});
+}
 
 socket.on("online_left", () => {
   roomCode = null;
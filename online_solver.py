@@ -0,0 +1,253 @@
+"""Exact solver for the last tricks of a round, with every hand known.
+
+``card_values`` gives, for each legal card of the seat to move, the round
+points that seat is sure of if it plays that card and then plays
+perfectly while every other seat plays to make it miss its bid. That
+"paranoid" view turns the n-player round into a two-sided game, which an
+alpha-beta search solves exactly. Points only take a few values, so the
+search ends fast once the remaining tricks are few.
+
+Positions at the start of a trick go into a transposition table under a
+canonical key. Ranks are renumbered among the cards still out, so
+positions that differ only in which small cards are gone share an
+entry. Seats are rotated to the seat being solved for, and the three side
+suits are sorted, since they are interchangeable. Cards next to each
+other among the cards still out are interchangeable too, and only one of
+them is searched.
+
+Bots call this on sampled deals (online_bots), hints and post-round
+analysis on real ones; it is pure Python and runs in the bot workers.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from online_cards import SUIT_MASKS, TRICK_STRENGTH, TRUMP, legal_mask, resolve_trick
+
+# Cards left in all hands together up to which bots solve sampled deals
+# (about 10 ms each), and up to which a round analysis judges plays.
+ENDGAME_CARDS = 16
+ANALYSIS_CARDS = 20
+TT_MAX = 200_000
+
+_INF = 1 << 10
+_SIDE_SUITS = [s for s in range(4) if s != TRUMP]
+_BELOW = [((1 << c) - 1) & SUIT_MASKS[c // 13] for c in range(52)]
+
+# Transposition table of this process: canonical key -> (lower, upper)
+# bounds on the value, and what it has done (see stats()).
+_TT: Dict[Tuple, Tuple[int, int]] = {}
+_STATS = {"solves": 0, "nodes": 0, "probes": 0, "hits": 0, "ns": 0}
+
+
+def round_points(bid: int, need: int) -> int:
+    """Points for a round that ended need tricks short of bid (negative: over)."""
+    return 10 + bid if need == 0 else -abs(need)
+
+
+class _Search:
+    __slots__ = ("n", "seat", "bid", "hands", "live", "on_table", "nodes", "probes", "hits")
+
+    def __init__(self, n: int, seat: int, bid: int, hands: List[int], table: List[Optional[int]]):
+        self.n = n
+        self.seat = seat
+        self.bid = bid
+        self.hands = list(hands)
+        self.on_table = 0
+        for card in table:
+            if card is not None:
+                self.on_table |= 1 << card
+        self.live = self.on_table
+        for hand in hands:
+            self.live |= hand
+        self.nodes = self.probes = self.hits = 0
+
+    def moves(self, hand: int, lead: Optional[int]) -> List[int]:
+        """Legal cards, one per run of cards adjacent among the live ones."""
+        legal = legal_mask(hand, lead)
+        live = self.live
+        out = []
+        mask = legal
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            card = low.bit_length() - 1
+            below = live & _BELOW[card]
+            if below and legal >> (below.bit_length() - 1) & 1:
+                continue
+            out.append(card)
+        return out
+
+    def key(self, turn: int, need: int, left: int) -> Tuple:
+        n, seat, hands = self.n, self.seat, self.hands
+        order = [hands[(seat + i) % n] for i in range(n)]
+        suits = []
+        for suit in range(4):
+            base = 13 * suit
+            out = (self.live >> base) & 0x1FFF
+            packed = [0] * n
+            bit = 1
+            while out:
+                low = out & -out
+                out ^= low
+                card = low << base
+                for i, hand in enumerate(order):
+                    if hand & card:
+                        packed[i] |= bit
+                        break
+                bit <<= 1
+            suits.append(tuple(packed))
+        side = sorted(suits[s] for s in _SIDE_SUITS)
+        return ((turn - seat) % n, need, self.bid, left, suits[TRUMP], *side)
+
+    def after(self, turn: int, card: int, lead: Optional[int], best: int, winner: int, played: int,
+              need: int, left: int, alpha: int, beta: int) -> int:
+        """value() once turn has played card."""
+        suit = card // 13 if lead is None else lead
+        strength = TRICK_STRENGTH[suit][card]
+        if strength > best:
+            best, winner = strength, turn
+        hand = self.hands[turn]
+        bit = 1 << card
+        self.hands[turn] = hand ^ bit
+        self.on_table |= bit
+        if played + 1 == self.n:
+            live, on_table = self.live, self.on_table
+            self.live = live & ~on_table
+            self.on_table = 0
+            v = self.value(winner, None, -1, -1, 0, need - (winner == self.seat), left - 1, alpha, beta)
+            self.live, self.on_table = live, on_table
+        else:
+            v = self.value((turn + 1) % self.n, suit, best, winner, played + 1, need, left, alpha, beta)
+        self.on_table ^= bit
+        self.hands[turn] = hand
+        return v
+
+    def value(self, turn: int, lead: Optional[int], best: int, winner: int, played: int,
+              need: int, left: int, alpha: int, beta: int) -> int:
+        """Value for seat; played cards are on the table, left tricks remain
+        (counting the current one)."""
+        self.nodes += 1
+        if played == 0:
+            if left == 0:
+                return round_points(self.bid, need)
+            key = self.key(turn, need, left)
+            self.probes += 1
+            entry = _TT.get(key)
+            if entry is not None:
+                self.hits += 1
+                lower, upper = entry
+                if lower == upper or lower >= beta:
+                    return lower
+                if upper <= alpha:
+                    return upper
+                alpha = max(alpha, lower)
+                beta = min(beta, upper)
+            alpha0, beta0 = alpha, beta
+
+        hand = self.hands[turn]
+        maximize = turn == self.seat
+        result = -_INF if maximize else _INF
+        for card in self.moves(hand, lead):
+            v = self.after(turn, card, lead, best, winner, played, need, left, alpha, beta)
+            if maximize:
+                if v > result:
+                    result = v
+                    alpha = max(alpha, v)
+            elif v < result:
+                result = v
+                beta = min(beta, v)
+            if alpha >= beta:
+                break
+
+        if played == 0:
+            if len(_TT) >= TT_MAX:
+                _TT.clear()
+            lower, upper = _TT.get(key, (-_INF, _INF))
+            if result <= alpha0:
+                upper = min(upper, result)
+            elif result >= beta0:
+                lower = max(lower, result)
+            else:
+                lower = upper = result
+            _TT[key] = (lower, upper)
+        return result
+
+
+def card_values(n: int, hands: List[int], table: List[Optional[int]], lead: Optional[int],
+                seat: int, bid: int, taken: int) -> Dict[int, int]:
+    """Points seat is sure of with each legal card; seat is to move.
+
+    hands are every seat's remaining cards (seat's included), table the
+    cards of the current trick by seat, lead its suit (None: seat leads),
+    and taken the tricks seat already has this round.
+    """
+    t0 = time.perf_counter_ns()
+    search = _Search(n, seat, bid, hands, table)
+    played = sum(card is not None for card in table)
+    best, winner = -1, -1
+    if lead is not None:
+        row = TRICK_STRENGTH[lead]
+        for s, card in enumerate(table):
+            if card is not None and row[card] > best:
+                best, winner = row[card], s
+    left = bin(hands[seat]).count("1")
+    hand = hands[seat]
+    legal = legal_mask(hand, lead)
+    values: Dict[int, int] = {}
+    for card in search.moves(hand, lead):
+        v = search.after(seat, card, lead, best, winner, played, bid - taken, left, -_INF, _INF)
+        # Cards interchangeable with this one (see _Search.moves) score the same.
+        while True:
+            values[card] = v
+            above = search.live & SUIT_MASKS[card // 13] & ~((2 << card) - 1)
+            card = (above & -above).bit_length() - 1
+            if not above or not legal >> card & 1:
+                break
+    _STATS["solves"] += 1
+    _STATS["nodes"] += search.nodes
+    _STATS["probes"] += search.probes
+    _STATS["hits"] += search.hits
+    _STATS["ns"] += time.perf_counter_ns() - t0
+    return values
+
+
+def analyse_round(n: int, hands: List[int], bids: List[int], plays: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+    """Judge the plays of a finished round against perfect play.
+
+    hands are the hands as dealt and plays the (seat, card) pairs in the
+    order played. Returns one entry per play:
+    the points the seat was sure of with the card it played ("points") and
+    with its best cards ("best", "bestPoints"); both None while more than
+    ANALYSIS_CARDS cards were out.
+    """
+    hands = list(hands)
+    table: List[Optional[int]] = [None] * n
+    lead: Optional[int] = None
+    taken = [0] * n
+    out = sum(bin(hand).count("1") for hand in hands)
+    result = []
+    for seat, card in plays:
+        entry: Dict[str, Any] = {"seat": seat, "card": card, "points": None, "best": [], "bestPoints": None}
+        if out <= ANALYSIS_CARDS:
+            values = card_values(n, hands, table, lead, seat, bids[seat], taken[seat])
+            top = max(values.values())
+            entry.update(points=values.get(card), best=sorted(c for c, v in values.items() if v == top), bestPoints=top)
+        result.append(entry)
+        hands[seat] &= ~(1 << card)
+        table[seat] = card
+        out -= 1
+        if lead is None:
+            lead = card // 13
+        if None not in table:
+            taken[resolve_trick(table, lead)] += 1
+            table = [None] * n
+            lead = None
+    return result
+
+
+def stats() -> Dict[str, int]:
+    """Counters of this process since it started (solves, nodes, table
+    probes and hits, nanoseconds)."""
+    return dict(_STATS, entries=len(_TT))
@@ -0,0 +1,301 @@
+"""Slotted room and game-state types for the online game.
+
+Per-seat numbers live in compact ``array`` buffers instead of lists of
+boxed ints, and every field is a slot instead of a dict key. Nothing here
+is sent to clients directly: ``OnlineGameState.to_public`` is the single
+place that builds the wire dict (camelCase keys, card dicts, None for
+"no bid"), and ``public_delta`` turns two of those into the ops of an
+``online_delta`` message.
+"""
+from __future__ import annotations
+
+import random
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Set
+
+from online_cards import card_to_wire, hand_to_wire, suit_to_wire
+from online_executor import RoomExecutor
+
+NO_BID = -1
+
+# Array-backed fields and their typecodes (see to_record / from_record).
+_ARRAY_FIELDS = {"hands": "Q", "bids": "b", "tricks_round": "b", "tricks_total": "b", "points_total": "i", "voids": "B"}
+
+
+class OnlineGameState:
+    __slots__ = (
+        "n",
+        "names",
+        "bot_seats",
+        "round_index",
+        "leader",
+        "turn",
+        "lead_suit",
+        "table",
+        "winner",
+        "phase",
+        "hands",
+        "bids",
+        "tricks_round",
+        "tricks_total",
+        "points_total",
+        "history",
+        # What the table has seen this round: cards played (mask) and, per
+        # seat, the suits it showed out of (bit per suit). Bots use these.
+        "played",
+        "voids",
+        # Deal animation meta
+        "deal_id",
+        "cards_per",
+        "deal_ends_at",
+        "sweep_until",
+    )
+
+    def __init__(self, n: int, names: List[Optional[str]], bot_seats: Set[int]):
+        self.n = n
+        self.names = names
+        self.bot_seats = bot_seats
+        self.round_index = 0
+        self.leader = 0
+        self.turn = 0
+        self.lead_suit: Optional[int] = None
+        self.table: List[Optional[int]] = [None] * n
+        self.winner: Optional[int] = None
+        self.phase = "lobby"
+        self.hands = array("Q", bytes(8 * n))  # card bitmasks
+        self.bids = array("b", [NO_BID] * n)
+        self.tricks_round = array("b", bytes(n))
+        self.tricks_total = array("b", bytes(n))
+        self.points_total = array("i", bytes(4 * n))
+        self.history: List[Dict[str, Any]] = []
+        self.played = 0
+        self.voids = array("B", bytes(n))
+        self.deal_id = 0
+        self.cards_per: Optional[int] = None
+        self.deal_ends_at: Optional[float] = None
+        self.sweep_until: Optional[float] = None
+
+    def reset_round(self) -> None:
+        """Clear the per-round fields before a new deal."""
+        n = self.n
+        self.leader = self.round_index % n
+        self.turn = self.leader
+        self.lead_suit = None
+        self.table = [None] * n
+        self.winner = None
+        self.bids = array("b", [NO_BID] * n)
+        self.tricks_round = array("b", bytes(n))
+        self.played = 0
+        self.voids = array("B", bytes(n))
+
+    def clear_trick(self) -> None:
+        self.leader = self.winner
+        self.turn = self.leader
+        self.lead_suit = None
+        self.table = [None] * self.n
+        self.winner = None
+        self.sweep_until = None
+
+    def trick_no(self) -> int:
+        """Number of tricks completed so far this round."""
+        return sum(self.tricks_round)
+
+    def all_bids_in(self) -> bool:
+        return NO_BID not in self.bids
+
+    def bids_to_wire(self) -> List[Optional[int]]:
+        return [None if b == NO_BID else b for b in self.bids]
+
+    def one_card_reveal(self) -> bool:
+        # Special rule: when cardsPer==1 in bidding/dealing, players see opponents' cards but not their own
+        return self.cards_per == 1 and self.phase in ("dealing", "bidding")
+
+    def hands_key(self, seat: int):
+        """Changes exactly when hands_view(seat) changes."""
+        if self.one_card_reveal():
+            return (True, seat, tuple(self.hands))
+        return (False, self.n, self.hands[seat])
+
+    def hands_view(self, seat: int, wire: Optional[Dict[int, Any]] = None) -> List[Any]:
+        """Private "hands" section for seat.
+
+        wire memoizes seat -> wire hand, so one broadcast converts every
+        hand at most once even when the cardsPer==1 rule shows each member
+        everybody else's cards.
+        """
+        if wire is None:
+            wire = {}
+        out: List[Any] = [None] * self.n
+        if self.one_card_reveal():
+            seats = [i for i in range(self.n) if i != seat]
+        else:
+            seats = [seat]
+        for i in seats:
+            hand = wire.get(i)
+            if hand is None:
+                hand = wire[i] = hand_to_wire(self.hands[i])
+            out[i] = hand
+        return out
+
+    def deal_seq(self) -> Optional[List[int]]:
+        # Deterministic seat sequence (card-by-card) for the deal animation.
+        if self.cards_per is None:
+            return None
+        n = self.n
+        return [i % n for i in range(self.cards_per * n)]
+
+    def to_record(self) -> Dict[str, Any]:
+        """Plain-JSON copy of every field, for snapshots."""
+        out: Dict[str, Any] = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, array):
+                value = value.tolist()
+            elif isinstance(value, set):
+                value = sorted(value)
+            elif isinstance(value, list):
+                value = list(value)  # history rows are never mutated
+            out[name] = value
+        return out
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "OnlineGameState":
+        st = cls(record["n"], list(record["names"]), set(record["bot_seats"]))
+        for name in cls.__slots__:
+            if name in ("n", "names", "bot_seats") or name not in record:
+                continue
+            value = record[name]
+            typecode = _ARRAY_FIELDS.get(name)
+            if typecode is not None:
+                value = array(typecode, value)
+            setattr(st, name, value)
+        return st
+
+    def to_public(self) -> Dict[str, Any]:
+        # do NOT expose other players' hands
+        return {
+            "n": self.n,
+            "names": list(self.names),
+            "roundIndex": self.round_index,
+            "leader": self.leader,
+            "turn": self.turn,
+            "leadSuit": suit_to_wire(self.lead_suit),
+            "table": [card_to_wire(c) for c in self.table],
+            "winner": self.winner,
+            "phase": self.phase,
+            "bids": self.bids_to_wire(),
+            "tricksRound": self.tricks_round.tolist(),
+            "tricksTotal": self.tricks_total.tolist(),
+            "pointsTotal": self.points_total.tolist(),
+            "history": list(self.history),
+            "botSeats": sorted(self.bot_seats),
+            # Deal animation metadata (cards themselves remain private).
+            "dealId": self.deal_id,
+            "dealSeq": self.deal_seq(),
+            "cardsPer": self.cards_per,
+        }
+
+
+def public_delta(old: Dict[str, Any], new: Dict[str, Any]) -> List[list]:
+    """Ops turning public state old into new.
+
+    ``[key, value]`` replaces a key; ``[key, index, value]`` sets one
+    element of a list (index == len appends, e.g. a new history row).
+    """
+    ops: List[list] = []
+    for key, value in new.items():
+        prev = old.get(key)
+        if prev == value:
+            continue
+        if (
+            isinstance(value, list)
+            and isinstance(prev, list)
+            and len(prev) <= len(value)
+            and (len(prev) == len(value) or key == "history")
+        ):
+            for i, item in enumerate(value):
+                if i >= len(prev) or prev[i] != item:
+                    ops.append([key, i, item])
+        else:
+            ops.append([key, value])
+    return ops
+
+
+class OnlineClient:
+    """Stable client mapping (clientId -> seat) to survive redirects/reloads."""
+
+    __slots__ = ("seat", "last_seen", "sid")
+
+    def __init__(self, seat: int, last_seen: float, sid: Optional[str] = None):
+        self.seat = seat
+        self.last_seen = last_seen
+        self.sid = sid  # socket currently attached for this client, if any
+
+
+class OnlineRoom:
+    __slots__ = (
+        "code",
+        "empty_since",
+        "members",
+        "clients",
+        "sid_to_client",
+        "state",
+        "executor",
+        "version",
+        "last_public",
+        "hands_sent",
+        "seed",
+        "started_at",
+        "journal",
+        "bot_level",
+    )
+
+    def __init__(self, code: str, state: OnlineGameState, seed: Optional[int] = None, started_at: Optional[float] = None):
+        self.code = code
+        self.empty_since: Optional[float] = None
+        self.members: Dict[str, int] = {}  # sid -> seat
+        self.clients: Dict[str, OnlineClient] = {}
+        self.sid_to_client: Dict[str, str] = {}
+        self.state = state
+        # Single writer: all mutations of this room go through here.
+        self.executor = RoomExecutor()
+        # Delta broadcasts: version of last_public, the last public state
+        # sent (tagged with "version"; doubles as the snapshot cache), and
+        # the hands_key each member's last private view had.
+        self.version = 0
+        self.last_public: Optional[Dict[str, Any]] = None
+        self.hands_sent: Dict[str, Any] = {}
+        # Deals come from the room's seed and every accepted command is
+        # appended to the journal as [ms since started_at, kind, *args], so
+        # seed + journal reproduce the game (see app.online_replay).
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.started_at = time.time() if started_at is None else started_at
+        self.journal: List[list] = []
+        self.bot_level = "basic"  # see online_bots.BOT_LEVELS
+
+    def deal_rng(self, round_index: int) -> random.Random:
+        """The shuffle source for a round; depends only on seed and round."""
+        return random.Random(self.seed * 16 + round_index)
+
+    def to_record(self) -> Dict[str, Any]:
+        """Snapshot of what outlives the sockets: state, clients, version, journal."""
+        return {
+            "code": self.code,
+            "version": self.version,
+            "clients": {cid: [c.seat, c.last_seen] for cid, c in self.clients.items()},
+            "state": self.state.to_record(),
+            "seed": self.seed,
+            "startedAt": self.started_at,
+            "journal": list(self.journal),
+            "botLevel": self.bot_level,
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "OnlineRoom":
+        room = cls(record["code"], OnlineGameState.from_record(record["state"]), record.get("seed"), record.get("startedAt"))
+        room.journal = record.get("journal", [])
+        room.bot_level = record.get("botLevel", "basic")
+        room.version = record["version"]
+        room.clients = {cid: OnlineClient(seat, last_seen) for cid, (seat, last_seen) in record["clients"].items()}
+        return room
@@ -0,0 +1,126 @@
+"""Central timer scheduler for the online game.
+
+One daemon thread sleeps on a heap of deadlines and runs whatever is due,
+so a room waiting for a bot move or an animation costs a heap entry, not a
+thread. Timers are keyed by (room code, purpose): scheduling a key again
+replaces its pending timer, and cancel_room drops all of a room's timers.
+Callbacks run on the scheduler thread and should only hand work off (the
+server queues a room command for a worker thread), never block.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+TimerKey = Tuple[str, Hashable]
+
+
+class TimerHandle:
+    __slots__ = ("key", "due", "fn", "args", "cancelled")
+
+    def __init__(self, key: TimerKey, due: float, fn: Callable[..., Any], args: Tuple[Any, ...]):
+        self.key = key
+        self.due = due
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerScheduler:
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, TimerHandle]] = []
+        self._seq = itertools.count()
+        # room code -> purpose -> pending handle
+        self._rooms: Dict[str, Dict[Hashable, TimerHandle]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, key: TimerKey, delay: float, fn: Callable[..., Any], *args: Any) -> TimerHandle:
+        code, purpose = key
+        handle = TimerHandle(key, self._clock() + max(0.0, delay), fn, args)
+        with self._cond:
+            timers = self._rooms.setdefault(code, {})
+            old = timers.get(purpose)
+            if old is not None:
+                old.cancel()
+            timers[purpose] = handle
+            heapq.heappush(self._heap, (handle.due, next(self._seq), handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="online-timers", daemon=True)
+                self._thread.start()
+            elif self._heap[0][2] is handle:
+                self._cond.notify()
+        return handle
+
+    def is_pending(self, key: TimerKey) -> bool:
+        code, purpose = key
+        with self._cond:
+            handle = self._rooms.get(code, {}).get(purpose)
+            return handle is not None and not handle.cancelled
+
+    def cancel(self, key: TimerKey) -> None:
+        code, purpose = key
+        with self._cond:
+            timers = self._rooms.get(code)
+            handle = timers.pop(purpose, None) if timers else None
+            if handle is not None:
+                handle.cancel()
+            if timers is not None and not timers:
+                del self._rooms[code]
+
+    def cancel_room(self, code: str) -> None:
+        with self._cond:
+            for handle in self._rooms.pop(code, {}).values():
+                handle.cancel()
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return sum(len(t) for t in self._rooms.values())
+
+    def _pop_due(self) -> List[TimerHandle]:
+        """Wait until something is due; return it (called with the lock held)."""
+        while True:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._cond.wait()
+                continue
+            wait = self._heap[0][0] - self._clock()
+            if wait > 0:
+                self._cond.wait(wait)
+                continue
+            due = []
+            now = self._clock()
+            while self._heap and self._heap[0][0] <= now:
+                handle = heapq.heappop(self._heap)[2]
+                if handle.cancelled:
+                    continue
+                code, purpose = handle.key
+                timers = self._rooms.get(code)
+                if timers is not None and timers.get(purpose) is handle:
+                    del timers[purpose]
+                    if not timers:
+                        del self._rooms[code]
+                due.append(handle)
+            if due:
+                return due
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                due = self._pop_due()
+            for handle in due:
+                try:
+                    handle.fn(*handle.args)
+                except Exception:
+                    log.exception("online timer %r failed", handle.key)
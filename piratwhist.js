@@ -7,6 +7,7 @@ const el = (id) => document.getElementById(id);
 const socket = io({
   transports: ["websocket", "polling"],
 });
+if (typeof window.PW_watchAiUrl === "function") window.PW_watchAiUrl(socket);
 
 let roomCode = null;
 // Connection diagnostics (Render often needs threaded worker for long-polling)
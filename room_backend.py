@@ -0,0 +1,365 @@
+"""Shared backends that let several server workers split the rooms.
+
+Room state itself never leaves the worker that owns the room: every room
+(key ``"<kind>:<code>"``) is claimed by exactly one worker, and events for
+it that arrive on another worker are forwarded to the owner. A backend
+only provides what the workers must share for that:
+
+* a directory of room owners (``claim`` / ``owner`` / ``release``), and
+* a publish/subscribe bus (``publish`` / ``listen``), used both for
+  forwarded events and, through BackendManager, as the Socket.IO message
+  queue that delivers emits to sockets connected to other workers.
+
+Implementations: MemoryBackend (one process; today's behaviour),
+SQLiteBackend (workers on one host sharing a database file) and
+RespBackend (any server speaking the Redis protocol, e.g. Redis itself or
+scripts/fake_resp_server.py). ``make_backend`` picks one from a URL.
+
+``listen`` never ends: when the bus connection fails it reconnects (with
+backoff) and subscribes again. Messages published meanwhile are lost, as
+with any Redis pub/sub subscriber.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import socketio
+
+log = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """Everything in this process; only valid with a single worker."""
+
+    shared = False
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._owners: Dict[str, str] = {}
+        self._subscribers: Dict[str, List[queue.Queue]] = {}
+
+    def claim(self, key: str, worker: str) -> str:
+        with self._lock:
+            return self._owners.setdefault(key, worker)
+
+    def owner(self, key: str) -> Optional[str]:
+        return self._owners.get(key)
+
+    def release(self, key: str, worker: str) -> None:
+        with self._lock:
+            if self._owners.get(key) == worker:
+                del self._owners[key]
+
+    def publish(self, channel: str, data: str) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for q in subscribers:
+            q.put(data)
+
+    def listen(self, channel: str) -> Iterator[str]:
+        q: queue.Queue = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(q)
+        while True:
+            yield q.get()
+
+
+class SQLiteBackend:
+    """Workers on one host sharing a SQLite file (WAL mode).
+
+    The bus is a table that listeners poll for rows newer than the last one
+    they saw; rows older than MESSAGE_TTL seconds are pruned.
+    """
+
+    shared = True
+    POLL_INTERVAL = 0.02
+    MESSAGE_TTL = 30.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS owners (key TEXT PRIMARY KEY, worker TEXT NOT NULL)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, data TEXT NOT NULL, at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, id)")
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread (and so per forked worker).
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def claim(self, key: str, worker: str) -> str:
+        db = self._db()
+        db.execute("INSERT OR IGNORE INTO owners (key, worker) VALUES (?, ?)", (key, worker))
+        return db.execute("SELECT worker FROM owners WHERE key = ?", (key,)).fetchone()[0]
+
+    def owner(self, key: str) -> Optional[str]:
+        row = self._db().execute("SELECT worker FROM owners WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def release(self, key: str, worker: str) -> None:
+        self._db().execute("DELETE FROM owners WHERE key = ? AND worker = ?", (key, worker))
+
+    def publish(self, channel: str, data: str) -> None:
+        now = time.time()
+        db = self._db()
+        db.execute("INSERT INTO messages (channel, data, at) VALUES (?, ?, ?)", (channel, data, now))
+        if int(now) % 10 == 0:
+            db.execute("DELETE FROM messages WHERE at < ?", (now - self.MESSAGE_TTL,))
+
+    def listen(self, channel: str) -> Iterator[str]:
+        db = self._db()
+        last = db.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        while True:
+            try:
+                rows = db.execute(
+                    "SELECT id, data FROM messages WHERE channel = ? AND id > ? ORDER BY id", (channel, last)
+                ).fetchall()
+            except sqlite3.Error:
+                log.exception("room bus %s: poll failed", channel)
+                rows = []
+                time.sleep(1.0)
+            for last, data in rows:
+                yield data
+            if not rows:
+                time.sleep(self.POLL_INTERVAL)
+
+
+class _RespConnection:
+    """Minimal Redis-protocol (RESP2) client connection."""
+
+    def __init__(self, host: str, port: int, db: int = 0):
+        self._sock = socket.create_connection((host, port))
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        self._lock = threading.Lock()
+        if db:
+            self.command("SELECT", db)
+
+    def send(self, *args) -> None:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self._sock.sendall(b"".join(out))
+
+    def read(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("RESP connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            return self._file.read(size + 2)[:-2].decode()
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self.read() for _ in range(size)]
+        raise RuntimeError(f"bad RESP reply {line!r}")
+
+    def command(self, *args):
+        with self._lock:
+            self.send(*args)
+            return self.read()
+
+    def close(self) -> None:
+        try:
+            self._file.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class RespBackend:
+    """Backend on a Redis-protocol server (redis://host:port/db).
+
+    Owner keys expire after OWNER_TTL seconds unless the worker holding them
+    refreshes them (a thread does, every third of that), so the rooms of a
+    worker that died are no longer forwarded to it. Release and refresh
+    only touch a key that still names the worker, checked and changed in
+    one transaction (WATCH / MULTI / EXEC).
+    """
+
+    shared = True
+    RECONNECT_DELAY = 0.5  # first retry of a lost subscription; doubles up to RECONNECT_MAX
+    RECONNECT_MAX = 10.0
+    OWNER_TTL = 30.0
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self._local = threading.local()
+        self._owned: Dict[str, str] = {}  # key -> worker, the owner keys this process refreshes
+        self._owned_lock = threading.Lock()
+        self._refresher_pid = 0
+
+    def _connection(self) -> _RespConnection:
+        # One connection per thread (and so per forked worker), as SQLiteBackend.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = _RespConnection(self.host, self.port, self.db)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _command(self, *args):
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                return conn.command(*args)
+            except OSError:
+                # Dropped by the server (restart, idle timeout): one new connection.
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def _if_owner(self, key: str, worker: str, *args) -> bool:
+        """Run the command args if worker owns key, atomically; whether it ran."""
+        name = "owner:" + key
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                while True:
+                    conn.command("WATCH", name)
+                    if conn.command("GET", name) != worker:
+                        conn.command("UNWATCH")
+                        return False
+                    conn.command("MULTI")
+                    conn.command(*args)
+                    if conn.command("EXEC") is not None:
+                        return True
+                    # The key changed between GET and EXEC: look again.
+            except OSError:
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        return False
+
+    def claim(self, key: str, worker: str) -> str:
+        ttl_ms = int(self.OWNER_TTL * 1000)
+        while True:
+            if self._command("SET", "owner:" + key, worker, "NX", "PX", ttl_ms) == "OK":
+                self._keep(key, worker)
+                return worker
+            owner = self._command("GET", "owner:" + key)
+            if owner is not None:  # else it expired just now: claim again
+                return owner
+
+    def owner(self, key: str) -> Optional[str]:
+        return self._command("GET", "owner:" + key)
+
+    def release(self, key: str, worker: str) -> None:
+        with self._owned_lock:
+            self._owned.pop(key, None)
+        self._if_owner(key, worker, "DEL", "owner:" + key)
+
+    def _keep(self, key: str, worker: str) -> None:
+        with self._owned_lock:
+            self._owned[key] = worker
+            if self._refresher_pid != os.getpid():
+                self._refresher_pid = os.getpid()
+                threading.Thread(target=self._refresh_owners, name="room-owners", daemon=True).start()
+
+    def _refresh_owners(self) -> None:
+        ttl_ms = int(self.OWNER_TTL * 1000)
+        while True:
+            time.sleep(self.OWNER_TTL / 3)
+            with self._owned_lock:
+                owned = list(self._owned.items())
+            for key, worker in owned:
+                try:
+                    kept = self._if_owner(key, worker, "PEXPIRE", "owner:" + key, ttl_ms)
+                except (OSError, RuntimeError):
+                    log.exception("room owners: refresh failed")
+                    break
+                if not kept:
+                    with self._owned_lock:
+                        if self._owned.get(key) != worker:
+                            continue  # released meanwhile
+                        del self._owned[key]
+                    log.warning("room %s: owner key lost (expired or taken)", key)
+
+    def publish(self, channel: str, data: str) -> None:
+        self._command("PUBLISH", channel, data)
+
+    def listen(self, channel: str) -> Iterator[str]:
+        delay = self.RECONNECT_DELAY
+        while True:
+            conn = None
+            try:
+                conn = _RespConnection(self.host, self.port, self.db)
+                conn.send("SUBSCRIBE", channel)
+                while True:
+                    reply = conn.read()
+                    if isinstance(reply, list) and reply and reply[0] == "message":
+                        yield reply[2]
+                    elif isinstance(reply, list) and reply and reply[0] == "subscribe":
+                        delay = self.RECONNECT_DELAY
+            except (OSError, RuntimeError, ValueError) as e:
+                log.warning("room bus %s: %s; subscribing again in %.1fs", channel, e, delay)
+            finally:
+                if conn is not None:
+                    conn.close()
+            time.sleep(delay)
+            delay = min(delay * 2, self.RECONNECT_MAX)
+
+
+def make_backend(url: str):
+    """memory (default), sqlite:///path/file.db, or redis://host:port/db."""
+    url = (url or "memory").strip()
+    if url == "memory":
+        return MemoryBackend()
+    if url.startswith("sqlite:"):
+        path = url[len("sqlite:"):].lstrip("/")
+        if url.startswith("sqlite:////"):
+            path = "/" + path
+        return SQLiteBackend(path or "piratwhist_rooms.db")
+    if url.startswith(("redis://", "resp://")):
+        return RespBackend(url)
+    raise ValueError(f"unknown room backend {url!r}")
+
+
+class BackendManager(socketio.PubSubManager):
+    """Socket.IO message queue on a room backend's bus."""
+
+    name = "roombackend"
+
+    def __init__(self, backend, channel: str = "socketio", write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.backend = backend
+
+    def _publish(self, data):
+        self.backend.publish(self.channel, json.dumps(data))
+
+    def _listen(self):
+        yield from self.backend.listen(self.channel)
@@ -0,0 +1,141 @@
+"""Room code allocation in O(1).
+
+Codes are fixed-length strings over an alphabet. Instead of drawing random
+codes and retrying while they collide (which slows down as the code space
+fills up and never ends once it is full), each code length has a pool that
+deals out a random permutation of its code space with a sparse
+Fisher-Yates shuffle: only swapped positions are stored, so a pool of a
+billion codes costs nothing until it is used. Released codes go back into
+the undealt part of the pool and can be drawn again. A code reserved by
+name is still undealt: drawing it later only takes it out of the pool, and
+releasing it before that leaves the pool as it is.
+
+When every code of the current length is taken, ``allocate`` returns None
+(the caller reports "server full"), or, if ``max_length`` allows it, opens
+a pool one character longer. Occupancy is available from ``stats``.
+"""
+from __future__ import annotations
+
+import random
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+
+class _CodePool:
+    __slots__ = ("alphabet", "length", "size", "free", "swapped")
+
+    def __init__(self, alphabet: str, length: int):
+        self.alphabet = alphabet
+        self.length = length
+        self.size = len(alphabet) ** length
+        # Positions [0, free) of the permutation are undealt.
+        self.free = self.size
+        self.swapped: Dict[int, int] = {}
+
+    def draw(self, rng) -> int:
+        i = rng.randrange(self.free)
+        self.free -= 1
+        last = self.free
+        value = self.swapped.pop(i, i)
+        if i != last:
+            self.swapped[i] = self.swapped.pop(last, last)
+        else:
+            self.swapped.pop(last, None)
+        return value
+
+    def put_back(self, value: int) -> None:
+        if value != self.free:
+            self.swapped[self.free] = value
+        self.free += 1
+
+    def encode(self, value: int) -> str:
+        base = len(self.alphabet)
+        out = []
+        for _ in range(self.length):
+            value, d = divmod(value, base)
+            out.append(self.alphabet[d])
+        return "".join(reversed(out))
+
+    def decode(self, code: str) -> int:
+        base = len(self.alphabet)
+        value = 0
+        for ch in code:
+            value = value * base + self.alphabet.index(ch)
+        return value
+
+
+class RoomCodeAllocator:
+    def __init__(self, alphabet: str, length: int, max_length: Optional[int] = None, rng=random):
+        self.alphabet = alphabet
+        self.length = length
+        self.max_length = max(length, max_length or length)
+        self._rng = rng
+        self._lock = threading.Lock()
+        self._pools: List[_CodePool] = [_CodePool(alphabet, length)]
+        self._in_use: Set[str] = set()
+        self._undealt: Set[str] = set()  # reserved codes still in their pool
+
+    def allocate(self) -> Optional[str]:
+        """A free code, shortest length first; None when the space is full."""
+        with self._lock:
+            while True:
+                pool = next((p for p in self._pools if p.free), None)
+                if pool is None:
+                    top = self._pools[-1].length
+                    if top >= self.max_length:
+                        return None
+                    pool = _CodePool(self.alphabet, top + 1)
+                    self._pools.append(pool)
+                code = pool.encode(pool.draw(self._rng))
+                # A code reserved before it was dealt just leaves the pool here.
+                if code not in self._in_use:
+                    break
+                self._undealt.discard(code)
+            self._in_use.add(code)
+            return code
+
+    def reserve(self, code: str) -> bool:
+        """Mark a specific code as in use (e.g. a room restored at startup)."""
+        if not self.is_valid(code):
+            return False
+        with self._lock:
+            while len(code) > self._pools[-1].length:
+                self._pools.append(_CodePool(self.alphabet, self._pools[-1].length + 1))
+            if code in self._in_use:
+                return False
+            # Codes not in use are all in the undealt part of their pool.
+            self._in_use.add(code)
+            self._undealt.add(code)
+            return True
+
+    def release(self, code: str) -> None:
+        with self._lock:
+            if code not in self._in_use:
+                return
+            self._in_use.discard(code)
+            if code in self._undealt:
+                self._undealt.discard(code)  # never left the pool
+                return
+            pool = self._pools[len(code) - self.length]
+            pool.put_back(pool.decode(code))
+
+    def is_valid(self, code: str) -> bool:
+        """Whether code has the shape of a code this allocator can hand out."""
+        return (
+            self.length <= len(code) <= self.max_length
+            and all(ch in self.alphabet for ch in code)
+        )
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._in_use
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            capacity = sum(p.size for p in self._pools)
+            return {
+                "inUse": len(self._in_use),
+                "capacity": capacity,
+                "occupancy": len(self._in_use) / capacity,
+                "length": self._pools[-1].length,
+                "maxLength": self.max_length,
+            }
@@ -0,0 +1,153 @@
+"""Expiry and eviction of in-memory rooms.
+
+One RoomLifecycle covers every room registry of the server (the scorecard
+``rooms`` and the online ``ONLINE_ROOMS``). Each registry is registered as a
+*kind* with its own idle TTL, an ``is_idle(code)`` check and an
+``evict(code)`` callback; the registries themselves stay plain dicts.
+
+* Expiry: a min-heap holds one live deadline per room (``_due`` names it;
+  other heap entries of the room are stale and skipped). ``touch`` only
+  records the activity time, and ``sweep`` pops due deadlines, re-pushing
+  those whose room was touched since (or is not idle), so purging costs
+  amortized O(log n) per room instead of a scan of every room.
+* Cap: with ``max_rooms`` set, ``make_room`` evicts the least recently
+  used idle rooms (any kind) before a new room is admitted. Rooms are kept
+  in an LRU order; one found in use moves to the back, so each admission
+  looks at a few rooms, at most ``CAP_PROBES``, and refuses if none of
+  them can be evicted. ``is_idle`` is never called under the lock.
+* Counts: ``stats`` reports live rooms and evictions per kind and reason.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+log = logging.getLogger(__name__)
+
+RoomRef = Tuple[str, str]  # (kind, code)
+
+CAP_PROBES = 32
+
+
+class _Kind(NamedTuple):
+    ttl: float
+    is_idle: Callable[[str], bool]
+    evict: Callable[[str], None]
+
+
+class RoomLifecycle:
+    def __init__(self, max_rooms: int = 0, clock: Callable[[], float] = time.time):
+        self.max_rooms = max_rooms  # 0 = no cap
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._kinds: Dict[str, _Kind] = {}
+        # Least recently used first: ref -> last activity.
+        self._last: "OrderedDict[RoomRef, float]" = OrderedDict()
+        self._heap: List[Tuple[float, RoomRef]] = []
+        self._due: Dict[RoomRef, float] = {}  # ref -> deadline of its live heap entry
+        self._evictions: Dict[str, Dict[str, int]] = {}
+
+    def register(self, kind: str, ttl: float, is_idle: Callable[[str], bool], evict: Callable[[str], None]) -> None:
+        self._kinds[kind] = _Kind(ttl, is_idle, evict)
+        self._evictions[kind] = {"expired": 0, "cap": 0}
+
+    def touch(self, kind: str, code: str) -> None:
+        """Record activity in a room (and start tracking it if new)."""
+        ref = (kind, code)
+        now = self._clock()
+        with self._lock:
+            if ref not in self._last:
+                self._schedule(ref, now + self._kinds[kind].ttl)
+            self._last[ref] = now
+            self._last.move_to_end(ref)
+
+    def forget(self, kind: str, code: str) -> None:
+        """The room was removed by its owner; its heap entry lapses on pop."""
+        with self._lock:
+            self._last.pop((kind, code), None)
+            self._due.pop((kind, code), None)
+
+    def _schedule(self, ref: RoomRef, deadline: float) -> None:
+        """Make deadline ref's live heap entry (lock held)."""
+        if self._due.get(ref) != deadline:
+            self._due[ref] = deadline
+            heapq.heappush(self._heap, (deadline, ref))
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def sweep(self) -> int:
+        """Evict every idle room whose TTL has run out; return how many."""
+        now = self._clock()
+        due: List[RoomRef] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, ref = heapq.heappop(self._heap)
+                if self._due.get(ref) != deadline:
+                    continue  # stale: forgotten, evicted or rescheduled
+                del self._due[ref]
+                last = self._last.get(ref)
+                if last is None:
+                    continue
+                ttl = self._kinds[ref[0]].ttl
+                if last + ttl > now:
+                    self._schedule(ref, last + ttl)
+                else:
+                    due.append(ref)
+        return sum(self._evict(ref, "expired", now) for ref in due)
+
+    def make_room(self) -> bool:
+        """Make space for one more room under max_rooms; False if full."""
+        if not self.max_rooms:
+            return True
+        self.sweep()
+        now = self._clock()
+        for _ in range(CAP_PROBES):
+            with self._lock:
+                if len(self._last) < self.max_rooms:
+                    return True
+                if not self._last:
+                    return False
+                ref = next(iter(self._last))  # least recently used
+            if self._evict(ref, "cap", now):
+                continue
+            with self._lock:
+                if ref in self._last:
+                    self._last.move_to_end(ref)  # in use: look at it last next time
+        with self._lock:
+            return len(self._last) < self.max_rooms
+
+    def _evict(self, ref: RoomRef, reason: str, now: float) -> bool:
+        kind, code = ref
+        spec = self._kinds[kind]
+        if not spec.is_idle(code):
+            # An expired room's heap entry was just popped; a room looked at
+            # for the cap still has its own.
+            if reason == "expired":
+                with self._lock:
+                    if ref in self._last:
+                        self._schedule(ref, now + spec.ttl)
+            return False
+        with self._lock:
+            if self._last.pop(ref, None) is None:
+                return False
+            self._due.pop(ref, None)
+            self._evictions[kind][reason] += 1
+        spec.evict(code)
+        log.info("evicted %s room %s (%s)", kind, code, reason)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            live: Dict[str, int] = {kind: 0 for kind in self._kinds}
+            for kind, _ in self._last:
+                live[kind] += 1
+            return {
+                "maxRooms": self.max_rooms,
+                "rooms": live,
+                "evictions": {kind: dict(counts) for kind, counts in self._evictions.items()},
+            }
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Measure room snapshot cost: per-action overhead and warm-restart time.
+
+Builds --rooms online rooms in mid-game state, snapshots each of them
+--actions times through room_snapshots.SnapshotLog (as the server does
+after every broadcast), then restores them from the log the way app.py
+does at startup.
+
+    python scripts/bench_snapshots.py --rooms 10000
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from online_state import OnlineClient, OnlineGameState, OnlineRoom  # noqa: E402
+from room_snapshots import SnapshotLog  # noqa: E402
+
+
+def make_room(code: str, n: int) -> OnlineRoom:
+    st = OnlineGameState(n, [f"Spiller {i+1}" for i in range(n)], set(range(1, n)))
+    deck = random.sample(range(52), 7 * n)
+    for i, card in enumerate(deck):
+        st.hands[i % n] |= 1 << card
+    st.phase = "playing"
+    st.round_index = 6
+    st.cards_per = 7
+    st.bids = st.bids.__class__("b", [random.randint(0, 7) for _ in range(n)])
+    for r in range(6):
+        st.history.append({"round": r + 1, "cardsPer": 7 - r, "bids": [1] * n, "taken": [1] * n, "points": [11] * n})
+    room = OnlineRoom(code, st)
+    room.clients["client-0"] = OnlineClient(0, time.time())
+    return room
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rooms", type=int, default=10000)
+    ap.add_argument("--players", type=int, default=4)
+    ap.add_argument("--actions", type=int, default=5, help="snapshots per room")
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "rooms.snap")
+    rooms = [make_room(f"{i:05d}", args.players) for i in range(args.rooms)]
+
+    snaps = SnapshotLog(path)
+    snaps.load()
+    snaps.start()
+    t0 = time.perf_counter()
+    for _ in range(args.actions):
+        for room in rooms:
+            room.version += 1
+            snaps.put("online", room.code, room.to_record(), time.perf_counter_ns())
+    hot = time.perf_counter() - t0
+    snaps.flush(60)
+    total = time.perf_counter() - t0
+    stats = snaps.stats()
+    puts = args.rooms * args.actions
+    print(f"snapshot per action: {hot / puts * 1e6:.1f} us on the caller's thread ({puts} actions)")
+    print(
+        f"writer: {stats['batches']} batches, {stats['frames']} frames, fsync {stats['fsyncMsAvg']} ms/batch, "
+        f"all on disk after {total:.2f} s; log {os.path.getsize(path) / 1024:.0f} KiB"
+    )
+
+    t0 = time.perf_counter()
+    restored = {}
+    gc.disable()
+    for (kind, code), record in SnapshotLog(path).load().items():
+        restored[code] = OnlineRoom.from_record(record)
+    gc.enable()
+    print(f"restore: {len(restored)} rooms in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
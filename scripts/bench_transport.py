@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Compare Socket.IO long-polling and WebSocket on a local server.
+
+Starts the app under gunicorn (as in the Procfile) once per mode, connects
+--clients online clients that each create a room, and times --events
+round trips of online_resync -> online_state per client. Prints per-event
+latency and the server's thread count with all clients connected.
+
+Needs the python-socketio client extras (requests, websocket-client):
+
+    pip install "python-socketio[client]"
+    python scripts/bench_transport.py --clients 20 --events 50
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import socketio
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def thread_count(pid: int):
+    """Threads of pid and its children (Linux /proc); None elsewhere."""
+    total = 0
+    try:
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/status") as f:
+                    status = dict(line.split(":", 1) for line in f if ":" in line)
+            except OSError:
+                continue
+            if int(entry) == pid or int(status.get("PPid", "0")) == pid:
+                total += int(status["Threads"])
+    except OSError:
+        return None
+    return total
+
+
+def wait_for_server(url: str, timeout: float = 15.0) -> None:
+    import urllib.request
+
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            urllib.request.urlopen(url + "/socket.io/?EIO=4&transport=polling", timeout=1).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def run_client(url: str, transport: str, events: int, latencies: list, ready: threading.Barrier, done: threading.Event):
+    sio = socketio.Client()
+    got = threading.Event()
+    room = {}
+
+    @sio.on("online_state")
+    def on_state(payload):
+        room["code"] = payload["room"]
+        got.set()
+
+    sio.connect(url, transports=[transport])
+    sio.emit("online_create_room", {"name": "Bench", "players": 2, "bots": 1})
+    got.wait(10)
+    for _ in range(events):
+        got.clear()
+        t0 = time.perf_counter()
+        sio.emit("online_resync", {"room": room["code"]})
+        if got.wait(10):
+            latencies.append(time.perf_counter() - t0)
+    ready.wait()
+    done.wait()
+    sio.disconnect()
+
+
+def bench(mode: str, clients: int, events: int) -> dict:
+    port = free_port()
+    env = dict(os.environ, SOCKETIO_MODE=mode)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", "1", "-k", "gthread", "--threads", "100",
+         "-b", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_for_server(url)
+        idle_threads = thread_count(server.pid)
+        latencies: list = []
+        ready = threading.Barrier(clients + 1)
+        done = threading.Event()
+        transport = "polling" if mode == "polling" else "websocket"
+        workers = [
+            threading.Thread(target=run_client, args=(url, transport, events, latencies, ready, done), daemon=True)
+            for _ in range(clients)
+        ]
+        t0 = time.perf_counter()
+        for w in workers:
+            w.start()
+        ready.wait(120)
+        elapsed = time.perf_counter() - t0
+        busy_threads = thread_count(server.pid)
+        done.set()
+        for w in workers:
+            w.join(10)
+    finally:
+        server.terminate()
+        server.wait(10)
+    latencies.sort()
+    ms = [x * 1000 for x in latencies]
+    return {
+        "mode": mode,
+        "clients": clients,
+        "events": len(ms),
+        "elapsedS": round(elapsed, 2),
+        "latencyMs": {
+            "median": round(statistics.median(ms), 2) if ms else None,
+            "p95": round(ms[int(len(ms) * 0.95) - 1], 2) if ms else None,
+            "max": round(ms[-1], 2) if ms else None,
+        },
+        "serverThreads": {"idle": idle_threads, "connected": busy_threads},
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--clients", type=int, default=10)
+    ap.add_argument("--events", type=int, default=50, help="round trips per client")
+    ap.add_argument("--modes", default="polling,websocket")
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    results = [bench(mode, args.clients, args.events) for mode in args.modes.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        lat = r["latencyMs"]
+        threads = r["serverThreads"]
+        print(
+            f"{r['mode']:>9}: {r['events']} events, median {lat['median']} ms, p95 {lat['p95']} ms, "
+            f"max {lat['max']} ms; server threads {threads['idle']} idle / {threads['connected']} connected"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Tiny in-memory Redis-protocol server for trying the resp room backend.
+
+Supports just what room_backend.RespBackend uses: PING, SELECT, SET (NX,
+PX), GET, DEL, PEXPIRE, WATCH / UNWATCH / MULTI / EXEC, PUBLISH and
+SUBSCRIBE. Not for production.
+
+    python scripts/fake_resp_server.py --port 6390
+    ROOM_BACKEND=redis://127.0.0.1:6390/0 WEB_CONCURRENCY=4 gunicorn -k gthread --threads 100 app:app
+"""
+from __future__ import annotations
+
+import argparse
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+STORE: Dict[bytes, bytes] = {}
+EXPIRES: Dict[bytes, float] = {}  # key -> monotonic deadline
+VERSIONS: Dict[bytes, int] = {}  # key -> writes so far, for WATCH
+SUBSCRIBERS: Dict[bytes, Set["Handler"]] = {}
+LOCK = threading.Lock()
+
+
+def encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(v) for v in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def touch(key: bytes) -> None:
+    VERSIONS[key] = VERSIONS.get(key, 0) + 1
+
+
+def expire_due(key: bytes) -> None:
+    deadline = EXPIRES.get(key)
+    if deadline is not None and deadline <= time.monotonic():
+        del EXPIRES[key]
+        STORE.pop(key, None)
+        touch(key)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.watched: Dict[bytes, int] = {}
+        self.queued: Optional[List[Tuple[bytes, List[bytes]]]] = None  # set inside MULTI
+
+    def send(self, data: bytes) -> None:
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def read_command(self) -> List[bytes]:
+        line = self.rfile.readline()
+        if not line:
+            return []
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self):
+        try:
+            while True:
+                args = self.read_command()
+                if not args:
+                    return
+                self.send(self.run(args[0].upper(), args[1:]))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with LOCK:
+                for subs in SUBSCRIBERS.values():
+                    subs.discard(self)
+
+    def run_key(self, cmd: bytes, args: List[bytes]) -> Optional[bytes]:
+        """Commands on keys (LOCK held); None for any other command."""
+        if cmd not in (b"SET", b"GET", b"DEL", b"PEXPIRE"):
+            return None
+        for key in args[:1] if cmd != b"DEL" else args:
+            expire_due(key)
+        if cmd == b"SET":
+            key, value = args[0], args[1]
+            opts = [a.upper() for a in args[2:]]
+            if b"NX" in opts and key in STORE:
+                return encode(None)
+            STORE[key] = value
+            EXPIRES.pop(key, None)
+            if b"PX" in opts:
+                EXPIRES[key] = time.monotonic() + int(args[2 + opts.index(b"PX") + 1]) / 1000
+            touch(key)
+            return encode("OK")
+        if cmd == b"GET":
+            return encode(STORE.get(args[0]))
+        if cmd == b"DEL":
+            removed = 0
+            for k in args:
+                if STORE.pop(k, None) is not None:
+                    EXPIRES.pop(k, None)
+                    touch(k)
+                    removed += 1
+            return encode(removed)
+        if cmd == b"PEXPIRE":
+            if args[0] not in STORE:
+                return encode(0)
+            EXPIRES[args[0]] = time.monotonic() + int(args[1]) / 1000
+            touch(args[0])
+            return encode(1)
+        return None
+
+    def run_transaction(self, cmd: bytes, args: List[bytes]) -> Optional[bytes]:
+        """WATCH / UNWATCH / MULTI / EXEC and queueing (LOCK held)."""
+        if cmd == b"WATCH":
+            for key in args:
+                expire_due(key)
+                self.watched[key] = VERSIONS.get(key, 0)
+            return encode("OK")
+        if cmd == b"UNWATCH":
+            self.watched = {}
+            return encode("OK")
+        if cmd == b"MULTI":
+            self.queued = []
+            return encode("OK")
+        if cmd == b"EXEC":
+            queued, self.queued = self.queued or [], None
+            for key in self.watched:
+                expire_due(key)
+            changed = any(VERSIONS.get(k, 0) != v for k, v in self.watched.items())
+            self.watched = {}
+            if changed:
+                return b"*-1\r\n"
+            replies = [self.run_key(c, a) or b"-ERR unknown command\r\n" for c, a in queued]
+            return b"*%d\r\n" % len(replies) + b"".join(replies)
+        if self.queued is not None:
+            self.queued.append((cmd, args))
+            return encode("QUEUED")
+        return None
+
+    def run(self, cmd: bytes, args: List[bytes]) -> bytes:
+        with LOCK:
+            reply = self.run_transaction(cmd, args)
+            if reply is None:
+                reply = self.run_key(cmd, args)
+            if reply is not None:
+                return reply
+            if cmd == b"PING":
+                return encode("PONG")
+            if cmd == b"SELECT":
+                return encode("OK")
+            if cmd == b"PUBLISH":
+                subs = list(SUBSCRIBERS.get(args[0], ()))
+            elif cmd == b"SUBSCRIBE":
+                for channel in args:
+                    SUBSCRIBERS.setdefault(channel, set()).add(self)
+                return b"".join(encode([b"subscribe", ch, i + 1]) for i, ch in enumerate(args))
+            else:
+                return b"-ERR unknown command\r\n"
+        # PUBLISH: deliver outside the store lock.
+        message = encode([b"message", args[0], args[1]])
+        for sub in subs:
+            try:
+                sub.send(message)
+            except OSError:
+                pass
+        return encode(len(subs))
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6390)
+    args = ap.parse_args()
+    with Server((args.host, args.port), Handler) as server:
+        print(f"fake RESP server on {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Regenerate online_bid_table.bin: expected tricks per hand bucket.
+
+For every player count (2-8) and hand size (1-7 cards, as far as 52
+cards go round) this deals --deals random games at once as NumPy arrays
+and plays them out trick by trick with a vectorized greedy policy: lead
+your strongest card, otherwise win as cheaply as you can or throw your
+lowest card. Each seat's tricks are then averaged per hand bucket (see
+online_bid_table), and buckets seen fewer than --min-samples times are
+left unknown.
+
+Needs NumPy (not a server dependency):
+
+    pip install numpy
+    python scripts/gen_bid_table.py --deals 200000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import online_bid_table as bt  # noqa: E402
+from online_cards import TRUMP  # noqa: E402
+
+
+def simulate(n: int, cards: int, deals: int, rng: np.random.Generator):
+    """(bucket sums of tricks, bucket counts) over deals random games."""
+    decks = rng.permuted(np.tile(np.arange(52, dtype=np.int8), (deals, 1)), axis=1)
+    # Card i of the deal goes to seat i % n, as in online_engine.deal.
+    hands = decks[:, : n * cards].reshape(deals, cards, n).transpose(0, 2, 1)
+    suit = hands // 13
+    rank = hands % 13
+    trump = suit == TRUMP
+    # Strength when led (and for trumps whatever was led); off-suit is 0.
+    own_strength = np.where(trump, 32 + rank, 16 + rank)
+
+    rows = np.arange(deals)
+    alive = np.ones(hands.shape, dtype=bool)
+    tricks = np.zeros((deals, n), dtype=np.int16)
+    leader = np.zeros(deals, dtype=np.int64)  # seat 0 leads the first trick
+    for _ in range(cards):
+        winner = leader.copy()
+        best = np.zeros(deals, dtype=np.int64)
+        lead_suit = None
+        for k in range(n):
+            seat = (leader + k) % n
+            live = alive[rows, seat]
+            s_suit = suit[rows, seat]
+            s_rank = rank[rows, seat]
+            if k == 0:
+                choice = np.where(live, own_strength[rows, seat], -1).argmax(1)
+                lead_suit = s_suit[rows, choice]
+                strength = own_strength[rows, seat, choice]
+            else:
+                follow = live & (s_suit == lead_suit[:, None])
+                legal = np.where(follow.any(1)[:, None], follow, live)
+                card_strength = np.where(
+                    s_suit == TRUMP, 32 + s_rank, np.where(s_suit == lead_suit[:, None], 16 + s_rank, 0)
+                )
+                winning = legal & (card_strength > best[:, None])
+                cheapest_win = np.where(winning, card_strength, 99).argmin(1)
+                lowest = np.where(legal, s_rank + 13 * (s_suit == TRUMP), 99).argmin(1)
+                choice = np.where(winning.any(1), cheapest_win, lowest)
+                strength = card_strength[rows, choice]
+            wins = strength > best
+            best = np.where(wins, strength, best)
+            winner = np.where(wins, seat, winner)
+            alive[rows, seat, choice] = False
+        tricks[rows, winner] += 1
+        leader = winner
+
+    buckets = (
+        (((trump.sum(2) * bt.HIGH_TRUMP_COUNTS + (trump & (rank >= 9)).sum(2)) * bt.SIDE_ACE_COUNTS
+          + (~trump & (rank == 12)).sum(2)) * bt.SIDE_KING_COUNTS
+         + (~trump & (rank == 11)).sum(2)) * 2
+        + (np.arange(n) == 0)[None, :]
+    )
+    sums = np.bincount(buckets.ravel(), weights=tricks.ravel(), minlength=bt.BUCKETS)
+    counts = np.bincount(buckets.ravel(), minlength=bt.BUCKETS)
+    return sums, counts
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--deals", type=int, default=200000, help="games per (players, cards)")
+    ap.add_argument("--chunk", type=int, default=50000, help="games simulated per NumPy batch")
+    ap.add_argument("--min-samples", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=2024)
+    ap.add_argument("--out", default=bt.TABLE_PATH)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    cells = np.full((bt.MAX_PLAYERS - bt.MIN_PLAYERS + 1, bt.MAX_CARDS, bt.BUCKETS), bt.UNKNOWN, dtype=np.uint8)
+    t0 = time.perf_counter()
+    for n in range(bt.MIN_PLAYERS, bt.MAX_PLAYERS + 1):
+        for cards in range(1, min(bt.MAX_CARDS, 52 // n) + 1):
+            t1 = time.perf_counter()
+            sums = np.zeros(bt.BUCKETS)
+            counts = np.zeros(bt.BUCKETS, dtype=np.int64)
+            for start in range(0, args.deals, args.chunk):
+                s, c = simulate(n, cards, min(args.chunk, args.deals - start), rng)
+                sums += s
+                counts += c
+            known = counts >= args.min_samples
+            means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+            cells[n - bt.MIN_PLAYERS, cards - 1] = np.where(known, np.rint(means * bt.SCALE), bt.UNKNOWN)
+            print(f"{n} players, {cards} cards: {known.sum()} buckets, {time.perf_counter() - t1:.1f} s", flush=True)
+    bt.write_table(args.out, cells.tobytes())
+    print(f"wrote {args.out} ({os.path.getsize(args.out)} bytes) in {time.perf_counter() - t0:.0f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""Load-test the online game with simulated tables of python-socketio clients.
+
+Starts the app under gunicorn (as in the Procfile), or uses --url, and
+runs --tables tables of --humans clients each (the other seats are bots)
+through the real protocol: online_create_room, online_join_room,
+online_start_game, online_set_bid, online_play_card and online_next.
+Clients keep their view up to date from online_state / online_delta /
+online_hands like the browser does. An action's latency is the time from
+the emit to the first update that shows it.
+
+Tables start evenly over --ramp seconds and play games back to back
+until --duration is up. Once per second the harness samples the server's
+RSS and thread count (Linux /proc) and the p95 latency of that second,
+so the timeline shows at how many tables lag sets in. The full result
+goes to --out as JSON, for comparing releases.
+
+    pip install "python-socketio[client]"
+    python scripts/loadtest.py --tables 100 --humans 2 --duration 120 --out loadtest.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import socketio
+
+from bench_transport import ROOT_DIR, free_port, wait_for_server
+
+ACTION_TIMEOUT = 10.0
+# The server ignores "next" until a trick has swept to its winner (4 s).
+SWEEP_SECONDS = 4.2
+
+
+def percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return round(ordered[max(0, int(len(ordered) * p + 0.5) - 1)], 2)
+
+    return {"count": len(ordered), "p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": round(ordered[-1], 2)}
+
+
+def process_stats(pid: int) -> Tuple[Optional[float], Optional[int]]:
+    """(RSS in MiB, threads) of pid and its children; (None, None) without /proc."""
+    rss_kb = threads = 0
+    try:
+        entries = [e for e in os.listdir("/proc") if e.isdigit()]
+    except OSError:
+        return None, None
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/status") as f:
+                status = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        if int(entry) == pid or int(status.get("PPid", "0")) == pid:
+            rss_kb += int(status.get("VmRSS", "0 kB").split()[0])
+            threads += int(status["Threads"])
+    return round(rss_kb / 1024, 1), threads
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.recent: List[float] = []  # latencies since the last timeline sample
+        self.counts: Counter = Counter()  # emits, messages, games, resyncs, ...
+        self.timeouts: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    def latency(self, kind: str, seconds: float) -> None:
+        ms = seconds * 1000
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(ms)
+            self.recent.append(ms)
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.counts[key] += n
+
+    def take_recent(self) -> List[float]:
+        with self.lock:
+            recent, self.recent = self.recent, []
+        return recent
+
+
+def apply_delta(view: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """online_delta ops on top of view (see online_state.public_delta)."""
+    out = dict(view)
+    copied = set()
+    for op in payload["ops"]:
+        key = op[0]
+        if len(op) == 2:
+            out[key] = op[1]
+            copied.add(key)
+            continue
+        if key not in copied:
+            out[key] = list(out.get(key) or [])
+            copied.add(key)
+        if op[1] == len(out[key]):
+            out[key].append(op[2])
+        else:
+            out[key][op[1]] = op[2]
+    out["version"] = payload["v"]
+    return out
+
+
+class Player:
+    """One simulated browser: a Socket.IO client and its view of the room."""
+
+    def __init__(self, url: str, transport: str, stats: Stats, name: str):
+        self.url = url
+        self.transport = transport
+        self.stats = stats
+        self.name = name
+        self.client_id = f"load-{random.getrandbits(64):016x}"
+        self.lock = threading.Lock()
+        self.code: Optional[str] = None
+        self.seat: Optional[int] = None
+        self.view: Optional[Dict[str, Any]] = None
+        self.early_hands: Optional[Dict[str, Any]] = None
+        self.phase_since = time.perf_counter()
+        # (kind, emitted at, predicate on self) of the action in flight.
+        self.pending: Optional[Tuple[str, float, Callable[["Player"], bool]]] = None
+        self.ready_at: Optional[float] = None  # think time before the next action
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on("online_state", self._on_state)
+        self.sio.on("online_delta", self._on_delta)
+        self.sio.on("online_hands", self._on_hands)
+        self.sio.on("error", self._on_error)
+
+    def connect(self) -> None:
+        self.sio.connect(self.url, transports=[self.transport], wait_timeout=ACTION_TIMEOUT)
+
+    def close(self) -> None:
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+    def act(self, kind: str, event: str, payload: Dict[str, Any], done: Callable[["Player"], bool]) -> None:
+        with self.lock:
+            self.pending = (kind, time.perf_counter(), done)
+            self.ready_at = None
+        self.stats.count("emits")
+        self.sio.emit(event, payload)
+
+    # --- incoming ---
+    def _set_view(self, view: Dict[str, Any]) -> None:
+        # Call with self.lock held.
+        if self.view is None or self.view.get("phase") != view.get("phase"):
+            self.phase_since = time.perf_counter()
+        self.view = view
+        pending = self.pending
+        if pending is not None and pending[2](self):
+            self.stats.latency(pending[0], time.perf_counter() - pending[1])
+            self.pending = None
+
+    def _on_state(self, payload):
+        self.stats.count("messages")
+        with self.lock:
+            self.code = payload["room"]
+            if payload.get("seat") is not None:
+                self.seat = payload["seat"]
+            self.early_hands = None
+            self._set_view(dict(payload["state"]))
+
+    def _on_delta(self, payload):
+        self.stats.count("messages")
+        with self.lock:
+            if self.view is None or self.view.get("version") != payload["base"]:
+                resync = self.code
+            else:
+                resync = None
+                view = apply_delta(self.view, payload)
+                hands = self.early_hands
+                if hands is not None and hands["v"] == payload["v"]:
+                    view["hands"] = hands["hands"]
+                self.early_hands = None
+                self._set_view(view)
+        if resync:
+            self.stats.count("resyncs")
+            self.sio.emit("online_resync", {"room": resync})
+
+    def _on_hands(self, payload):
+        self.stats.count("messages")
+        with self.lock:
+            self.seat = payload["seat"]
+            if self.view is not None and self.view.get("version") == payload["v"]:
+                self._set_view(dict(self.view, hands=payload["hands"]))
+            else:
+                self.early_hands = payload  # arrives just before its delta
+
+    def _on_error(self, payload):
+        self.stats.count("messages")
+        with self.stats.lock:
+            self.stats.errors[(payload or {}).get("message", "?")] += 1
+
+    # --- decisions ---
+    def step(self, host: bool, all_human: bool, think: float) -> None:
+        """Take this player's next action if it is its turn to act."""
+        now = time.perf_counter()
+        with self.lock:
+            view, seat, pending = self.view, self.seat, self.pending
+            if pending is not None:
+                if now - pending[1] > ACTION_TIMEOUT:
+                    self.stats.timeouts[pending[0]] += 1
+                    self.pending = None
+                return
+            if view is None or seat is None:
+                return
+            phase = view["phase"]
+            if phase == "bidding" and view["bids"][seat] is None:
+                action = "bid"
+            elif phase == "playing" and view["turn"] == seat and view["table"][seat] is None:
+                action = "play"
+            elif host and all_human and phase == "between_tricks" and now - self.phase_since >= SWEEP_SECONDS:
+                action = "next"
+            elif host and all_human and phase == "round_finished":
+                action = "next"
+            else:
+                self.ready_at = None
+                return
+            if self.ready_at is None:
+                self.ready_at = now + think * random.random()
+            if now < self.ready_at:
+                return
+        code = self.code
+        if action == "bid":
+            bid = random.randint(0, int(view.get("cardsPer") or 1))
+            self.act("bid", "online_set_bid", {"room": code, "bid": bid}, lambda p: p.view["bids"][p.seat] is not None)
+        elif action == "play":
+            hand = (view.get("hands") or [None] * view["n"])[seat] or []
+            lead = view.get("leadSuit")
+            legal = [c for c in hand if c["suit"] == lead] or hand
+            if not legal:
+                return
+            card = random.choice(legal)
+            self.act(
+                "play", "online_play_card", {"room": code, "card": f"{card['rank']}{card['suit']}"},
+                lambda p: p.view["table"][p.seat] is not None or p.view["phase"] != "playing",
+            )
+        else:
+            self.act("next", "online_next", {"room": code}, lambda p, was=phase: p.view["phase"] != was)
+
+
+def wait_done(players: List[Player], stop: threading.Event, timeout: float = ACTION_TIMEOUT) -> bool:
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end and not stop.is_set():
+        if all(p.pending is None for p in players):
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def play_game(players: List[Player], args, stats: Stats, stop: threading.Event) -> None:
+    host = players[0]
+    for p in players:
+        p.connect()
+    host.act("create", "online_create_room", {
+        "name": host.name, "players": args.players, "bots": 0, "clientId": host.client_id,
+    }, lambda p: p.code is not None)
+    if not wait_done([host], stop):
+        raise RuntimeError("create timed out")
+    for p in players[1:]:
+        p.act("join", "online_join_room", {"room": host.code, "name": p.name, "clientId": p.client_id},
+              lambda p: p.view is not None and p.seat is not None)
+    if not wait_done(players, stop):
+        raise RuntimeError("join timed out")
+    host.act("start", "online_start_game", {"room": host.code}, lambda p: p.view["phase"] != "lobby")
+    all_human = args.humans == args.players
+    while not stop.is_set():
+        for i, p in enumerate(players):
+            p.step(i == 0, all_human, args.think)
+        if all(p.view and p.view["phase"] == "game_finished" for p in players):
+            stats.count("games")
+            return
+        time.sleep(0.02)
+
+
+def run_table(index: int, args, url: str, stats: Stats, stop: threading.Event) -> None:
+    while not stop.is_set():
+        players = [Player(url, args.transport, stats, f"T{index}P{i + 1}") for i in range(args.humans)]
+        try:
+            play_game(players, args, stats, stop)
+        except Exception as e:
+            with stats.lock:
+                stats.errors[f"client: {type(e).__name__}: {e}"] += 1
+            time.sleep(1)
+        finally:
+            for p in players:
+                p.close()
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--tables", type=int, default=50)
+    ap.add_argument("--players", type=int, default=4, help="seats per table")
+    ap.add_argument("--humans", type=int, default=2, help="simulated clients per table; the other seats are bots")
+    ap.add_argument("--duration", type=float, default=60.0, help="seconds of load after the ramp starts")
+    ap.add_argument("--ramp", type=float, default=10.0, help="seconds over which tables are started")
+    ap.add_argument("--think", type=float, default=0.5, help="max random think time per action, seconds")
+    ap.add_argument("--transport", choices=["websocket", "polling"], default="websocket")
+    ap.add_argument("--url", help="use a running server instead of starting one")
+    ap.add_argument("--server-pid", type=int, help="with --url: pid to sample RSS/threads from")
+    ap.add_argument("--workers", type=int, default=1, help="gunicorn workers when starting the server")
+    ap.add_argument("--threads", type=int, default=100, help="gunicorn threads per worker")
+    ap.add_argument("--out", default=f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    args = ap.parse_args()
+    if not 2 <= args.players <= 8 or not 1 <= args.humans <= args.players:
+        ap.error("need 2-8 --players and 1..players --humans")
+
+    server = None
+    url, pid = args.url, args.server_pid
+    if url is None:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-k", "gthread", "--threads", str(args.threads),
+             "-b", f"127.0.0.1:{port}", "app:app"],
+            cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        url, pid = f"http://127.0.0.1:{port}", server.pid
+    stats = Stats()
+    stop = threading.Event()
+    timeline: List[Dict[str, Any]] = []
+    try:
+        wait_for_server(url)
+        rss_start, threads_start = process_stats(pid) if pid else (None, None)
+        tables: List[threading.Thread] = []
+        t0 = time.perf_counter()
+        last_counts = Counter()
+        while True:
+            elapsed = time.perf_counter() - t0
+            if elapsed >= args.duration:
+                break
+            due = args.tables if args.ramp <= 0 else min(args.tables, int(args.tables * elapsed / args.ramp) + 1)
+            while len(tables) < due:
+                t = threading.Thread(target=run_table, args=(len(tables), args, url, stats, stop), daemon=True)
+                t.start()
+                tables.append(t)
+            time.sleep(1.0)
+            rss, threads = process_stats(pid) if pid else (None, None)
+            recent = percentiles(stats.take_recent())
+            with stats.lock:
+                counts = Counter(stats.counts)
+            timeline.append({
+                "t": round(time.perf_counter() - t0, 1),
+                "tables": len(tables),
+                "actions": recent["count"],
+                "p95Ms": recent["p95"],
+                "emits": counts["emits"] - last_counts["emits"],
+                "messages": counts["messages"] - last_counts["messages"],
+                "rssMb": rss,
+                "threads": threads,
+            })
+            last_counts = counts
+        stop.set()
+        run_seconds = time.perf_counter() - t0
+        for t in tables:
+            t.join(ACTION_TIMEOUT)
+        rss_end, threads_end = process_stats(pid) if pid else (None, None)
+    finally:
+        stop.set()
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+    all_latencies = [ms for values in stats.latencies.values() for ms in values]
+    samples = [s for s in timeline if s["rssMb"] is not None]
+    result = {
+        "tool": "scripts/loadtest.py",
+        "format": 1,
+        "startedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - run_seconds)),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "seconds": round(run_seconds, 1),
+        "latencyMs": {"all": percentiles(all_latencies), **{k: percentiles(v) for k, v in sorted(stats.latencies.items())}},
+        "throughput": {
+            "clientEmitsPerSec": round(stats.counts["emits"] / run_seconds, 1),
+            "serverMessagesPerSec": round(stats.counts["messages"] / run_seconds, 1),
+        },
+        "server": {
+            "rssMb": {"start": rss_start, "peak": max((s["rssMb"] for s in samples), default=None), "end": rss_end},
+            "threads": {"start": threads_start, "peak": max((s["threads"] for s in samples), default=None), "end": threads_end},
+        },
+        "gamesFinished": stats.counts["games"],
+        "resyncs": stats.counts["resyncs"],
+        "timeouts": dict(stats.timeouts),
+        "errors": dict(stats.errors),
+        "timeline": timeline,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    lat = result["latencyMs"]["all"]
+    print(f"{args.tables} tables x {args.humans} clients, {result['seconds']} s -> {args.out}")
+    print(f"latency ms: p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}  ({lat['count']} actions)")
+    for kind, p in result["latencyMs"].items():
+        if kind != "all":
+            print(f"  {kind:>6}: p50 {p['p50']}  p95 {p['p95']}  p99 {p['p99']}  ({p['count']})")
+    print(f"emits/s {result['throughput']['clientEmitsPerSec']}, server messages/s {result['throughput']['serverMessagesPerSec']}")
+    srv = result["server"]
+    print(f"server RSS {srv['rssMb']['start']} -> peak {srv['rssMb']['peak']} MiB, threads {srv['threads']['start']} -> peak {srv['threads']['peak']}")
+    if result["timeouts"] or result["errors"]:
+        print(f"timeouts {result['timeouts']}, errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Replay an online game from its seed and command journal.
+
+Takes the JSON from GET /admin/rooms/<code>/journal (or a room record
+from the snapshot log), rebuilds the game with app.online_replay and
+prints where it ended. A journal that no longer replays the same way,
+e.g. after a change to the bot logic, names the first entry that diverged.
+
+    curl -s "$HOST/admin/rooms/1234/journal?token=$ADMIN_TOKEN" > game.json
+    python scripts/replay_game.py game.json --repeat 100
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop("SNAPSHOT_PATH", None)  # replaying must not restore or touch live rooms
+
+import app  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("journal", help="journal JSON file, - for stdin")
+    ap.add_argument("--repeat", type=int, default=1, help="replay this many times and report the rate")
+    args = ap.parse_args()
+
+    if args.journal == "-":
+        record = json.load(sys.stdin)
+    else:
+        with open(args.journal, encoding="utf-8") as f:
+            record = json.load(f)
+
+    t0 = time.perf_counter()
+    try:
+        for _ in range(args.repeat):
+            room = app.online_replay(record)
+    except ValueError as e:
+        sys.exit(f"replay diverged: {e}")
+    elapsed = time.perf_counter() - t0
+
+    st = room.state
+    actions = len(record["journal"]) * args.repeat
+    print(f"room {record['code']} seed {record['seed']}: {len(record['journal'])} commands")
+    print(f"phase {st.phase}, round {st.round_index + 1}, {len(st.history)} rounds scored")
+    for seat in range(st.n):
+        print(f"  {st.names[seat] or f'Plads {seat + 1}'}: {st.points_total[seat]} point")
+    print(f"{actions} actions in {elapsed:.3f} s ({actions / elapsed:.0f} actions/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Play all-bot Piratwhist games on online_engine across a process pool.
+
+Reports games/sec, the distribution of final scores (overall and per
+seat) and how often bids were met, per number of cards dealt. Games are
+seeded seed, seed+1, ..., shuffled exactly like a room with that seed, so
+any game can be replayed on its own. --mc-seat lets one seat play with
+the Monte Carlo bot (online_bots) against the basic bots, to measure it.
+
+    python scripts/simulate.py --games 20000 --players 4 --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import online_bots  # noqa: E402
+import online_engine  # noqa: E402
+from online_state import OnlineGameState, OnlineRoom  # noqa: E402
+
+
+def play_game(n_players: int, seed: int, mc_seat: Optional[int] = None, mc_budget: float = 0.0) -> OnlineGameState:
+    """One all-bot game, start to finish; the engine's clock stays at 0."""
+    room = OnlineRoom("sim", OnlineGameState(n_players, [None] * n_players, set()), seed, 0.0)
+    st = room.state
+    online_engine.start_game(st, [])
+    online_engine.start_round(st, 0, room.deal_rng(0), 0.0)
+    while st.phase != "game_finished":
+        if st.phase == "dealing":
+            online_engine.finish_deal(st)
+        elif st.phase == "playing":
+            if st.turn == mc_seat:
+                card, _ = online_bots.choose_card(online_bots.bot_view(st, st.turn), mc_budget, seed ^ st.played)
+            else:
+                card = online_engine.bot_card(st, st.turn)
+            online_engine.play_card(st, st.turn, card, 0.0)
+        elif st.phase == "between_tricks":
+            online_engine.next_trick(st)
+        elif online_engine.advance_round(st):
+            online_engine.start_round(st, st.round_index, room.deal_rng(st.round_index), 0.0)
+    return st
+
+
+def play_batch(args: Tuple[int, int, int, Optional[int], float]) -> Dict[str, Any]:
+    """Play count games from first_seed on; return their condensed results."""
+    n_players, first_seed, count, mc_seat, mc_budget = args
+    scores: List[List[int]] = []
+    bids: Counter = Counter()  # cards dealt -> bids made
+    met: Counter = Counter()  # cards dealt -> bids met
+    for seed in range(first_seed, first_seed + count):
+        st = play_game(n_players, seed, mc_seat, mc_budget)
+        scores.append(st.points_total.tolist())
+        for row in st.history:
+            bids[row["cardsPer"]] += n_players
+            met[row["cardsPer"]] += sum(b == t for b, t in zip(row["bids"], row["taken"]))
+    return {"scores": scores, "bids": bids, "met": met}
+
+
+def _summary(values: List[int]) -> Dict[str, float]:
+    q = statistics.quantiles(values, n=20) if len(values) > 1 else values * 19
+    return {
+        "mean": round(statistics.fmean(values), 2),
+        "stdev": round(statistics.pstdev(values), 2),
+        "min": min(values),
+        "p5": q[0],
+        "median": statistics.median(values),
+        "p95": q[-1],
+        "max": max(values),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--games", type=int, default=10000)
+    ap.add_argument("--players", type=int, default=4)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=None, help="seed of the first game (default: random)")
+    ap.add_argument("--batch", type=int, default=200, help="games per task sent to a worker")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    ap.add_argument("--mc-seat", type=int, help="seat (1-based) played by the Monte Carlo bot")
+    ap.add_argument("--mc-budget", type=float, default=0.02, help="Monte Carlo seconds per card")
+    args = ap.parse_args()
+    if not 2 <= args.players <= 8:
+        ap.error("--players must be 2-8")
+    mc_seat = None if args.mc_seat is None else args.mc_seat - 1
+
+    first = random.getrandbits(48) if args.seed is None else args.seed
+    tasks = [
+        (args.players, first + start, min(args.batch, args.games - start), mc_seat, args.mc_budget)
+        for start in range(0, args.games, args.batch)
+    ]
+    t0 = time.perf_counter()
+    scores: List[List[int]] = []
+    bids: Counter = Counter()
+    met: Counter = Counter()
+    with Pool(args.workers) as pool:
+        for result in pool.imap_unordered(play_batch, tasks):
+            scores.extend(result["scores"])
+            bids.update(result["bids"])
+            met.update(result["met"])
+    elapsed = time.perf_counter() - t0
+
+    wins = Counter()
+    for row in scores:
+        top = max(row)
+        wins.update(seat for seat, points in enumerate(row) if points == top)
+    report = {
+        "games": len(scores),
+        "players": args.players,
+        "mcSeat": args.mc_seat,
+        "workers": args.workers,
+        "firstSeed": first,
+        "seconds": round(elapsed, 3),
+        "gamesPerSec": round(len(scores) / elapsed, 1),
+        "score": _summary([p for row in scores for p in row]),
+        "scoreBySeat": [_summary([row[seat] for row in scores]) for seat in range(args.players)],
+        "winShareBySeat": [round(wins[seat] / len(scores), 3) for seat in range(args.players)],
+        "bidAccuracy": round(sum(met.values()) / sum(bids.values()), 3),
+        "bidAccuracyByCards": {cards: round(met[cards] / bids[cards], 3) for cards in sorted(bids)},
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['games']} games ({args.players} players, {args.workers} workers, seeds from {first})")
+    print(f"{elapsed:.2f} s, {report['gamesPerSec']} games/s")
+    s = report["score"]
+    print(f"final score: mean {s['mean']} sd {s['stdev']}  min {s['min']} p5 {s['p5']} median {s['median']} p95 {s['p95']} max {s['max']}")
+    for seat, (s, share) in enumerate(zip(report["scoreBySeat"], report["winShareBySeat"])):
+        print(f"  seat {seat + 1}: mean {s['mean']:7.2f}  sd {s['stdev']:6.2f}  wins {share:.1%}")
+    print(f"bids met: {report['bidAccuracy']:.1%}")
+    for cards, accuracy in report["bidAccuracyByCards"].items():
+        print(f"  {cards} cards: {accuracy:.1%}")
+
+
+if __name__ == "__main__":
+    main()
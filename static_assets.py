@@ -0,0 +1,398 @@
+"""Static files served from memory: precompressed, ETagged, hashed URLs.
+
+AssetCache scans the served tree once at startup and keeps every web
+asset (by extension, up to max_bytes each) in memory, together with a
+gzip version and, when the optional ``brotli`` package is installed, a
+brotli version of each file that compression shrinks. Each asset gets a
+strong ETag from a hash of its content. It can also be fetched under a
+content-hashed name (``online.3f2a9c1b04e7.js``), whose content never
+changes; those responses may be cached as ``immutable`` for a year, while
+plain names are revalidated with the ETag. Conditional and Range requests
+are answered from memory (Response.make_conditional) without a stat or an
+open. Paths the cache does not hold are left to the caller, which sends
+them from disk as before.
+
+HTML pages are rewritten once, at scan time, to load those hashed URLs.
+Runs of adjacent local scripts (or stylesheets) are also joined into one
+bundle (``bundle.<hash>.js``), served under its hash only, so a page
+needs fewer requests. A script is only bundled when that cannot change
+what it does: a plain ``<script src>`` tag whose file is one function
+expression called at once (``(() => { ... })();``), so it declares no
+global names and has no prologue of its own. Each script of a bundle runs
+in a try block that rethrows its error asynchronously, so, as with
+separate tags, an error in one is reported (window "error") and the
+scripts after it still run. manifest() lists what was built.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from flask import Response, request
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+# What counts as a web asset. JSON stays on disk: global_ai_url.json is
+# rewritten while the server runs.
+ASSET_EXTENSIONS = {
+    ".html", ".js", ".css", ".svg", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico",
+    ".wav", ".mp3", ".ogg", ".woff", ".woff2", ".txt", ".webmanifest",
+}
+SKIP_DIRS = {"__pycache__", "scripts", "ai-backend-template", "node_modules"}
+# Bodies worth compressing; images and compressed audio only get bigger.
+COMPRESSIBLE = re.compile(r"^(text/|application/(javascript|json|manifest\+json)|image/svg|image/x-icon|audio/(x-)?wav)")
+MAX_ASSET_BYTES = 4 * 1024 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# online.<12 hex digits>.js -> online.js
+_HASHED = re.compile(r"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[^./]+)?$")
+# Tags of an HTML page that load an asset, and their attributes.
+_TAG = re.compile(r"<script\b(?P<script>[^>]*)>\s*</script>|<link\b(?P<link>[^>]*?)\s*/?>", re.I)
+_ATTR = re.compile(r'([a-zA-Z-]+)\s*=\s*"([^"]*)"')
+# Comments, strings, regex literals and brackets of a script, for _is_iife.
+_JS_TOKEN = re.compile(r"""/\*.*?\*/|//[^\n]*|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`|[()\[\]{}]|[\w$]+|\S""", re.S)
+_JS_REGEX = re.compile(r"/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*")
+_JS_CLOSE = {")": "(", "]": "[", "}": "{"}
+# A "/" after these (or first) starts a regex literal, elsewhere it divides.
+_JS_BEFORE_REGEX = set("(,=:[!&|?{};+-*%<>~^") | {"return", "typeof", "case", "in", "of", "void", "delete"}
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+class Asset:
+    __slots__ = ("path", "mimetype", "mtime", "digest", "bodies", "immutable")
+
+    def __init__(self, path: str, mimetype: str, mtime: float, data: bytes, immutable: bool = False):
+        self.path = path
+        self.mimetype = mimetype
+        self.mtime = mtime
+        self.digest = _digest(data)
+        # Content-Encoding -> body; "identity" is the file as is.
+        self.bodies: Dict[str, bytes] = {"identity": data}
+        # Bundles exist under their hashed name only.
+        self.immutable = immutable
+
+    def etag(self, encoding: str) -> str:
+        return self.digest if encoding == "identity" else f"{self.digest}-{encoding}"
+
+    def hashed_path(self) -> str:
+        if self.immutable:
+            return self.path
+        stem, ext = os.path.splitext(self.path)
+        return f"{stem}.{self.digest}{ext}"
+
+
+class _Ref:
+    """One asset tag of a page."""
+    __slots__ = ("start", "end", "kind", "attr", "path", "bundle")
+
+    def __init__(self, match: "re.Match[str]", page: str, assets: Dict[str, Asset]):
+        self.start, self.end = match.span()
+        self.kind = "js" if match.group("script") is not None else "css"
+        attrs_text = match.group("script") if self.kind == "js" else match.group("link")
+        attrs = {k.lower(): v for k, v in _ATTR.findall(attrs_text)}
+        plain = not _ATTR.sub("", attrs_text).strip()  # no bare attributes (defer, async)
+        self.attr = "src" if self.kind == "js" else "href"
+        self.path = _local_path(page, attrs.get(self.attr), assets)
+        if self.kind == "js":
+            self.bundle = plain and set(attrs) == {"src"}
+        else:
+            # Relative url()s in a bundle resolve from the root.
+            self.bundle = (plain and attrs.get("rel", "").lower() == "stylesheet"
+                           and set(attrs) == {"rel", "href"} and self.path is not None and "/" not in self.path)
+        self.bundle = self.bundle and self.path is not None
+
+
+def _local_path(page: str, url: Optional[str], assets: Dict[str, Asset]) -> Optional[str]:
+    """The cached asset url names, seen from page; None for anything else."""
+    if not url or "//" in url or ":" in url or "?" in url or "#" in url:
+        return None
+    if url.startswith("/"):
+        path = url.lstrip("/")
+    else:
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(page), url))
+    return path if path in assets else None
+
+
+def _is_iife(text: str) -> bool:
+    """Whether a script is only expression statements in parentheses, as
+    immediately called functions are: "(" ... ")" ["()"] [";"], comments
+    aside. It then declares no global names.
+
+    Brackets are matched outside comments, strings and regex literals. A
+    script this rough scan misreads looks unbalanced and is simply not
+    bundled.
+    """
+    tokens: List[str] = []
+    at = 0
+    while True:
+        match = _JS_TOKEN.search(text, at)
+        if match is None:
+            break
+        tok = match.group()
+        if tok == "/" and (not tokens or tokens[-1] in _JS_BEFORE_REGEX):
+            match = _JS_REGEX.match(text, match.start()) or match
+            tok = "/regex/"
+        at = match.end()
+        if not tok.startswith(("//", "/*")):
+            tokens.append(tok)
+    stack: List[str] = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i] != "(":
+            return False
+        for j in range(i, len(tokens)):
+            tok = tokens[j]
+            if tok in "([{":
+                stack.append(tok)
+            elif tok in _JS_CLOSE:
+                if not stack or stack.pop() != _JS_CLOSE[tok]:
+                    return False
+                if not stack:
+                    break
+        else:
+            return False
+        # The parentheses closed: the call and a ";" may follow.
+        i = j + 1
+        if tokens[i:i + 2] == ["(", ")"]:
+            i += 2
+        if tokens[i:i + 1] == [";"]:
+            i += 1
+    return bool(tokens)
+
+
+class AssetCache:
+    def __init__(self, root: str, max_bytes: int = MAX_ASSET_BYTES, bundle: bool = True):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.bundle = bundle
+        self._assets: Dict[str, Asset] = {}
+        self._manifest: Dict[str, Dict] = {"assets": {}, "bundles": {}, "pages": {}}
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "notModified": 0, "partial": 0, "gzip": 0, "br": 0, "bytesSent": 0}
+        self.scan_seconds = 0.0
+
+    def scan(self) -> None:
+        """Load (again) every asset under root; call before serving."""
+        t0 = time.perf_counter()
+        assets: Dict[str, Asset] = {}
+        pages: Dict[str, Tuple[float, bytes]] = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d not in SKIP_DIRS)
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1].lower() not in ASSET_EXTENSIONS:
+                    continue
+                full = os.path.join(dirpath, name)
+                path = os.path.relpath(full, self.root).replace(os.sep, "/")
+                try:
+                    if os.path.getsize(full) > self.max_bytes:
+                        continue
+                    with open(full, "rb") as f:
+                        data = f.read()
+                    mtime = os.path.getmtime(full)
+                except OSError:
+                    log.exception("asset %s unreadable", path)
+                    continue
+                if name.lower().endswith(".html"):
+                    pages[path] = (mtime, data)  # rewritten below, once all assets are known
+                    continue
+                mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                assets[path] = Asset(path, mimetype, mtime, data)
+        manifest = {"assets": {p: a.hashed_path() for p, a in assets.items()}, "bundles": {}, "pages": {}}
+        bundles: Dict[str, Asset] = {}
+        for path, (mtime, data) in pages.items():
+            try:
+                html = data.decode("utf-8")
+            except UnicodeDecodeError:
+                html = None
+            if html is not None:
+                html, urls = self._rewrite(path, html, assets, bundles, manifest["bundles"])
+                data = html.encode("utf-8")
+                manifest["pages"][path] = urls
+            assets[path] = Asset(path, "text/html", mtime, data)
+            manifest["assets"][path] = assets[path].hashed_path()
+        assets.update(bundles)
+        for asset in assets.values():
+            if COMPRESSIBLE.match(asset.mimetype):
+                self._compress(asset)
+        self._assets = assets
+        self._manifest = manifest
+        self.scan_seconds = time.perf_counter() - t0
+
+    def _rewrite(self, page: str, html: str, assets: Dict[str, Asset], bundles: Dict[str, Asset],
+                 members: Dict[str, List[str]]) -> Tuple[str, List[str]]:
+        """page's html loading hashed URLs and bundles, and the URLs it loads."""
+        refs = [_Ref(m, page, assets) for m in _TAG.finditer(html)]
+        refs = [r for r in refs if r.path is not None]
+        # Runs of bundleable tags of one kind with only whitespace between them.
+        runs: List[List[_Ref]] = []
+        for ref in refs:
+            ref.bundle = self.bundle and ref.bundle and self._bundleable(assets[ref.path])
+            run = runs[-1] if runs else None
+            if (ref.bundle and run and run[-1].bundle and run[-1].kind == ref.kind
+                    and not html[run[-1].end:ref.start].strip()):
+                run.append(ref)
+                continue
+            runs.append([ref])
+
+        out: List[str] = []
+        urls: List[str] = []
+        at = 0
+        for run in runs:
+            out.append(html[at:run[0].start])
+            if len(run) > 1:
+                bundle = self._make_bundle([r.path for r in run], run[0].kind, assets, bundles, members)
+                url = "/" + bundle.path
+                if run[0].kind == "js":
+                    out.append(f'<script src="{url}"></script>')
+                else:
+                    out.append(f'<link rel="stylesheet" href="{url}" />')
+            else:
+                ref = run[0]
+                url = "/" + assets[ref.path].hashed_path()
+                tag = html[ref.start:ref.end]
+                out.append(_ATTR.sub(lambda m: f'{m.group(1)}="{url}"' if m.group(1).lower() == ref.attr else m.group(0), tag))
+            urls.append(url)
+            at = run[-1].end
+        out.append(html[at:])
+        return "".join(out), urls
+
+    @staticmethod
+    def _bundleable(asset: Asset) -> bool:
+        if not asset.path.endswith(".js"):
+            return True
+        try:
+            return _is_iife(asset.bodies["identity"].decode("utf-8"))
+        except UnicodeDecodeError:
+            return False
+
+    @staticmethod
+    def _make_bundle(paths: List[str], kind: str, assets: Dict[str, Asset], bundles: Dict[str, Asset],
+                     members: Dict[str, List[str]]) -> Asset:
+        parts = []
+        for path in paths:
+            body = assets[path].bodies["identity"].rstrip()
+            if kind == "js":
+                parts.append(b"try {\n" + body + b"\n} catch (e) { setTimeout(() => { throw e; }); }\n")
+            else:
+                parts.append(body + b"\n")
+        data = b"".join(parts)
+        path = f"bundle.{_digest(data)}.{kind}"
+        if path not in bundles:
+            mimetype = "text/javascript" if kind == "js" else "text/css"
+            mtime = max(assets[p].mtime for p in paths)
+            bundles[path] = Asset(path, mimetype, mtime, data, immutable=True)
+            members[path] = list(paths)
+        return bundles[path]
+
+    @staticmethod
+    def _compress(asset: Asset) -> None:
+        data = asset.bodies["identity"]
+        # Keep an encoding only if it saves at least 5 %.
+        packed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(packed) < len(data) * 0.95:
+            asset.bodies["gzip"] = packed
+        if brotli is not None:
+            packed = brotli.compress(data, quality=11 if len(data) < 1 << 20 else 9)
+            if len(packed) < len(data) * 0.95:
+                asset.bodies["br"] = packed
+
+    def url(self, path: str) -> str:
+        """Content-hashed URL for path ("/online.js" -> "/online.3f2a...js");
+        the plain URL if the cache does not hold it."""
+        asset = self._assets.get(path.lstrip("/"))
+        return "/" + (asset.hashed_path() if asset is not None else path.lstrip("/"))
+
+    def lookup(self, path: str) -> Tuple[Optional[Asset], bool]:
+        """(asset, whether path named it by its current hash)."""
+        asset = self._assets.get(path)
+        if asset is not None:
+            return asset, asset.immutable
+        m = _HASHED.match(path)
+        if m is None:
+            return None, False
+        asset = self._assets.get(m.group("stem") + (m.group("ext") or ""))
+        if asset is None:
+            return None, False
+        # An outdated hash still gets the current file, just not for keeps.
+        return asset, asset.digest == m.group("digest")
+
+    def _encoding(self, asset: Asset) -> str:
+        if len(asset.bodies) == 1 or request.range is not None:
+            return "identity"  # ranges are served from the plain file
+        accepted = request.accept_encodings
+        best, best_q = "identity", 0.0
+        for encoding in ("br", "gzip"):
+            q = accepted[encoding]
+            if encoding in asset.bodies and q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def response(self, path: str) -> Optional[Response]:
+        """Response for the current request of path, or None if not cached."""
+        asset, immutable = self.lookup(path)
+        if asset is None:
+            with self._lock:
+                self._counts["misses"] += 1
+            return None
+        encoding = self._encoding(asset)
+        body = asset.bodies[encoding]
+        resp = Response(body, mimetype=asset.mimetype)
+        resp.set_etag(asset.etag(encoding))
+        resp.last_modified = asset.mtime
+        resp.cache_control.public = True
+        if immutable:
+            resp.cache_control.max_age = IMMUTABLE_MAX_AGE
+            resp.cache_control.immutable = True
+        else:
+            resp.cache_control.no_cache = True
+        if len(asset.bodies) > 1:
+            resp.vary.add("Accept-Encoding")
+        if encoding != "identity":
+            resp.content_encoding = encoding
+        resp = resp.make_conditional(request, accept_ranges=True, complete_length=len(body))
+        with self._lock:
+            c = self._counts
+            c["hits"] += 1
+            if resp.status_code == 304:
+                c["notModified"] += 1
+            elif resp.status_code == 206:
+                c["partial"] += 1
+            if encoding != "identity" and resp.status_code == 200:
+                c[encoding] += 1
+            if resp.status_code != 304:
+                c["bytesSent"] += resp.content_length or 0
+        return resp
+
+    def manifest(self) -> Dict[str, Dict]:
+        """Hashed path of every asset, the files in each bundle, and the
+        URLs each page loads after rewriting."""
+        return self._manifest
+
+    def stats(self) -> Dict[str, object]:
+        assets = list(self._assets.values())
+        with self._lock:
+            counts = dict(self._counts)
+        return dict(
+            counts,
+            files=len(assets),
+            bytes=sum(len(a.bodies["identity"]) for a in assets),
+            compressedBytes=sum(len(b) for a in assets for e, b in a.bodies.items() if e != "identity"),
+            bundles=len(self._manifest["bundles"]),
+            brotli=brotli is not None,
+            scanSeconds=round(self.scan_seconds, 3),
+        )
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# app.py starts no bot processes and reads assets from disk under test.
+os.environ.setdefault("BOT_WORKERS", "0")
+os.environ.setdefault("ASSET_CACHE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,39 @@
+from caching import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_refused_request_leaves_the_other_bucket_alone():
+    limit = RateLimiter(10, burst=2, clock=Clock())
+    addr, room = ("addr", "203.0.113.7"), ("room", "ABCDEF")
+    assert limit.allow(addr) and limit.allow(addr)
+
+    # The address is empty: refused, and the room keeps its tokens.
+    for _ in range(5):
+        assert not limit.allow_all([addr, room])
+    assert limit.allow(room) and limit.allow(room)
+    assert not limit.allow(room)
+    assert limit.refused == 6
+
+
+def test_allowed_request_takes_a_token_from_every_bucket():
+    limit = RateLimiter(10, burst=1, clock=Clock())
+    assert limit.allow_all([("addr", "a"), ("room", "r")])
+    assert not limit.allow(("addr", "a"))
+    assert not limit.allow(("room", "r"))
+
+
+def test_idle_buckets_are_dropped_once_full_again():
+    clock = Clock()
+    limit = RateLimiter(3, burst=5, clock=clock)
+    for i in range(100):
+        limit.allow(("addr", i))
+    clock.now = 15.0
+    limit.allow("x")
+    assert len(limit) == 1
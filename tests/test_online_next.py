@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+import app
+import online_engine
+from online_state import OnlineRoom
+
+
+@pytest.fixture
+def broadcasts(monkeypatch):
+    sent = []
+    monkeypatch.setattr(app, "_online_broadcast_state", lambda room: sent.append(room.state.phase))
+    return sent
+
+
+@pytest.fixture
+def room():
+    return OnlineRoom("NEXTAA", app._online_new_game_state(4, "Ada", 3), seed=7, started_at=time.time())
+
+
+def _to_bidding(room):
+    st = room.state
+    online_engine.start_game(st, [0])
+    online_engine.start_round(st, 0, room.deal_rng(0), time.time())
+    online_engine.finish_deal(st)
+    assert st.phase == "bidding"
+
+
+def test_next_in_lobby_is_not_journaled(room, broadcasts):
+    app._online_next(room)
+
+    assert room.journal == []
+    assert broadcasts == []
+    assert room.state.phase == "lobby"
+
+
+def test_next_while_bidding_is_not_journaled(room, broadcasts):
+    _to_bidding(room)
+    journal = len(room.journal)
+    bids = list(room.state.bids)
+
+    for _ in range(3):
+        app._online_next(room)
+
+    assert len(room.journal) == journal
+    assert broadcasts == []
+    assert list(room.state.bids) == bids
+
+
+def test_next_after_a_round_deals_the_next(room, broadcasts):
+    _to_bidding(room)
+    room.state.phase = "round_finished"
+
+    app._online_next(room)
+
+    assert [entry[1] for entry in room.journal] == ["next"]
+    assert room.state.round_index == 1
+    assert broadcasts == [room.state.phase]